@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the throughput of concurrent execution state requests.
+
+Start a deployer with the ``slow`` engine of :mod:`slow_engine`, then run:
+
+.. code-block:: console
+
+   $ python benchmarks/concurrency.py --url http://localhost:5000 \
+       --concurrency 64 --requests 2000
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+
+import requests
+from jose import jwt
+
+DEFAULT_ISSUER = 'http://localhost:8080/auth/realms/Renga'
+
+
+def auth_header(issuer):
+    """Return a bearer token accepted when signatures are not verified."""
+    token = jwt.encode({'iss': issuer, 'sub': 'benchmark'}, 'benchmark',
+                       algorithm='HS256')
+    return {'Authorization': 'Bearer {0}'.format(token)}
+
+
+def setup(url, headers, engine):
+    """Create a context and launch one execution."""
+    context = requests.post(
+        url + '/v1/contexts', json={'image': 'hello-world'},
+        headers=headers).json()
+    execution = requests.post(
+        url + '/v1/contexts/{0}/executions'.format(context['identifier']),
+        json={'engine': engine}, headers=headers).json()
+    return '{0}/v1/contexts/{1}/executions/{2}'.format(
+        url, context['identifier'], execution['identifier'])
+
+
+def run(target, headers, concurrency, total):
+    """Issue ``total`` GET requests from ``concurrency`` threads."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+
+            start = time.perf_counter()
+            try:
+                status = requests.get(target, headers=headers).status_code
+            except requests.RequestException as error:
+                status = type(error).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': dict(Counter(str(error) for error in errors)),
+        'seconds': round(duration, 3),
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(
+            latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--engine', default='slow')
+    parser.add_argument('--issuer', default=DEFAULT_ISSUER)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    headers = auth_header(args.issuer)
+    target = setup(args.url.rstrip('/'), headers, args.engine)
+    print(json.dumps(
+        run(target, headers, args.concurrency, args.requests),
+        sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare marshmallow and the precompiled dumpers on execution listings.
+
+Executions of a few contexts are built in memory and dumped with
+``ExecutionSchema(many=True)`` then encoded like connexion does, and with
+the :class:`~renga_deployer.dumper.Dumper` of the same schema:
+
+.. code-block:: console
+
+   $ python benchmarks/serialization.py --executions 500 --runs 20
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from flask import json as flask_json
+
+from renga_deployer.app import create_app
+from renga_deployer.dumper import dumper, dumps
+from renga_deployer.models import Context, Execution, ExecutionStates
+from renga_deployer.serializers import ExecutionSchema
+
+
+def executions(count):
+    """Return exited executions of ten contexts."""
+    now = datetime.utcnow()
+    contexts = [
+        Context(id=uuid.uuid4(), created=now, updated=now, spec={
+            'image': 'renga/notebook',
+            'ports': ['8888'],
+            'labels': ['renga.notebook.token={0}'.format(i)],
+        }) for i in range(10)
+    ]
+    return [
+        Execution(
+            id=uuid.uuid4(), context=contexts[i % 10], engine='docker',
+            engine_id=uuid.uuid4().hex, namespace='default',
+            environment={'RENGA_CONTEXT_ID': str(contexts[i % 10].id)},
+            state=ExecutionStates.EXITED.value, created=now, updated=now)
+        for i in range(count)
+    ]
+
+
+def measure(function, runs):
+    """Return the median duration of a function in milliseconds."""
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return round(statistics.median(durations) * 1000, 2)
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--executions', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(SQLALCHEMY_DATABASE_URI='sqlite://',
+                     DEPLOYER_CREATE_DB=False)
+    schema = ExecutionSchema(many=True, context={'state': 'cached'})
+    objects = executions(args.executions)
+
+    with app.app_context():
+        assert dumper(schema).dump(objects) == schema.dump(objects).data
+        results = {
+            'marshmallow_ms': measure(
+                lambda: flask_json.dumps(schema.dump(objects).data,
+                                         indent=2), args.runs),
+            'dumper_ms': measure(
+                lambda: dumps(dumper(schema).dump(objects)), args.runs),
+        }
+
+    print(json.dumps(results, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
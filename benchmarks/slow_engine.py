@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Engine simulating the I/O latency of Docker or Kubernetes.
+
+Import it in the workers of one of the uWSGI profiles to register the
+``slow`` engine, e.g.:
+
+.. code-block:: console
+
+   $ uwsgi docker/uwsgi/uwsgi-gevent.ini \
+       --pythonpath benchmarks --import slow_engine
+
+``BENCHMARK_ENGINE_LATENCY`` sets the seconds spent in every engine call.
+"""
+
+import os
+import time
+import uuid
+
+from renga_deployer.deployer import Deployer
+from renga_deployer.engines import Engine
+from renga_deployer.models import ExecutionStates
+
+LATENCY = float(os.environ.get('BENCHMARK_ENGINE_LATENCY', 0.05))
+
+
+class SlowEngine(Engine):
+    """Engine waiting like a remote Docker or Kubernetes API would."""
+
+    def launch(self, execution, **kwargs):
+        """Pretend to start a container."""
+        time.sleep(LATENCY)
+        execution.engine_id = uuid.uuid4().hex
+        return execution
+
+    def stop(self, execution, remove=False):
+        """Pretend to stop a container."""
+        time.sleep(LATENCY)
+        return execution
+
+    def get_state(self, execution):
+        """Pretend to inspect a container."""
+        time.sleep(LATENCY)
+        return ExecutionStates.RUNNING
+
+    def get_logs(self, execution):
+        """Pretend to fetch the logs."""
+        time.sleep(LATENCY)
+        return ''
+
+
+Deployer.ENGINES['slow'] = SlowEngine
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measure the time a worker needs to load the WSGI application.
+
+Every run imports :mod:`renga_deployer.wsgi` in a fresh interpreter:
+
+.. code-block:: console
+
+   $ python benchmarks/startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+import renga_deployer.app
+imported = time.perf_counter()
+import renga_deployer.wsgi
+print(imported - start, time.perf_counter() - imported)
+"""
+
+MODES = {
+    'default': {},
+    'production': {
+        'DEPLOYER_CREATE_DB': 'False',
+        'DEPLOYER_SPEC_CACHE': '{directory}/spec',
+    },
+}
+"""Configurations compared by the benchmark."""
+
+
+def measure(environment, runs):
+    """Return the median import and creation times in milliseconds."""
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', SCRIPT], env=environment,
+            stderr=subprocess.DEVNULL)
+        times.append([float(value) for value in output.split()])
+
+    imports, creations = zip(*times)
+    return {
+        'import_ms': round(statistics.median(imports) * 1000, 1),
+        'create_app_ms': round(statistics.median(creations) * 1000, 1),
+    }
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    results = {}
+    for mode, variables in sorted(MODES.items()):
+        environment = dict(
+            os.environ,
+            SQLALCHEMY_DATABASE_URI='sqlite:///{0}/startup.db'.format(
+                directory),
+            RENGA_LOGGING_ASYNC='False')
+        environment.update({
+            key: value.format(directory=directory)
+            for key, value in variables.items()
+        })
+        # create the database and warm the specification cache
+        subprocess.check_call(
+            [sys.executable, '-c', 'import renga_deployer.wsgi'],
+            env=dict(environment, DEPLOYER_CREATE_DB='True'),
+            stderr=subprocess.DEVNULL)
+        results[mode] = measure(environment, args.runs)
+
+    print(json.dumps(results, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,4 +6,14 @@ if [ ! -d "renga_deployer.egg-info" ]; then
     pip install -e .[all] > /dev/null 2>&1
 fi
 
+# The database is created and upgraded once before the uWSGI workers
+# start. Neither the application loaded by the command nor the workers
+# upgrade it again.
+case "$1" in
+    uwsgi)
+        DEPLOYER_CREATE_DB=False flask deployer initdb || exit 1
+        export DEPLOYER_CREATE_DB=False
+        ;;
+esac
+
 exec $@
@@ -24,31 +24,73 @@ from flask import current_app, request
 from werkzeug.exceptions import BadRequest
 
 from renga_deployer.authorization import check_token
+from renga_deployer.dumper import dumper
 from renga_deployer.ext import current_deployer
 from renga_deployer.models import Context
-from renga_deployer.serializers import ContextSchema
-from renga_deployer.utils import validate_uuid_args
+from renga_deployer.serializers import ContextSchema, SpecificationSchema, \
+    conditional_dump, json_response, sparse_schema
+from renga_deployer.transfer import stream, wants_ndjson
+from renga_deployer.utils import unique_uuids, validate_uuid_args
 
 context_schema = ContextSchema()
-contexts_schema = ContextSchema(many=True)
+specification_schema = SpecificationSchema()
 
 
 @check_token('deployer:contexts_read')
-def search():
-    """Return a listing of currently known contexts."""
-    return contexts_schema.dump(Context.query.all()).data, 200
+def search(label=None, fields=None):
+    """Return a listing of currently known contexts.
+
+    :param label: label selectors that all have to match, e.g.
+                  ``key=value``, ``key in (a,b)`` or ``!key``
+    :param fields: names of the returned fields
+    """
+    query = Context.query
+    if label:
+        try:
+            query = query.filter(Context.label_filter(label))
+        except ValueError as error:
+            raise BadRequest(str(error))
+    if wants_ndjson():
+        return stream(sparse_schema(ContextSchema, fields=fields), query)
+    return conditional_dump(
+        sparse_schema(ContextSchema, many=True, fields=fields), query.all())
+
+
+@check_token('deployer:contexts_read')
+def batch(data, fields=None):
+    """Return many contexts at once with the identifiers not found."""
+    ids = unique_uuids(data['ids'])
+    contexts = {
+        context.id: context
+        for context in Context.query.filter(Context.id.in_(ids))
+    }
+    schema = sparse_schema(ContextSchema, many=True, fields=fields)
+    result = dumper(schema).dump(
+        [contexts[id] for id in ids if id in contexts])
+    result['not_found'] = [str(id) for id in ids if id not in contexts]
+    return json_response(result)
 
 
 @check_token('deployer:contexts_read')
 @validate_uuid_args('context_id')
-def get(context_id):
+def get(context_id, fields=None):
     """Return information about a specific context."""
     context = Context.query.get_or_404(context_id)
-    return context_schema.dump(context).data, 200
+    return conditional_dump(
+        sparse_schema(ContextSchema, fields=fields), context)
 
 
 @check_token('deployer:contexts_read', 'deployer:contexts_write')
 def post(spec):
     """Create a new context."""
+    errors = specification_schema.validate(spec)
+    if errors:
+        raise BadRequest('Invalid specification: {0}'.format(
+            json.dumps(errors, sort_keys=True)))
+
+    if current_app.config['DEPLOYER_DEDUPLICATE_CONTEXTS']:
+        context, created = current_deployer.deployer.get_or_create(spec)
+        return context_schema.dump(context).data, 201 if created else 200
+
     context = current_deployer.deployer.create(spec)
     return context_schema.dump(context).data, 201
@@ -17,31 +17,56 @@
 # limitations under the License.
 """Implement ``/contexts/{context_id}/executions/{execution_id}`` endpoint."""
 
+from flask import current_app
+
 from renga_deployer.authorization import check_token
 from renga_deployer.ext import current_deployer
-from renga_deployer.models import Context, Execution
-from renga_deployer.serializers import ExecutionSchema
+from renga_deployer.models import Context, Execution, ExecutionStates, db
+from renga_deployer.serializers import ExecutionSchema, conditional_dump, \
+    sparse_schema
+from renga_deployer.transfer import stream, wants_ndjson
 from renga_deployer.utils import validate_uuid_args
 
 execution_schema = ExecutionSchema()
-executions_schema = ExecutionSchema(many=True)
 
 
 @check_token('deployer:contexts_read', 'deployer:executions_read')
 @validate_uuid_args('context_id')
-def search(context_id):
+def search(context_id, fields=None, state='live'):
     """Return currently stored ``Executions`` of a given context."""
-    return executions_schema.dump(
-        Execution.query.filter_by(context_id=context_id).all()).data, 200
+    query = Execution.query.filter_by(context_id=context_id)
+    if wants_ndjson():
+        return stream(
+            sparse_schema(ExecutionSchema, fields=fields,
+                          state='cached' if state == 'live' else state),
+            query)
+    return conditional_dump(
+        sparse_schema(ExecutionSchema, many=True, fields=fields, state=state),
+        query.all())
 
 
 @check_token('deployer:contexts_read', 'deployer:executions_read')
 @validate_uuid_args('context_id', 'execution_id')
-def get(context_id, execution_id):
-    """Return information about a specific ``Execution``."""
+def get(context_id, execution_id, wait_for=None, timeout=30, fields=None,
+        state='live'):
+    """Return information about a specific ``Execution``.
+
+    With ``wait_for`` the request is held until the execution reaches the
+    state, exits or ``timeout`` seconds have passed.
+    """
     execution = Execution.query.get_or_404(execution_id)
     assert str(execution.context_id) == context_id
-    return execution_schema.dump(execution).data, 200
+
+    if wait_for and current_deployer.deployer.get_state(execution).value \
+            not in (wait_for, ExecutionStates.EXITED.value):
+        # do not keep a database connection while waiting
+        db.session.close()
+        current_app.extensions['renga-deployer-watcher'].wait(
+            execution_id, wait_for, timeout)
+        execution = Execution.query.get_or_404(execution_id)
+
+    return conditional_dump(
+        sparse_schema(ExecutionSchema, fields=fields, state=state), execution)
 
 
 @check_token('deployer:contexts_read', 'deployer:executions_write')
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Implement ``/contexts/{context_id}/webhooks`` endpoint."""
+
+import json
+
+from flask import current_app
+from werkzeug.exceptions import BadRequest, NotFound
+
+from renga_deployer.authorization import check_token
+from renga_deployer.models import Context, Execution, Webhook, db
+from renga_deployer.serializers import WebhookSchema
+from renga_deployer.utils import validate_uuid_args
+
+webhook_schema = WebhookSchema()
+webhooks_schema = WebhookSchema(many=True)
+
+
+def _create(data, **kwargs):
+    """Store a webhook and watch the executions it is notified of."""
+    webhook, errors = webhook_schema.load(data)
+    if errors:
+        raise BadRequest('Invalid webhook: {0}'.format(
+            json.dumps(errors, sort_keys=True)))
+
+    for key, value in kwargs.items():
+        setattr(webhook, key, value)
+    db.session.add(webhook)
+    db.session.commit()
+
+    current_app.extensions['renga-deployer-webhooks'].resume()
+    return webhook_schema.dump(webhook).data, 201
+
+
+@check_token('deployer:contexts_read')
+@validate_uuid_args('context_id')
+def search(context_id):
+    """Return the webhooks of a context and its executions."""
+    Context.query.get_or_404(context_id)
+    webhooks = Webhook.query.outerjoin(Webhook.execution).filter(
+        db.or_(Webhook.context_id == context_id,
+               Execution.context_id == context_id))
+    return webhooks_schema.dump(webhooks.all()).data
+
+
+@check_token('deployer:contexts_read', 'deployer:contexts_write')
+@validate_uuid_args('context_id')
+def post(context_id, data):
+    """Notify a URL of the events of all executions of a context."""
+    context = Context.query.get_or_404(context_id)
+    return _create(data, context=context)
+
+
+@check_token('deployer:executions_read', 'deployer:executions_write')
+@validate_uuid_args('context_id', 'execution_id')
+def post_execution(context_id, execution_id, data):
+    """Notify a URL of the events of an execution."""
+    execution = Execution.query.get_or_404(execution_id)
+    if str(execution.context_id) != context_id:
+        raise NotFound('Execution not found.')
+    return _create(data, execution=execution)
+
+
+def _find(context_id, webhook_id):
+    """Return a webhook of a context or of one of its executions."""
+    webhook = Webhook.query.get_or_404(webhook_id)
+    owner = webhook.context_id if webhook.execution is None else \
+        webhook.execution.context_id
+    if str(owner) != context_id:
+        raise NotFound('Webhook not found.')
+    return webhook
+
+
+@check_token('deployer:contexts_read')
+@validate_uuid_args('context_id', 'webhook_id')
+def get(context_id, webhook_id):
+    """Return a webhook."""
+    return webhook_schema.dump(_find(context_id, webhook_id)).data
+
+
+@check_token('deployer:contexts_write')
+@validate_uuid_args('context_id', 'webhook_id')
+def delete(context_id, webhook_id):
+    """Stop notifying a webhook."""
+    webhook = _find(context_id, webhook_id)
+    db.session.delete(webhook)
+    db.session.commit()
+    return webhook_schema.dump(webhook).data
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Implement ``/events`` endpoint."""
+
+import uuid
+from functools import partial
+
+from flask import Response, current_app, request
+from werkzeug.exceptions import BadRequest
+
+from renga_deployer.authorization import check_token
+
+
+@check_token('deployer:contexts_read', 'deployer:executions_read')
+def search(context_id=None, execution_id=None):
+    """Stream execution events of a context, an execution or all of them."""
+    try:
+        context_id = uuid.UUID(context_id) if context_id else None
+        execution_id = uuid.UUID(execution_id) if execution_id else None
+    except ValueError:
+        raise BadRequest('Invalid context or execution identifier.')
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            raise BadRequest('Invalid Last-Event-ID.')
+
+    events = current_app.extensions['renga-deployer-events']
+    subscription = events.subscribe(
+        context_id=context_id,
+        execution_id=execution_id,
+        last_event_id=last_event_id)
+    response = Response(
+        iter(subscription),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+    # streams closed before they started do not run their cleanup
+    response.call_on_close(partial(events.unsubscribe, subscription))
+    return response
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Implement ``/executions`` endpoint."""
+
+from werkzeug.exceptions import BadRequest
+
+from renga_deployer.authorization import check_token
+from renga_deployer.dumper import dumper
+from renga_deployer.models import Context, Execution
+from renga_deployer.serializers import ExecutionSchema, conditional_dump, \
+    json_response, refresh_states, sparse_schema
+from renga_deployer.transfer import stream, wants_ndjson
+from renga_deployer.utils import unique_uuids
+
+
+@check_token('deployer:contexts_read', 'deployer:executions_read')
+def search(label=None, fields=None, state='live'):
+    """Return executions of all contexts matching the label selectors."""
+    query = Execution.query
+    if label:
+        try:
+            query = query.join(Context).filter(Context.label_filter(label))
+        except ValueError as error:
+            raise BadRequest(str(error))
+    if wants_ndjson():
+        return stream(
+            sparse_schema(ExecutionSchema, fields=fields,
+                          state='cached' if state == 'live' else state),
+            query)
+    return conditional_dump(
+        sparse_schema(ExecutionSchema, many=True, fields=fields, state=state),
+        query.all())
+
+
+@check_token('deployer:contexts_read', 'deployer:executions_read')
+def batch(data, fields=None, state='live'):
+    """Return many executions at once with the identifiers not found.
+
+    The live states are read with one request per engine.
+    """
+    ids = unique_uuids(data['ids'])
+    executions = {
+        execution.id: execution
+        for execution in Execution.query.filter(Execution.id.in_(ids))
+    }
+    found = [executions[id] for id in ids if id in executions]
+
+    schema = refresh_states(
+        sparse_schema(ExecutionSchema, many=True, fields=fields, state=state),
+        found)
+
+    result = dumper(schema).dump(found)
+    result['not_found'] = [str(id) for id in ids if id not in executions]
+    return json_response(result)
@@ -17,30 +17,92 @@
 # limitations under the License.
 """Renga Deployer application."""
 
+import hashlib
+import json
 import os
-import sys
 from urllib.parse import urlparse
 
 import connexion
-import pkg_resources
+import jinja2
+import yaml
+from connexion.apis.flask_api import FlaskApi
 from connexion.resolver import RestyResolver
-from flask import jsonify, request
 from flask_babelex import Babel
-from jose import jwt
 from sqlalchemy_utils import functions
 
-from . import config, logging
+from . import cli, config, logging
+from .events import EventStream
 from .ext import RengaDeployer
 from .models import db
-
-try:
-    pkg_resources.get_distribution('raven')
-    from raven.contrib.flask import Sentry
-except pkg_resources.DistributionNotFound:  # pragma: no cover
-    Sentry = None
+from .watcher import StateWatcher
+from .webhooks import WebhookDispatcher
 
 logger = logging.getLogger('renga.deployer.app')
 
+SPECIFICATION = os.path.join(
+    os.path.dirname(__file__), 'schemas', 'renga-deployer-v1.yaml')
+"""OpenAPI specification template of the deployer API."""
+
+
+class PrevalidatedApi(FlaskApi):
+    """Connexion API trusting a specification validated before caching."""
+
+    def _validate_spec(self, spec):
+        """Skip the validation."""
+
+
+def add_api(api):
+    """Add the deployer API, reusing a cached specification if configured.
+
+    The specification is validated when it is first written to
+    ``DEPLOYER_SPEC_CACHE``, so that workers can skip the validation.
+    """
+    with open(SPECIFICATION) as template:
+        rendered = jinja2.Template(template.read()).render(**api.app.config)
+
+    path = None
+    if api.app.config['DEPLOYER_SPEC_CACHE']:
+        path = os.path.join(
+            api.app.config['DEPLOYER_SPEC_CACHE'],
+            'renga-deployer-v1-{0}.json'.format(
+                hashlib.sha256(rendered.encode('utf-8')).hexdigest()[:16]))
+
+    if path and os.path.exists(path):
+        with open(path) as cached:
+            specification = json.load(cached)
+        api.api_cls = PrevalidatedApi
+    else:
+        specification = yaml.safe_load(rendered)
+    serialized = json.dumps(specification)
+
+    api.add_api(
+        specification,
+        arguments=api.app.config,
+        resolver=RestyResolver('renga_deployer.api'),
+        swagger_ui=api.app.config['DEPLOYER_SWAGGER_UI'],
+    )  # validate_responses=True)
+
+    if path and api.api_cls is not PrevalidatedApi:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{0}.{1}'.format(path, os.getpid())
+        with open(tmp, 'w') as output:
+            output.write(serialized)
+        os.rename(tmp, path)
+        logger.debug('Specification cached in {0}.'.format(path))
+
+
+def init_db(app):
+    """Create the database and upgrade its schema."""
+    from .migrations import upgrade
+
+    with app.app_context():
+        if not functions.database_exists(db.engine.url):
+            functions.create_database(db.engine.url)
+            logger.debug('Database created.')
+
+        upgrade()
+        logger.debug('Database initialized.')
+
 
 def create_app(**kwargs):
     """Create an instance of the flask app."""
@@ -56,21 +118,41 @@ def create_app(**kwargs):
     api.app.config.setdefault('DEPLOYER_SCHEME', deployer_url.scheme)
 
     # Setup Sentry service:
-    if Sentry and api.app.config['SENTRY_DSN']:  # pragma: no cover
-        Sentry(api.app, dsn=api.app.config['SENTRY_DSN'])
+    if api.app.config['SENTRY_DSN']:  # pragma: no cover
+        try:
+            from raven.contrib.flask import Sentry
+        except ImportError:
+            logger.warning('Install raven to report errors to Sentry.')
+        else:
+            Sentry(api.app, dsn=api.app.config['SENTRY_DSN'])
 
-    api.add_api(
-        'renga-deployer-v1.yaml',
-        arguments=api.app.config,
-        resolver=RestyResolver('renga_deployer.api'),
-        swagger_ui=api.app.config['DEPLOYER_SWAGGER_UI'],
-    )  # validate_responses=True)
+    add_api(api)
 
     Babel(api.app)
     db.init_app(api.app)
     RengaDeployer(api.app)
+    StateWatcher(api.app)
+    EventStream(api.app)
+    WebhookDispatcher(api.app)
+    api.app.cli.add_command(cli.deployer)
 
     # add extensions
+    if api.app.config['DEPLOYER_METRICS']:
+        from .metrics import Metrics
+        Metrics(api.app)
+
+    if api.app.config['DEPLOYER_TRACING']:
+        from .tracing import Tracing
+        Tracing(api.app)
+
+    if api.app.config['DEPLOYER_COMPRESS']:
+        from .compression import Compression
+        Compression(api.app)
+
+    if api.app.config['DEPLOYER_PROFILING']:
+        from .profiling import Profiling
+        Profiling(api.app)
+
     if api.app.config['KNOWLEDGE_GRAPH_URL']:
         from .contrib.knowledge_graph import KnowledgeGraphSync
         KnowledgeGraphSync(api.app)
@@ -85,15 +167,12 @@ def create_app(**kwargs):
             api.app.wsgi_app, num_proxies=api.app.config['WSGI_NUM_PROXIES'])
 
     # setup logging
-    logging.setup_logging(api.app.config['RENGA_LOGGING_CONFIG'])
+    logging.setup_logging(
+        api.app.config['RENGA_LOGGING_CONFIG'],
+        use_queue=api.app.config['RENGA_LOGGING_ASYNC'])
 
     # create database and tables
-    with api.app.app_context():
-        if not functions.database_exists(db.engine.url):
-            functions.create_database(db.engine.url)
-            logger.debug('Database created.')
-
-        db.create_all()
-        logger.debug('Database initialized.')
+    if api.app.config['DEPLOYER_CREATE_DB']:
+        init_db(api.app)
 
     return api.app
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Deployer ASGI application.
+
+Serve the same OpenAPI specification as :mod:`renga_deployer.wsgi` with an
+ASGI server, e.g.::
+
+    $ pip install renga-deployer[asgi] uvicorn
+    $ uvicorn renga_deployer.asgi:application
+
+Requests are handled by the WSGI application in a thread pool, except the
+execution logs which are read with the :mod:`~renga_deployer.async_engines`
+so that slow engines and followed logs (``?follow=true``) do not hold a
+thread each. Logs are compressed like the other responses, followed logs
+chunk by chunk.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import zlib
+from functools import partial
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.http import parse_accept_header
+from werkzeug.test import EnvironBuilder
+
+from .app import create_app
+from .async_engines import AsyncDockerEngine, AsyncK8SEngine
+from .authorization import check_token
+from .compression import compress, compressor, negotiate
+from .models import Execution
+from .utils import validate_uuid_args
+
+logger = logging.getLogger('renga.deployer.asgi')
+
+
+@check_token
+@validate_uuid_args('context_id', 'execution_id')
+def _load_execution(context_id, execution_id):
+    """Load a launched execution together with its context."""
+    execution = Execution.query.get_or_404(execution_id)
+    if str(execution.context_id) != context_id:
+        raise NotFound('Execution not found.')
+    if execution.engine_id is None:
+        raise NotFound('Execution has not been launched yet.')
+    # the attributes stay readable once the session is closed
+    execution.context.spec
+    return execution
+
+
+class ASGIApplication(object):
+    """Serve a deployer application with asyncio engines for the logs."""
+
+    ENGINES = {
+        'docker': AsyncDockerEngine,
+        'k8s': AsyncK8SEngine,
+    }
+
+    def __init__(self, app):
+        """Wrap a Flask application."""
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.logs = re.compile(
+            r'^{0}/contexts/(?P<context_id>[^/]+)/executions/'
+            r'(?P<execution_id>[^/]+)/logs$'.format(
+                re.escape(app.config['DEPLOYER_BASE_PATH'])))
+        self._engines = {}
+        self.compress = app.config['DEPLOYER_COMPRESS']
+        self.compress_level = app.config['DEPLOYER_COMPRESS_LEVEL']
+        self.compress_min_size = app.config['DEPLOYER_COMPRESS_MIN_SIZE']
+
+    def engine(self, name):
+        """Return the asyncio engine registered under a name."""
+        if name not in self._engines:
+            if name not in self.ENGINES:
+                raise NotFound(
+                    'Engine {0} does not support asyncio.'.format(name))
+            self._engines[name] = self.ENGINES[name](self.app)
+        return self._engines[name]
+
+    async def __call__(self, scope, receive, send):
+        """Dispatch an ASGI connection."""
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        match = self.logs.match(scope['path'])
+        if scope['type'] == 'http' and scope['method'] == 'GET' and match:
+            return await self.get_logs(scope, send, **match.groupdict())
+
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Close the engine connections on shutdown."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in self._engines.values():
+                    await engine.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def encoding(self, scope):
+        """Return the content coding of the logs accepted by a client."""
+        if not self.compress:
+            return None
+        accept_encoding = b', '.join(
+            value for key, value in scope.get('headers', [])
+            if key.lower() == b'accept-encoding')
+        return negotiate(parse_accept_header(accept_encoding.decode(
+            'latin-1')))
+
+    def _load(self, scope, **kwargs):
+        """Check the request token and load the execution."""
+        builder = EnvironBuilder(
+            path=scope['path'],
+            method=scope['method'],
+            query_string=scope.get('query_string', b'').decode('latin-1'),
+            headers=[(key.decode('latin-1'), value.decode('latin-1'))
+                     for key, value in scope.get('headers', [])])
+        with self.app.request_context(builder.get_environ()):
+            return _load_execution(**kwargs)
+
+    async def get_logs(self, scope, send, context_id, execution_id):
+        """Send the logs of an execution, following them if asked."""
+        follow = re.search(
+            br'(^|&)follow=(true|1)(&|$)', scope.get('query_string', b''))
+        loop = asyncio.get_event_loop()
+        try:
+            execution = await loop.run_in_executor(
+                None, partial(self._load, scope, context_id=context_id,
+                              execution_id=execution_id))
+            engine = self.engine(execution.engine)
+            encoding = self.encoding(scope)
+            if not follow:
+                body = (await engine.get_logs(execution)).encode('utf-8')
+                if encoding and len(body) >= self.compress_min_size:
+                    return await self._send(
+                        send, 200, 'text/plain',
+                        compress(body, encoding, self.compress_level),
+                        encoding=encoding)
+                return await self._send(send, 200, 'text/plain', body)
+
+            chunks = engine.follow_logs(execution).__aiter__()
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            return await self._send(send, 200, 'text/plain', b'')
+        except HTTPException as error:
+            return await self._send_error(send, error)
+
+        headers = [(b'content-type', b'text/plain; charset=utf-8')]
+        stream = None
+        if encoding:
+            # every chunk is flushed so that clients can print it at once
+            stream = compressor(encoding, self.compress_level)
+            headers += [(b'content-encoding', encoding.encode('latin-1')),
+                        (b'vary', b'Accept-Encoding')]
+
+        def encode(chunk):
+            chunk = chunk.encode('utf-8')
+            if stream is None:
+                return chunk
+            return stream.compress(chunk) + stream.flush(zlib.Z_SYNC_FLUSH)
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': headers,
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': encode(first),
+            'more_body': True,
+        })
+        try:
+            async for chunk in chunks:
+                await send({
+                    'type': 'http.response.body',
+                    'body': encode(chunk),
+                    'more_body': True,
+                })
+        except Exception:
+            logger.exception('Following logs of execution {0} failed'.format(
+                execution_id))
+        await send({
+            'type': 'http.response.body',
+            'body': stream.flush() if stream else b'',
+        })
+
+    @staticmethod
+    async def _send(send, status, content_type, body, encoding=None):
+        """Send a complete response."""
+        headers = [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+        ]
+        if encoding:
+            headers += [(b'content-encoding', encoding.encode('latin-1')),
+                        (b'vary', b'Accept-Encoding')]
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers,
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_error(self, send, error):
+        """Send an HTTP error as a problem document like connexion does."""
+        body = json.dumps({
+            'type': 'about:blank',
+            'title': error.name,
+            'status': error.code,
+            'detail': error.description,
+        }).encode('utf-8')
+        await self._send(send, error.code, 'application/problem+json', body)
+
+
+application = ASGIApplication(create_app())
+"""Default ASGI application."""
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Asyncio engines.
+
+The engines read the logs of executions like
+:class:`~renga_deployer.engines.Engine` with coroutines, so that one event
+loop can wait on many slow or followed logs at once. They talk to the
+Docker API over its socket with ``aiohttp`` and to Kubernetes with
+``kubernetes_asyncio``; both are installed by the ``asgi`` extra.
+
+Only the logs are read asynchronously. Launching, stopping and reading the
+state or ports of an execution go through the
+:class:`~renga_deployer.deployer.Deployer`, which stores the results with
+the database session and sends the signals of the scheduler, webhooks and
+event streams. Those calls are short and served by the thread pool of the
+ASGI application, whereas followed logs would hold a thread for as long as
+the execution runs.
+
+Executions are used as plain objects: load them, including their context,
+in a worker thread before passing them to an engine.
+"""
+
+import logging
+import os
+import struct
+
+from werkzeug.exceptions import NotFound
+
+logger = logging.getLogger('renga.deployer.async_engines')
+
+
+class AsyncEngine(object):
+    """Base asyncio engine class."""
+
+    def __init__(self, app):
+        """Create an engine configured by a Flask application."""
+        self.app = app
+
+    async def get_logs(self, execution):
+        """Return the logs of an execution."""
+        raise NotImplementedError
+
+    async def follow_logs(self, execution):
+        """Yield chunks of logs until the execution exits."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def close(self):
+        """Release the connections of the engine."""
+
+
+class AsyncDockerEngine(AsyncEngine):
+    """Read container logs with the Docker API over its socket."""
+
+    def __init__(self, app, base_url=None):
+        """Connect to ``base_url``, by default taken from ``DOCKER_HOST``."""
+        super(AsyncDockerEngine, self).__init__(app)
+        self.base_url = base_url or os.environ.get(
+            'DOCKER_HOST', 'unix:///var/run/docker.sock')
+        self._session = None
+
+    @property
+    def session(self):
+        """Return the HTTP session, creating it in the running loop."""
+        if self._session is None:
+            import aiohttp
+
+            if self.base_url.startswith('unix://'):
+                connector = aiohttp.UnixConnector(
+                    path=self.base_url[len('unix://'):])
+                self._url = 'http://docker'
+            else:
+                connector = aiohttp.TCPConnector()
+                self._url = self.base_url.replace('tcp://', 'http://', 1)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _request(self, method, path, **kwargs):
+        """Send a request to the Docker API."""
+        session = self.session
+        return session.request(method, self._url + path, **kwargs)
+
+    async def _inspect(self, execution):
+        """Inspect the container of an execution."""
+        async with self._request(
+                'GET', '/containers/{0}/json'.format(
+                    execution.engine_id)) as response:
+            if response.status == 404:
+                raise NotFound('Execution container not found.')
+            response.raise_for_status()
+            return await response.json()
+
+    async def _logs(self, execution, follow):
+        """Yield decoded log chunks of a container."""
+        tty = (await self._inspect(execution))['Config'].get('Tty')
+        async with self._request(
+                'GET',
+                '/containers/{0}/logs'.format(execution.engine_id),
+                params={
+                    'stdout': '1',
+                    'stderr': '1',
+                    'follow': '1' if follow else '0'
+                }) as response:
+            if response.status == 404:
+                raise NotFound('Execution container not found.')
+            response.raise_for_status()
+
+            if tty:
+                async for chunk in response.content.iter_any():
+                    yield chunk.decode('utf-8', 'replace')
+                return
+
+            # without a TTY the streams are multiplexed in frames
+            while True:
+                try:
+                    header = await response.content.readexactly(8)
+                except Exception:  # end of stream
+                    return
+                _, size = struct.unpack('>BxxxL', header)
+                data = await response.content.readexactly(size)
+                yield data.decode('utf-8', 'replace')
+
+    async def get_logs(self, execution):
+        """Return the logs of a container."""
+        return ''.join([
+            chunk async for chunk in self._logs(execution, follow=False)
+        ])
+
+    def follow_logs(self, execution):
+        """Yield log chunks of a container until it exits."""
+        return self._logs(execution, follow=True)
+
+    async def close(self):
+        """Close the HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncK8SEngine(AsyncEngine):
+    """Read job pod logs with ``kubernetes_asyncio``."""
+
+    def __init__(self, app):
+        """Create an engine using the local kube configuration."""
+        super(AsyncK8SEngine, self).__init__(app)
+        import kubernetes_asyncio
+        self._kubernetes = kubernetes_asyncio
+        self._api_client = None
+
+    async def api_client(self):
+        """Return the API client, loading the configuration once."""
+        if self._api_client is None:
+            await self._kubernetes.config.load_kube_config()
+            self._api_client = self._kubernetes.client.ApiClient()
+        return self._api_client
+
+    async def _api(self, name):
+        """Return an API group bound to the shared client."""
+        return getattr(self._kubernetes.client, name)(await self.api_client())
+
+    async def _ignore_not_found(self, coroutine):
+        """Await a call, returning ``None`` if the resource is gone."""
+        try:
+            return await coroutine
+        except self._kubernetes.client.rest.ApiException as error:
+            if error.status != 404:
+                raise
+
+    async def _get_pod(self, execution):
+        """Read the pod of an execution, remembering its name."""
+        api = await self._api('CoreV1Api')
+
+        if execution.pod_name:
+            return await self._ignore_not_found(
+                api.read_namespaced_pod(execution.pod_name,
+                                        execution.namespace))
+
+        pods = await api.list_namespaced_pod(
+            execution.namespace,
+            label_selector='controller-uid={}'.format(execution.engine_id))
+        if not pods.items:
+            return None
+
+        execution.pod_name = pods.items[0].metadata.name
+        return pods.items[0]
+
+    async def get_logs(self, execution):
+        """Return the logs of the job pod."""
+        pod = await self._get_pod(execution)
+        if pod is None:
+            raise NotFound('Execution container not found.')
+
+        api = await self._api('CoreV1Api')
+        return await api.read_namespaced_pod_log(pod.metadata.name,
+                                                 execution.namespace)
+
+    async def follow_logs(self, execution):
+        """Yield log chunks of the job pod until it exits."""
+        pod = await self._get_pod(execution)
+        if pod is None:
+            raise NotFound('Execution container not found.')
+
+        api = await self._api('CoreV1Api')
+        response = await api.read_namespaced_pod_log(
+            pod.metadata.name,
+            execution.namespace,
+            follow=True,
+            _preload_content=False)
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk.decode('utf-8', 'replace')
+        finally:
+            response.release()
+
+    async def close(self):
+        """Close the API client."""
+        if self._api_client is not None:
+            await self._api_client.close()
+            self._api_client = None
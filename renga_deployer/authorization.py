@@ -25,6 +25,7 @@ from jose import jwt
 from werkzeug.exceptions import Unauthorized
 
 from renga_deployer.ext import current_deployer
+from renga_deployer.tracing import span
 
 logger = logging.getLogger('renga.deployer.authorization')
 
@@ -44,45 +45,47 @@ def check_token(*scopes):
         @wraps(function)
         def wrapper(*args, **kwargs):
             """Check JWT and scopes."""
-            access_token = getattr(g, 'access_token',
-                                   request.headers.get('Authorization'))
-
-            # verify the token
-            if not access_token or not access_token.lower().startswith(
-                    'bearer '):
-                logger.warn(
-                    'Authorization token not found in headers.',
-                    extra={'g': g,
-                           'request': {
-                               'headers': request.headers
-                           }})
-                raise Unauthorized('Authorization token not found in headers.')
-
-            access_token = access_token[len('bearer '):]
-
-            # verify the token and create the context
-            key = current_app.config['DEPLOYER_JWT_KEY']
-            options = {
-                'verify_signature': key is not None,
-            }
-
-            g.jwt = auth = jwt.decode(
-                access_token,
-                issuer=current_app.config['DEPLOYER_JWT_ISSUER'],
-                key=key,
-                options=options, )
-
-            scope_key = current_app.config['DEPLOYER_TOKEN_SCOPE_KEY']
-            if scope_key and not all(
-                    s in auth.get(scope_key, []) for s in scopes):
-                logger.warn(
-                    'Insufficient scope.',
-                    extra={
-                        'g': g,
-                        'request': {'headers': request.headers},
-                        'scope_key': scope_key
-                    })
-                raise Unauthorized('Insufficient scope.')
+            with span('check_token'):
+                access_token = getattr(g, 'access_token',
+                                       request.headers.get('Authorization'))
+
+                # verify the token
+                if not access_token or not access_token.lower().startswith(
+                        'bearer '):
+                    logger.warn(
+                        'Authorization token not found in headers.',
+                        extra={'g': g,
+                               'request': {
+                                   'headers': request.headers
+                               }})
+                    raise Unauthorized(
+                        'Authorization token not found in headers.')
+
+                access_token = access_token[len('bearer '):]
+
+                # verify the token and create the context
+                key = current_app.config['DEPLOYER_JWT_KEY']
+                options = {
+                    'verify_signature': key is not None,
+                }
+
+                g.jwt = auth = jwt.decode(
+                    access_token,
+                    issuer=current_app.config['DEPLOYER_JWT_ISSUER'],
+                    key=key,
+                    options=options, )
+
+                scope_key = current_app.config['DEPLOYER_TOKEN_SCOPE_KEY']
+                if scope_key and not all(
+                        s in auth.get(scope_key, []) for s in scopes):
+                    logger.warn(
+                        'Insufficient scope.',
+                        extra={
+                            'g': g,
+                            'request': {'headers': request.headers},
+                            'scope_key': scope_key
+                        })
+                    raise Unauthorized('Insufficient scope.')
 
             return function(*args, **kwargs)
 
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Command line interface available as ``flask deployer``."""
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .ext import current_deployer
+
+
+@click.group(cls=AppGroup)
+def deployer():
+    """Manage the Renga deployer."""
+
+
+@deployer.command()
+@click.option(
+    '--engine', '-e', 'engines', multiple=True,
+    help='Engine to collect, defaults to all engines.')
+@click.option(
+    '--grace-period', type=int, default=None,
+    help='Keep resources younger than this number of seconds.')
+@click.option(
+    '--dry-run', is_flag=True, help='Only report orphaned resources.')
+def gc(engines, grace_period, dry_run):
+    """Remove engine resources without an execution."""
+    from .garbage_collection import GarbageCollector
+
+    collector = GarbageCollector(
+        current_deployer.deployer, grace_period=grace_period,
+        dry_run=dry_run)
+
+    for engine, counts in sorted(collector.collect(engines=engines).items()):
+        click.echo('{0}: {1}'.format(engine, ', '.join(
+            '{0}={1}'.format(key, value)
+            for key, value in sorted(counts.items()))))
+
+
+@deployer.command()
+def initdb():
+    """Create the database and upgrade its schema."""
+    from .app import init_db
+
+    init_db(current_app)
+    click.echo('Database initialized.')
+
+
+@deployer.command('export')
+@click.argument('output', type=click.File('w'), default='-')
+def export_(output):
+    """Write all contexts, executions and webhooks as NDJSON."""
+    from .transfer import export_lines
+
+    for line in export_lines():
+        output.write(line)
+
+
+@deployer.command('import')
+@click.argument('input', type=click.File('r'), default='-')
+def import_(input):
+    """Insert the contexts, executions and webhooks of an export."""
+    from .transfer import import_lines
+
+    importer = import_lines(input)
+    click.echo('{0}, skipped={1}'.format(', '.join(
+        '{0}={1}'.format(key, value)
+        for key, value in sorted(importer.counts.items())), importer.skipped))
+
+
+@deployer.group()
+def db():
+    """Manage the database schema."""
+
+
+@db.command()
+@click.argument('revision', default='head')
+@click.option('--sql', is_flag=True, help='Print the SQL statements only.')
+def upgrade(revision, sql):
+    """Upgrade the schema to a revision."""
+    from . import migrations
+
+    migrations.upgrade(revision, sql=sql)
+
+
+@db.command()
+@click.argument('revision')
+@click.option('--sql', is_flag=True, help='Print the SQL statements only.')
+def downgrade(revision, sql):
+    """Downgrade the schema to a revision."""
+    from . import migrations
+
+    migrations.downgrade(revision, sql=sql)
+
+
+@db.command()
+def current():
+    """Show the revision of the schema."""
+    from . import migrations
+
+    click.echo(migrations.current_revision() or 'None')
+
+
+@db.command()
+def history():
+    """List the revisions."""
+    from . import migrations
+
+    migrations.history()
+
+
+@db.command()
+@click.argument('revision')
+def stamp(revision):
+    """Set the revision without running migrations."""
+    from . import migrations
+
+    migrations.stamp(revision)
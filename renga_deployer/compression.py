@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compress responses for clients accepting gzip or deflate.
+
+Responses of the types in ``DEPLOYER_COMPRESS_MIMETYPES`` are compressed
+with the encoding preferred in the ``Accept-Encoding`` header of the
+request, once they are at least ``DEPLOYER_COMPRESS_MIN_SIZE`` bytes
+long. Streamed responses, e.g. NDJSON listings, are compressed chunk by
+chunk. Their output is flushed once ``DEPLOYER_COMPRESS_FLUSH_SIZE`` bytes
+have been compressed or ``DEPLOYER_COMPRESS_FLUSH_INTERVAL`` seconds after
+the previous flush, as each flush ends a deflate block and costs both
+bytes and ratio.
+
+Event streams, when ``text/event-stream`` is added to the media types, are
+only flushed at the end of events, so that clients never wait for the
+rest of an event. Each chunk holds the events available at once and is
+flushed immediately, as the stream may then wait for the next events.
+
+Entity tags of compressed responses are weakened, as the same tag is sent
+for both encodings and conditional requests still match them.
+"""
+
+import logging
+import time
+import zlib
+
+from flask import request
+
+logger = logging.getLogger('renga.deployer.compression')
+
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+"""Window bits of the zlib streams of each content coding."""
+
+
+def negotiate(accept_encoding):
+    """Return the supported encoding preferred by a client, if any.
+
+    >>> from werkzeug.http import parse_accept_header
+    >>> negotiate(parse_accept_header('gzip;q=0.5, deflate'))
+    'deflate'
+    >>> negotiate(parse_accept_header('br, gzip;q=0')) is None
+    True
+    """
+    return accept_encoding.best_match(['gzip', 'deflate'])
+
+
+def compressor(encoding, level):
+    """Return a zlib compressor for a content coding."""
+    return zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+
+
+def compress(data, encoding, level):
+    """Compress a whole body."""
+    stream = compressor(encoding, level)
+    return stream.compress(data) + stream.flush()
+
+
+def compress_chunks(chunks, encoding, level, charset='utf-8', flush_size=0,
+                    flush_interval=None, boundary=None):
+    """Compress an iterable body, flushing the output now and then.
+
+    :param flush_size: compressed bytes after which the output is flushed
+    :param flush_interval: seconds after which the output is flushed
+    :param boundary: flush only after chunks ending with these bytes
+    """
+    stream = compressor(encoding, level)
+    pending = 0
+    flushed = time.time()
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = stream.compress(chunk)
+            pending += len(chunk)
+
+            if boundary is None or chunk.endswith(boundary):
+                now = time.time()
+                if pending >= flush_size or (
+                        flush_interval is not None and
+                        now - flushed >= flush_interval):
+                    data += stream.flush(zlib.Z_SYNC_FLUSH)
+                    pending, flushed = 0, now
+            if data:
+                yield data
+        yield stream.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class Compression(object):
+    """Compress large responses and streams."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.min_size = app.config['DEPLOYER_COMPRESS_MIN_SIZE']
+        self.level = app.config['DEPLOYER_COMPRESS_LEVEL']
+        self.mimetypes = set(app.config['DEPLOYER_COMPRESS_MIMETYPES'])
+        self.flush_size = app.config['DEPLOYER_COMPRESS_FLUSH_SIZE']
+        self.flush_interval = app.config['DEPLOYER_COMPRESS_FLUSH_INTERVAL']
+        app.after_request(self.after_request)
+        app.extensions['renga-deployer-compression'] = self
+        logger.debug('Compression extension started.')
+
+    def after_request(self, response):
+        """Compress the response if the client accepts it."""
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if request.method == 'HEAD' or \
+                response.status_code < 200 or \
+                response.status_code in (204, 206, 304) or \
+                'Content-Encoding' in response.headers:
+            return response
+
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            if response.mimetype == 'text/event-stream':
+                # events wait for the next ones, so every chunk is flushed
+                flush = dict(boundary=b'\n\n')
+            else:
+                flush = dict(flush_size=self.flush_size,
+                             flush_interval=self.flush_interval)
+            response.response = compress_chunks(
+                response.response, encoding, self.level, response.charset,
+                **flush)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(data, encoding, self.level))
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -56,6 +56,12 @@ DEPLOYER_K8S_CONTAINER_IP = None
 DEPLOYER_APP_NAME = 'demo-client'
 """Application name."""
 
+DEPLOYER_INSTANCE_ID = 'renga-deployer'
+"""Identifier of the deployer instance used to label engine resources.
+
+Deployers sharing a database must use the same identifier.
+"""
+
 DEPLOYER_JWT_ISSUER = 'http://localhost:8080/auth/realms/Renga'
 """JWT issuer used for token verification."""
 
@@ -78,9 +84,166 @@ DEPLOYER_TOKEN_SCOPE_KEY = None
 Use 'https://rm.datascience.ch/scope' in combination with resource manager.
 """
 
+DEPLOYER_SCHEDULER_CAPACITY = None
+"""Maximum number of concurrently active executions.
+
+Queued launch requests are admitted by weighted fair share across creators
+whenever capacity frees up. Set to None (default) for unlimited capacity.
+"""
+
+DEPLOYER_SCHEDULER_WEIGHTS = {}
+"""Fair share weights of creators, for example ``{'alice': 2}``.
+
+Creators without an entry have a weight of 1.
+"""
+
+DEPLOYER_SCHEDULER_CLAIM_TIMEOUT = 600
+"""Seconds an admitted or unavailable execution holds its resources.
+
+Admitted executions are claimed until they are launched; claims older than
+this, e.g. of a process that died, are queued again. Executions whose
+engine resources are unavailable for longer, e.g. because they were
+removed, are no longer counted as active.
+"""
+
+DEPLOYER_QUOTA_EXECUTIONS = None
+"""Maximum number of concurrently active executions per creator."""
+
+DEPLOYER_QUOTA_CPU = None
+"""Maximum number of CPU cores requested by active executions per creator."""
+
+DEPLOYER_QUOTA_MEMORY = None
+"""Maximum memory requested by active executions per creator, e.g. '8Gi'."""
+
+DEPLOYER_GC_GRACE_PERIOD = 600
+"""Seconds before an engine resource without execution is collected.
+
+Resources are started before their execution is committed, so younger
+resources may still be in the middle of a launch.
+"""
+
+DEPLOYER_GC_BATCH_SIZE = 500
+"""Number of engine resources checked against the database at once."""
+
+DEPLOYER_METRICS = True
+"""Expose Prometheus metrics on ``/metrics``."""
+
+DEPLOYER_TRACING = False
+"""Record spans of sampled requests."""
+
+DEPLOYER_TRACING_SAMPLE_RATE = 0.01
+"""Fraction of requests traced unless the caller requests sampling."""
+
+DEPLOYER_TRACING_OUTPUT = '-'
+"""File receiving the spans as JSON lines; ``-`` writes to standard output."""
+
+DEPLOYER_TRACING_SERVICE_NAME = 'renga-deployer'
+"""Service name reported in the spans."""
+
+DEPLOYER_PROFILING = False
+"""Allow administrators to profile requests on ``/admin/profiles``.
+
+Tokens need the ``deployer:admin`` scope, so ``DEPLOYER_TOKEN_SCOPE_KEY``
+has to be set as well. ``DEPLOYER_JWT_KEY`` is required too, since tokens
+are not verified without it and anybody could claim the scope.
+"""
+
+DEPLOYER_PROFILING_DIR = None
+"""Directory receiving profiles, defaults to the temporary directory."""
+
+DEPLOYER_PROFILING_MAX_SECONDS = 300
+"""Maximum length of a profiling session."""
+
+DEPLOYER_DEDUPLICATE_CONTEXTS = False
+"""Return the existing context of a creator posting the same specification."""
+
+DEPLOYER_BATCH_LIMIT = 100
+"""Maximum number of identifiers in a batch request."""
+
+DEPLOYER_STREAM_BATCH_SIZE = 1000
+"""Rows read or inserted at once by streamed listings, exports and imports."""
+
+DEPLOYER_COMPRESS = True
+"""Compress responses for clients accepting gzip or deflate."""
+
+DEPLOYER_COMPRESS_MIN_SIZE = 1024
+"""Bytes below which complete responses are sent uncompressed."""
+
+DEPLOYER_COMPRESS_LEVEL = 6
+"""Zlib compression level from 1 (fastest) to 9 (smallest)."""
+
+DEPLOYER_COMPRESS_MIMETYPES = [
+    'application/json',
+    'application/problem+json',
+    'application/x-ndjson',
+    'text/plain',
+]
+"""Media types of the compressed responses."""
+
+DEPLOYER_COMPRESS_FLUSH_SIZE = 64 * 1024
+"""Bytes of a streamed response compressed before they are flushed."""
+
+DEPLOYER_COMPRESS_FLUSH_INTERVAL = 1.0
+"""Seconds after which the compressed output of a stream is flushed."""
+
+DEPLOYER_WATCH_INTERVAL = 1.0
+"""Seconds between state refreshes of executions with waiting requests."""
+
+DEPLOYER_MAX_PARKED_REQUESTS = None
+"""Long-polls and event streams held open at once by a process.
+
+Each of them keeps a worker thread or greenlet busy until it ends, so keep
+the limit below the number of threads of a worker. Requests above it are
+answered with ``503 Service Unavailable`` and a ``Retry-After`` header.
+Set to None (default) for no limit.
+"""
+
+DEPLOYER_EVENTS_BUFFER = 1000
+"""Number of recent events kept to resume streams with ``Last-Event-ID``."""
+
+DEPLOYER_EVENTS_QUEUE_SIZE = 100
+"""Events buffered for a slow subscriber before its stream is closed."""
+
+DEPLOYER_EVENTS_KEEPALIVE = 15
+"""Seconds between keep-alive comments on idle event streams."""
+
+DEPLOYER_WEBHOOK_SECRET = None
+"""Key signing the webhook deliveries without their own secret."""
+
+DEPLOYER_WEBHOOK_QUEUE_SIZE = 1000
+"""Events waiting for delivery before new events are dropped."""
+
+DEPLOYER_WEBHOOK_BATCH_SIZE = 50
+"""Maximum number of events posted in one request."""
+
+DEPLOYER_WEBHOOK_BATCH_DELAY = 0.5
+"""Seconds during which events for the same URL are batched."""
+
+DEPLOYER_WEBHOOK_RETRIES = 5
+"""Retries of a failed delivery before it is given up."""
+
+DEPLOYER_WEBHOOK_BACKOFF = 1.0
+"""Seconds before the first retry, doubled for each next retry."""
+
+DEPLOYER_WEBHOOK_TIMEOUT = 10
+"""Seconds to wait for the response of a webhook."""
+
 DEPLOYER_SWAGGER_UI = False
 """Enable Swagger UI."""
 
+DEPLOYER_SPEC_CACHE = None
+"""Directory caching the rendered OpenAPI specification.
+
+Workers load a cached specification without parsing and validating it.
+"""
+
+DEPLOYER_CREATE_DB = True
+"""Create the database and its tables when the application starts.
+
+Disable it in production and run ``flask deployer initdb`` once per
+deployment instead.
+"""
+
 DEPLOYER_BASE_TEMPLATE = 'renga_deployer/base.html'
 """Default base template for the demo page."""
 
@@ -93,6 +256,9 @@ RENGA_AUTHORIZATION_CLIENT_ID = None
 RENGA_LOGGING_CONFIG = None
 """Logging configuration file path."""
 
+RENGA_LOGGING_ASYNC = True
+"""Emit log records from a background thread."""
+
 SENTRY_DSN = None
 """The default Sentry environment variable key."""
 
@@ -19,19 +19,23 @@
 
 import logging
 import os
+import threading
 import time
 import uuid
 
 import requests
 from flask import abort, current_app, request
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.types import Integer
 from sqlalchemy_utils.types import JSONType, UUIDType
 from werkzeug.exceptions import InternalServerError
 from werkzeug.wrappers import Response
 
-from renga_deployer.deployer import context_created, execution_created, \
-    execution_launched
+from renga_deployer.deployer import context_created, contexts_imported, \
+    execution_created, execution_launched, executions_imported
+from renga_deployer.metrics import OUTBOUND_ERRORS, OUTBOUND_LATENCY, timed
 from renga_deployer.models import Context, Execution, db
+from renga_deployer.tracing import inject, span, traced
 from renga_deployer.utils import dict_from_labels, join_url
 
 logger = logging.getLogger('renga.deployer.contrib.knowledge_graph')
@@ -70,9 +74,10 @@ class KnowledgeGraphSync(object):
 
     def __init__(self, app=None):
         """Extension initialization."""
+        self._named_types = None
+        self._lock = threading.Lock()
         if app:
             self.init_app(app)
-        self._named_types = None
 
     def init_app(self, app):
         """Flask application initialization."""
@@ -82,7 +87,9 @@ class KnowledgeGraphSync(object):
 
         # connect signal handlers
         context_created.connect(create_context)
+        contexts_imported.connect(create_contexts)
         execution_created.connect(create_execution)
+        executions_imported.connect(create_executions)
         execution_launched.connect(launch_execution)
 
         logger.debug('Knowledge graph extension started.')
@@ -90,12 +97,20 @@ class KnowledgeGraphSync(object):
     def disconnect(self):
         """Remove signal handlers."""
         context_created.disconnect(create_context)
+        contexts_imported.disconnect(create_contexts)
         execution_created.disconnect(create_execution)
+        executions_imported.disconnect(create_executions)
 
     @property
     def named_types(self):
         """Fetch named types from types service."""
-        if self._named_types is None:
+        if self._named_types is not None:
+            return self._named_types
+
+        with self._lock:
+            if self._named_types is not None:
+                return self._named_types
+
             service_access_token = get_service_access_token(
                 token_url=current_app.config['DEPLOYER_TOKEN_URL'],
                 audience='renga-services',
@@ -107,10 +122,11 @@ class KnowledgeGraphSync(object):
                 'Authorization': 'Bearer {}'.format(service_access_token)
             }
 
-            response = requests.get(
-                join_url(current_app.config['KNOWLEDGE_GRAPH_URL'],
-                         'types/management/named_type'),
-                headers=headers)
+            with span('knowledge_graph.named_types', kind='CLIENT'):
+                response = requests.get(
+                    join_url(current_app.config['KNOWLEDGE_GRAPH_URL'],
+                             'types/management/named_type'),
+                    headers=inject(headers))
             if not 200 <= response.status_code < 300:
                 logger.error('Retrieving types failed.')
                 raise RuntimeError('Retrieving types failed.')
@@ -164,6 +180,7 @@ def create_context(context, service_access_token=None):
         context.spec.setdefault('labels', [])
         context.spec['labels'].insert(
             0, 'renga.execution_context.vertex_id={0}'.format(vertex_id))
+        flag_modified(context, 'spec')
         db.session.add(GraphContext(id=vertex_id, context=context))
     else:
         logger.error('Mutation failed.', extra={'response': response})
@@ -171,6 +188,41 @@ def create_context(context, service_access_token=None):
         raise InternalServerError('Adding vertex and/or edge failed')
 
 
+def create_contexts(rows, service_access_token=None):
+    """Create the nodes of imported contexts with a single mutation."""
+    if service_access_token is None:
+        service_access_token = get_service_access_token(
+            token_url=current_app.config['DEPLOYER_TOKEN_URL'],
+            audience='renga-services',
+            client_id=current_app.config['RENGA_AUTHORIZATION_CLIENT_ID'],
+            client_secret=current_app.config[
+                'RENGA_AUTHORIZATION_CLIENT_SECRET'])
+
+    operations = [
+        vertex_operation(Context(id=row['id'], spec=row['spec']), temp_id=i)
+        for i, row in enumerate(rows)
+    ]
+    response = mutation(
+        operations,
+        wait_for_response=True,
+        service_access_token=service_access_token).json()
+
+    if response['response']['event']['status'] != 'success':
+        logger.error('Mutation failed.', extra={'response': response})
+        raise RuntimeError('Adding vertices failed')
+
+    # the results are in the order of the operations
+    for row, result in zip(rows, response['response']['event']['results']):
+        labels = [
+            label for label in (row['spec'] or {}).get('labels', [])
+            if not label.startswith('renga.execution_context.vertex_id=')
+        ]
+        labels.insert(
+            0, 'renga.execution_context.vertex_id={0}'.format(result['id']))
+        row['spec'] = dict(row['spec'] or {}, labels=labels)
+        db.session.add(GraphContext(id=result['id'], context_id=row['id']))
+
+
 def create_execution(execution, token=None, service_access_token=None):
     """Create execution node and vertex connecting context."""
     token = token or request.headers['Authorization']
@@ -228,6 +280,52 @@ def create_execution(execution, token=None, service_access_token=None):
     })
 
 
+def create_executions(rows, service_access_token=None):
+    """Create the nodes of imported executions with a single mutation."""
+    if service_access_token is None:
+        service_access_token = get_service_access_token(
+            token_url=current_app.config['DEPLOYER_TOKEN_URL'],
+            audience='renga-services',
+            client_id=current_app.config['RENGA_AUTHORIZATION_CLIENT_ID'],
+            client_secret=current_app.config[
+                'RENGA_AUTHORIZATION_CLIENT_SECRET'])
+
+    vertices = dict(
+        db.session.query(GraphContext.context_id, GraphContext.id).filter(
+            GraphContext.context_id.in_({row['context_id']
+                                         for row in rows})))
+    operations = [
+        vertex_operation(Execution(**row), temp_id=i)
+        for i, row in enumerate(rows)
+    ]
+    # the edges follow the vertices so that the results keep their order
+    operations.extend({
+        'type': 'create_edge',
+        'element': {
+            'label': 'deployer:launch',
+            'from': {
+                'type': 'persisted_vertex',
+                'id': vertices[row['context_id']],
+            },
+            'to': {
+                'type': 'new_vertex',
+                'id': i
+            }
+        }
+    } for i, row in enumerate(rows) if row['context_id'] in vertices)
+    response = mutation(
+        operations,
+        wait_for_response=True,
+        service_access_token=service_access_token).json()
+
+    if response['response']['event']['status'] != 'success':
+        logger.error('Mutation failed.', extra={'response': response})
+        raise RuntimeError('Adding vertices failed')
+
+    for row, result in zip(rows, response['response']['event']['results']):
+        db.session.add(GraphExecution(id=result['id'], execution_id=row['id']))
+
+
 def launch_execution(execution, token=None):
     """Update the execution with launch info."""
     pass
@@ -316,6 +414,9 @@ def vertex_operation(obj, temp_id):
     return operation
 
 
+@timed(OUTBOUND_LATENCY, OUTBOUND_ERRORS, service='knowledge_graph',
+       operation='mutation')
+@traced('knowledge_graph.mutation', kind='CLIENT')
 def mutation(operations, wait_for_response=False, service_access_token=None):
     """
     Submit a mutation to the graph.
@@ -325,7 +426,8 @@ def mutation(operations, wait_for_response=False, service_access_token=None):
     """
     knowledge_graph_url = current_app.config['KNOWLEDGE_GRAPH_URL']
 
-    headers = {'Authorization': 'Bearer {}'.format(service_access_token)}
+    headers = inject(
+        {'Authorization': 'Bearer {}'.format(service_access_token)})
 
     response = requests.post(
         join_url(knowledge_graph_url, '/mutation/mutation'),
@@ -353,10 +455,14 @@ def mutation(operations, wait_for_response=False, service_access_token=None):
     return response
 
 
+@timed(OUTBOUND_LATENCY, OUTBOUND_ERRORS, service='authorization',
+       operation='service_access_token')
+@traced('authorization.service_access_token', kind='CLIENT')
 def get_service_access_token(token_url, audience, client_id, client_secret):
     """Retrieve a service access token."""
     r = requests.post(
         token_url,
+        headers=inject(),
         data={
             'audience': audience,
             'client_id': client_id,
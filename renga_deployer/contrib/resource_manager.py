@@ -25,6 +25,8 @@ from flask import current_app, g, request
 from jose import jwt
 from werkzeug.exceptions import Unauthorized
 
+from renga_deployer.metrics import OUTBOUND_ERRORS, OUTBOUND_LATENCY, timed
+from renga_deployer.tracing import inject, traced
 from renga_deployer.utils import join_url
 
 logger = logging.getLogger('renga.deployer.contrib.resource_manager')
@@ -74,6 +76,9 @@ def exchange_token():
     g.access_token = 'Bearer {0}'.format(access_token)
 
 
+@timed(OUTBOUND_LATENCY, OUTBOUND_ERRORS, service='resource_manager',
+       operation='authorization_token')
+@traced('resource_manager.authorization_token', kind='CLIENT')
 def request_authorization_token(headers, resource_request):
     """
     Request resource access token from the ResourceManager.
@@ -84,7 +89,7 @@ def request_authorization_token(headers, resource_request):
     """
     r = requests.post(
         current_app.config['RESOURCE_MANAGER_URL'],
-        headers=headers,
+        headers=inject(headers),
         json=resource_request)
 
     if r.status_code != 200:
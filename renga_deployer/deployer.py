@@ -19,17 +19,29 @@
 
 import logging
 import os
+import threading
+from collections import defaultdict
 
 from blinker import Namespace
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import NotFound
 
 from . import engines
-from .models import Context, Execution, db
+from .metrics import CACHE, DEPLOYER_ERRORS, DEPLOYER_LATENCY, \
+    InstrumentedEngine, timed
+from .models import Context, Execution, ExecutionStates, db
+from .scheduler import Scheduler
 
 deployer_signals = Namespace()
 
 context_created = deployer_signals.signal('context-created')
+contexts_imported = deployer_signals.signal('contexts-imported')
 execution_created = deployer_signals.signal('execution-created')
+executions_imported = deployer_signals.signal('executions-imported')
 execution_launched = deployer_signals.signal('execution-launched')
+execution_state_changed = deployer_signals.signal('execution-state-changed')
+execution_stopped = deployer_signals.signal('execution-stopped')
+execution_failed = deployer_signals.signal('execution-failed')
 
 logger = logging.getLogger('renga.deployer.deployer')
 
@@ -45,6 +57,9 @@ class Deployer(object):
         :param engines: dict of engine name:uri pairs
         """
         self.engines = engines or {}
+        self.scheduler = Scheduler(self)
+        self._instances = {}
+        self._lock = threading.Lock()
 
     @classmethod
     def from_env(cls, prefix='DEPLOYER_'):
@@ -60,6 +75,23 @@ class Deployer(object):
 
         return cls(engines=engines)
 
+    def engine(self, name):
+        """Return the instance of the engine registered under a name.
+
+        Engines keep their API clients, and with them the connection pools,
+        so a single instance is shared by all threads using the deployer.
+        """
+        key = (name, self.ENGINES[name])
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    instance = self._instances[key] = InstrumentedEngine(
+                        name, key[1]())
+        return instance
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='create')
     def create(self, spec):
         """Create a context with a given specification."""
         context = Context.create(spec=spec)
@@ -68,27 +100,201 @@ class Deployer(object):
         db.session.commit()
         return context
 
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='get_or_create')
+    def get_or_create(self, spec):
+        """Return the context of the creator with the same specification.
+
+        A new context is created if none exists. The result is a tuple of
+        the context and whether it has been created.
+        """
+        context = Context.create(spec=spec, deduplicate=True)
+        existing = Context.query.filter_by(
+            spec_hash=context.spec_hash).one_or_none()
+        if existing is not None:
+            return existing, False
+
+        db.session.add(context)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # a concurrent request has created the same context
+            db.session.rollback()
+            return Context.query.filter_by(
+                spec_hash=context.spec_hash).one(), False
+        context_created.send(context)
+        db.session.commit()
+        return context, True
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='launch')
     def launch(self, context=None, engine=None, **kwargs):
-        """Create new execution for a given context."""
+        """Create new execution for a given context.
+
+        When quotas or a capacity are configured, the execution is queued
+        and launched by the :class:`~renga_deployer.scheduler.Scheduler`.
+        """
         execution = Execution.from_context(context, engine=engine, **kwargs)
         db.session.add(execution)
-        execution_created.send(execution)
 
-        execution = self.ENGINES[engine]().launch(execution)
-        execution_launched.send(execution)
+        if self.scheduler.enabled:
+            self.scheduler.submit(execution)
+            execution_created.send(execution)
+            self.scheduler.schedule()
+        else:
+            execution_created.send(execution)
+            self._launch(execution)
 
         db.session.commit()
         return execution
 
+    def _launch(self, execution):
+        """Start an execution on its engine."""
+        execution.state = None
+        execution = self.engine(execution.engine).launch(execution)
+        execution_launched.send(execution)
+        return execution
+
+    @staticmethod
+    def _fail(execution):
+        """Mark an execution that could not be launched as exited."""
+        execution.state = ExecutionStates.EXITED.value
+        execution_failed.send(execution)
+        execution_state_changed.send(execution, state=ExecutionStates.EXITED)
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='stop')
     def stop(self, execution, remove=False):
         """Stop a running execution, optionally removing it from engine."""
-        self.ENGINES[execution.engine]().stop(execution, remove=remove)
+        if execution.engine_id is not None:
+            self.engine(execution.engine).stop(execution, remove=remove)
+        execution.state = ExecutionStates.EXITED.value
+        execution.ports = None
+        execution_stopped.send(execution)
+        execution_state_changed.send(execution, state=ExecutionStates.EXITED)
+
+        if self.scheduler.enabled:
+            self.scheduler.schedule()
+        db.session.commit()
 
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='get_state')
+    def get_state(self, execution):
+        """Ask engine for the state and store it on the execution."""
+        if execution.engine_id is None:
+            return ExecutionStates(
+                execution.state or ExecutionStates.UNAVAILABLE.value)
+
+        previous = execution.state
+        state = self._store_state(
+            execution, self.engine(execution.engine).get_state(execution))
+
+        # engines may have recorded references to their resources
+        if db.session.is_modified(execution):
+            db.session.commit()
+        if state == ExecutionStates.EXITED and \
+                previous != ExecutionStates.EXITED.value:
+            self._release()
+        return state
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='get_states')
+    def get_states(self, executions):
+        """Ask engines for the states of many executions at once."""
+        states = {}
+        launched = defaultdict(list)
+        for execution in executions:
+            if execution.engine_id is None:
+                states[execution.id] = self.get_state(execution)
+            else:
+                launched[execution.engine].append(execution)
+
+        exited = False
+        for engine, group in launched.items():
+            engine_states = self.engine(engine).get_states(group)
+            for execution in group:
+                previous = execution.state
+                states[execution.id] = self._store_state(
+                    execution, engine_states[execution.id])
+                exited |= states[execution.id] == ExecutionStates.EXITED \
+                    and previous != ExecutionStates.EXITED.value
+
+        if any(
+                db.session.is_modified(execution)
+                for group in launched.values() for execution in group):
+            db.session.commit()
+        if exited:
+            self._release()
+        return states
+
+    def _release(self):
+        """Admit queued executions in place of exited ones."""
+        if self.scheduler.enabled:
+            self.scheduler.schedule()
+
+    @staticmethod
+    def _store_state(execution, state):
+        """Store the state reported by an engine on the execution."""
+        # a removed engine resource does not bring an execution back
+        if execution.state == ExecutionStates.EXITED.value and \
+                state == ExecutionStates.UNAVAILABLE:
+            return ExecutionStates.EXITED
+
+        # assigning an unchanged state would still bump ``updated``
+        if execution.state != state.value:
+            # port bindings are only valid for the state they were read in
+            execution.ports = None
+            execution.state = state.value
+            execution_state_changed.send(execution, state=state)
+        return state
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='get_logs')
     def get_logs(self, execution):
         """Ask engine to extract logs."""
+        if execution.engine_id is None:
+            raise NotFound('Execution has not been launched yet.')
         # FIXME use configuration
-        return self.ENGINES[execution.engine]().get_logs(execution)
+        return self.engine(execution.engine).get_logs(execution)
 
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS, operation='get_host_ports')
     def get_host_ports(self, execution):
-        """Fetch hostname and ports for the running execution."""
-        return self.ENGINES[execution.engine]().get_host_ports(execution)
+        """Fetch hostname and ports for the running execution.
+
+        Bindings are stored once the execution is running and served from
+        the database until its state changes.
+        """
+        if execution.engine_id is None:
+            return {'ports': []}
+
+        if execution.ports is not None and \
+                execution.state == ExecutionStates.RUNNING.value:
+            CACHE.labels(cache='ports', result='hit').inc()
+            return {'ports': execution.ports}
+
+        CACHE.labels(cache='ports', result='miss').inc()
+
+        host_ports = self.engine(execution.engine).get_host_ports(
+            execution)
+
+        # engines only report bindings of running executions; an ingress
+        # may still be waiting for its address
+        if host_ports['ports'] and all(
+                binding.get('host') for binding in host_ports['ports']):
+            # a new state clears the bindings, so they are stored after it
+            self._store_state(execution, ExecutionStates.RUNNING)
+            execution.ports = host_ports['ports']
+            db.session.commit()
+
+        return host_ports
+
+    @timed(DEPLOYER_LATENCY, DEPLOYER_ERRORS,
+           operation='get_execution_environment')
+    def get_execution_environment(self, execution):
+        """Return the environment of the execution container.
+
+        The environment does not change once the container is created, so
+        the engine is asked only once.
+        """
+        if execution.effective_environment is not None:
+            CACHE.labels(cache='environment', result='hit').inc()
+        else:
+            CACHE.labels(cache='environment', result='miss').inc()
+            execution.effective_environment = self.engine(
+                execution.engine).get_execution_environment(execution)
+            db.session.commit()
+        return execution.effective_environment
@@ -17,6 +17,7 @@
 # limitations under the License.
 """Engine sub-module."""
 
+import copy
 import logging
 import os
 import re
@@ -31,11 +32,26 @@ from werkzeug.utils import cached_property
 
 from renga_deployer.serializers import ContextSchema, ExecutionSchema
 
+from .logging import lazy
 from .models import Context, Execution, ExecutionStates
-from .utils import decode_bytes, resource_available
+from .tracing import TracedClient, span
+from .utils import decode_bytes, parse_resources, resource_available
 
 context_schema = ContextSchema()
-execution_schema = ExecutionSchema()
+# log records show the stored state instead of asking the engine again
+execution_schema = ExecutionSchema(context={'state': 'cached'})
+
+INSTANCE_LABEL = 'renga.deployer.instance'
+"""Label with the identifier of the deployer instance."""
+
+EXECUTION_LABEL = 'renga.deployer.execution'
+"""Label with the execution identifier."""
+
+CONTEXT_LABEL = 'renga.deployer.context'
+"""Label with the context identifier."""
+
+CREATOR_LABEL = 'renga.deployer.creator'
+"""Label with the execution creator."""
 
 
 class Engine(object):
@@ -65,6 +81,40 @@ class Engine(object):
         """Check the state of an execution."""
         raise NotImplemented
 
+    def get_states(self, executions):
+        """Check the states of many executions."""
+        return {
+            execution.id: self.get_state(execution)
+            for execution in executions
+        }
+
+    def list_resources(self):
+        """List engine resources labelled by this deployer instance.
+
+        Each resource is a dict with at least the ``engine_id``, the
+        labelled ``execution`` identifier and the ``created`` timestamp.
+        """
+        raise NotImplementedError
+
+    def remove_resource(self, resource):
+        """Forcefully remove a resource returned by ``list_resources``."""
+        raise NotImplementedError
+
+
+def _dump(schema, obj):
+    """Serialize an object for a log record."""
+    return schema.dump(obj).data
+
+
+def execution_labels(execution):
+    """Return labels identifying the engine resources of an execution."""
+    return {
+        INSTANCE_LABEL: current_app.config['DEPLOYER_INSTANCE_ID'],
+        EXECUTION_LABEL: str(execution.id),
+        CONTEXT_LABEL: str(execution.context.id),
+        CREATOR_LABEL: execution.creator or '',
+    }
+
 
 class DockerEngine(Engine):
     """Class for deploying contexts on docker."""
@@ -72,8 +122,10 @@ class DockerEngine(Engine):
     class EXECUTION_STATE_MAPPING(Enum):
         """State mappings for the Docker engine."""
 
+        created = ExecutionStates.UNAVAILABLE
         running = ExecutionStates.RUNNING
         exited = ExecutionStates.EXITED
+        dead = ExecutionStates.EXITED
         restarting = ExecutionStates.UNAVAILABLE
         paused = ExecutionStates.UNAVAILABLE
 
@@ -89,8 +141,14 @@ class DockerEngine(Engine):
 
     @cached_property
     def client(self):
-        """Create a docker client from local environment."""
-        return self._docker.from_env()
+        """Create a docker client from local environment.
+
+        The high-level client sends every request through its low-level
+        API, whose calls are recorded as spans.
+        """
+        client = self._docker.from_env()
+        client.api = TracedClient('docker', client.api)
+        return client
 
     def launch(self, execution, **kwargs):
         """Launch a docker container with the context image."""
@@ -117,21 +175,48 @@ class DockerEngine(Engine):
             ports=ports,
             command=context.spec.get('command'),
             detach=True,
-            environment=execution.environment or None)
+            environment=execution.environment or None,
+            labels=execution_labels(execution),
+            **self._resource_options(context.spec))
 
         self.logger.info(
             'Launched container for execution {1} of context {0}'.format(
                 execution.id, context.id),
             extra={
                 'container_attrs': container.attrs,
-                'execution': execution_schema.dump(execution).data,
-                'context': context_schema.dump(execution.context).data
+                'execution': lazy(_dump, execution_schema, execution),
+                'context': lazy(_dump, context_schema, execution.context)
             })
 
         execution.engine_id = container.id
 
         return execution
 
+    @staticmethod
+    def _resource_options(spec):
+        """Translate the spec resources to docker run options."""
+        resources = parse_resources(spec.get('resources'))
+        requests, limits = resources['requests'], resources['limits']
+        options = {}
+
+        if 'cpu' in limits:
+            options['nano_cpus'] = int(limits['cpu'] * 10**9)
+        if 'cpu' in requests:
+            # relative weight under contention; 1024 stands for one core
+            options['cpu_shares'] = max(2, int(requests['cpu'] * 1024))
+        if 'memory' in limits:
+            options['mem_limit'] = limits['memory']
+            # do not let the container swap beyond its memory limit
+            options['memswap_limit'] = limits['memory']
+        if 'memory' in requests:
+            options['mem_reservation'] = requests['memory']
+        # the shared memory is sized by its limit, or else by its request
+        shm = limits.get('shm') or requests.get('shm')
+        if shm:
+            options['shm_size'] = shm
+
+        return options
+
     def stop(self, execution, remove=False):
         """Stop a running container, optionally removing it."""
         from docker.errors import NotFound
@@ -150,8 +235,8 @@ class DockerEngine(Engine):
                 execution.id, execution.context.id),
             extra={
                 'container_attrs': container.attrs,
-                'execution': execution_schema.dump(execution).data,
-                'context': context_schema.dump(execution.context).data
+                'execution': lazy(_dump, execution_schema, execution),
+                'context': lazy(_dump, context_schema, execution.context)
             })
 
         return execution
@@ -171,7 +256,12 @@ class DockerEngine(Engine):
             return {'ports': []}
 
         container = self.client.containers.get(execution.engine_id)
-        port_bindings = container.attrs['NetworkSettings'].get('Ports', {})
+        return self._host_ports(container.attrs)
+
+    @staticmethod
+    def _host_ports(attrs):
+        """Format the port bindings of an inspected container."""
+        port_bindings = attrs['NetworkSettings'].get('Ports', {})
         return {
             'ports': [{
                 'specified':
@@ -195,7 +285,8 @@ class DockerEngine(Engine):
             k: v
             for (
                 k,
-                v) in [e.split('=') for e in container.attrs['Config']['Env']]
+                v) in [e.split('=', 1)
+                       for e in container.attrs['Config']['Env']]
         }
 
     def get_state(self, execution):
@@ -207,6 +298,71 @@ class DockerEngine(Engine):
         except self._docker.errors.NotFound:
             return ExecutionStates.UNAVAILABLE
 
+    def get_states(self, executions):
+        """Return the states of many executions with a single listing."""
+        executions = list(executions)
+        found = {
+            container['execution']: container['state']
+            for container in self.list_containers()
+        }
+
+        return {
+            execution.id: found[str(execution.id)]
+            if str(execution.id) in found else
+            # containers from before labelling have to be inspected
+            self.get_state(execution)
+            for execution in executions
+        }
+
+    def list_containers(self, context_id=None, **labels):
+        """List containers of this deployer instance in one call.
+
+        :param context_id: only list containers of the given context
+        :param labels: additional label values to filter on
+        """
+        labels.setdefault(
+            INSTANCE_LABEL, current_app.config['DEPLOYER_INSTANCE_ID'])
+        if context_id is not None:
+            labels[CONTEXT_LABEL] = str(context_id)
+
+        # the low-level listing avoids inspecting every container
+        containers = self.client.api.containers(
+            all=True,
+            filters={
+                'label': [
+                    '{0}={1}'.format(key, value)
+                    for key, value in labels.items()
+                ]
+            })
+
+        return [{
+            'engine_id': container['Id'],
+            'execution': container['Labels'].get(EXECUTION_LABEL),
+            'context': container['Labels'].get(CONTEXT_LABEL),
+            'creator': container['Labels'].get(CREATOR_LABEL),
+            'created': container['Created'],
+            'state': getattr(
+                self.__class__.EXECUTION_STATE_MAPPING,
+                container['State'],
+                self.__class__.EXECUTION_STATE_MAPPING.restarting).value,
+        } for container in containers]
+
+    def list_resources(self):
+        """List containers of this deployer instance."""
+        return self.list_containers()
+
+    def remove_resource(self, resource):
+        """Remove a container even if it is still running."""
+        self.client.api.remove_container(resource['engine_id'], force=True)
+
+    def find_orphans(self, engine_ids):
+        """Return containers whose identifier is not in ``engine_ids``."""
+        engine_ids = set(engine_ids)
+        return [
+            container for container in self.list_containers()
+            if container['engine_id'] not in engine_ids
+        ]
+
 
 class K8SEngine(Engine):
     """Class for deploying contexts on Kubernetes."""
@@ -237,6 +393,25 @@ class K8SEngine(Engine):
         """Create a logger instance."""
         return logging.getLogger('renga.deployer.engines.k8s')
 
+    @cached_property
+    def api_client(self):
+        """Create an API client sharing its connection pool across calls.
+
+        Every request to the API server is recorded as a span named after
+        its method and path template.
+        """
+        api_client = self._kubernetes.client.ApiClient()
+        call_api = api_client.call_api
+
+        @wraps(call_api)
+        def traced_call_api(resource_path, method, *args, **kwargs):
+            with span('k8s.{0} {1}'.format(method, resource_path),
+                      kind='CLIENT'):
+                return call_api(resource_path, method, *args, **kwargs)
+
+        api_client.call_api = traced_call_api
+        return api_client
+
     def launch(self, execution, engine=None, **kwargs):
         """Launch a Kubernetes Job with the context spec."""
         context = execution.context
@@ -248,21 +423,23 @@ class K8SEngine(Engine):
             else current_app.config.get('DEPLOYER_DEFAULT_BASE_URL')
         )
 
-        batch = self._kubernetes.client.BatchV1Api()
+        batch = self._kubernetes.client.BatchV1Api(self.api_client)
         namespace = kwargs.pop('namespace', 'default')
         job_spec = self._k8s_job_template(namespace, execution)
         self.logger.debug('Context spec: {}'.format(context.spec))
         self.logger.debug('Job spec created: {}'.format(job_spec))
         job = batch.create_namespaced_job(namespace, job_spec)
-        uid = job.metadata.labels['controller-uid']
+        # the job has its own labels, so only the pods carry controller-uid
+        uid = job.metadata.uid
+        execution.job_name = job.metadata.name
 
         self.logger.info(
             'Created job for execution {0} of context {1}'.format(
                 execution.id, execution.context.id),
             extra={
-                'job': job.to_dict(),
-                'execution': execution_schema.dump(execution).data,
-                'context': context_schema.dump(execution.context).data
+                'job': lazy(job.to_dict),
+                'execution': lazy(_dump, execution_schema, execution),
+                'context': lazy(_dump, context_schema, execution.context)
             })
 
         # assume that if the user specified a port to open, they want
@@ -270,25 +447,33 @@ class K8SEngine(Engine):
         if context.spec.get('ports'):
             # To expose an interactive job, we need to start a service.
             # We use the job controller-uid to link the service.
-            api = self._kubernetes.client.CoreV1Api()
+            api = self._kubernetes.client.CoreV1Api(self.api_client)
             service_spec = self._k8s_service_template(namespace, context, uid)
             service = api.create_namespaced_service(namespace, service_spec)
+            execution.service_name = service.metadata.name
+            execution.node_ports = [{
+                'port': port.port,
+                'node_port': port.node_port,
+                'protocol': port.protocol,
+            } for port in service.spec.ports]
 
             self.logger.info(
                 'Created service for namespaced job {}'.format(uid),
-                extra={'service': service.to_dict()})
+                extra={'service': lazy(service.to_dict)})
 
             # if using an ingress, need to make an additional object
             if current_app.config.get(
                     'DEPLOYER_K8S_INGRESS'):
-                beta_api = self._kubernetes.client.ExtensionsV1beta1Api()
+                beta_api = self._kubernetes.client.ExtensionsV1beta1Api(
+                    self.api_client)
                 ingress = beta_api.create_namespaced_ingress(
                     namespace,
                     self._k8s_ingress_template(uid, service, execution))
+                execution.ingress_name = ingress.metadata.name
                 self.logger.info(
                     'Created ingress for service {}'.format(
                         service.metadata.name),
-                    extra={'ingress': ingress.to_dict()})
+                    extra={'ingress': lazy(ingress.to_dict)})
 
         execution.engine_id = uid
         execution.namespace = namespace
@@ -300,58 +485,54 @@ class K8SEngine(Engine):
                 {ExecutionStates.RUNNING, ExecutionStates.EXITED}, self):
             return execution
 
-        api = self._kubernetes.client.CoreV1Api()
-        batch = self._kubernetes.client.BatchV1Api()
+        api = self._kubernetes.client.CoreV1Api(self.api_client)
+        batch = self._kubernetes.client.BatchV1Api(self.api_client)
+        self._resolve_references(execution)
 
-        if execution.context.spec.get('ports'):
-            service = api.list_namespaced_service(
-                execution.namespace,
-                label_selector='job-uid={0}'.format(execution.engine_id))
+        if execution.service_name:
+            self._ignore_not_found(api.delete_namespaced_service)(
+                execution.service_name, execution.namespace)
 
-            if service.items:
-                service = service.items[0]
-                api.delete_namespaced_service(
-                    service.metadata.name,
-                    execution.namespace, )
+            self.logger.info(
+                'Deleted namespaced service {}'.format(
+                    execution.service_name))
 
-                self.logger.info(
-                    'Deleted namespaced service {}'.format(
-                        service.metadata.name),
-                    extra={'service': service.to_dict()})
-
-                if current_app.config.get(
-                        'DEPLOYER_K8S_INGRESS'):
-                    beta_api = self._kubernetes.client.ExtensionsV1beta1Api()
-                    ingress = beta_api.list_namespaced_ingress(
-                        execution.namespace,
-                        label_selector='job-uid={0}'.format(
-                            execution.engine_id)).items[0]
-                    beta_api.delete_namespaced_ingress(
-                        ingress.metadata.name, execution.namespace,
-                        self._kubernetes.client.V1DeleteOptions())
-
-                    self.logger.info(
-                        'Deleted namespaced ingress {0} for service {1}'.
-                        format(ingress.metadata.uid, service.metadata.name),
-                        extra={'ingress': ingress.to_dict()})
-
-        batch.delete_collection_namespaced_job(
-            execution.namespace,
-            label_selector='controller-uid={0}'.format(execution.engine_id))
+        if execution.ingress_name:
+            beta_api = self._kubernetes.client.ExtensionsV1beta1Api(
+                self.api_client)
+            self._ignore_not_found(beta_api.delete_namespaced_ingress)(
+                execution.ingress_name, execution.namespace,
+                self._kubernetes.client.V1DeleteOptions())
+
+            self.logger.info(
+                'Deleted namespaced ingress {0} for service {1}'.format(
+                    execution.ingress_name, execution.service_name))
+
+        # keep the pods around for their logs unless they are removed
+        if execution.job_name:
+            self._ignore_not_found(batch.delete_namespaced_job)(
+                execution.job_name, execution.namespace,
+                self._kubernetes.client.V1DeleteOptions(
+                    propagation_policy='Orphan'))
 
         self.logger.info(
             'Deleted namespaced job for execution {}'.format(
                 execution.engine_id),
             extra={
-                'execution': execution_schema.dump(execution).data,
-                'context': context_schema.dump(execution.context).data
+                'execution': lazy(_dump, execution_schema, execution),
+                'context': lazy(_dump, context_schema, execution.context)
             })
 
         if remove:
-            api.delete_collection_namespaced_pod(
-                execution.namespace,
-                label_selector='controller-uid={0}'.format(
-                    execution.engine_id))
+            if execution.pod_name:
+                self._ignore_not_found(api.delete_namespaced_pod)(
+                    execution.pod_name, execution.namespace,
+                    self._kubernetes.client.V1DeleteOptions())
+            else:
+                api.delete_collection_namespaced_pod(
+                    execution.namespace,
+                    label_selector='controller-uid={0}'.format(
+                        execution.engine_id))
 
             self.logger.info('Deleted namespaced pod for execution {}'.format(
                 execution.engine_id))
@@ -360,23 +541,93 @@ class K8SEngine(Engine):
 
     def get_state(self, execution):
         """Get status of a running job."""
-        api = self._kubernetes.client.CoreV1Api()
-        pod = api.list_namespaced_pod(
-            execution.namespace,
-            label_selector='controller-uid={}'.format(execution.engine_id))
+        return self._pod_state(execution, self._get_pod(execution))
 
-        if not pod.items:
+    @classmethod
+    def _pod_state(cls, execution, pod):
+        """Map the status of the execution container in a pod."""
+        if pod is None or not pod.status.container_statuses:
             return ExecutionStates.UNAVAILABLE
 
         status = list(
-            filter(lambda c: c.name == str(execution.context.id), pod.items[0]
-                   .status.container_statuses))[0]
+            filter(lambda c: c.name == str(execution.context.id),
+                   pod.status.container_statuses))[0]
 
         return getattr(
-            self.__class__.EXECUTION_STATE_MAPPING,
+            cls.EXECUTION_STATE_MAPPING,
             list(filter(lambda x: x[1], status.state.to_dict().items()))[0][
                 0]).value
 
+    def _get_pod(self, execution):
+        """Read the pod of an execution, remembering its name."""
+        api = self._kubernetes.client.CoreV1Api(self.api_client)
+
+        if execution.pod_name:
+            return self._ignore_not_found(api.read_namespaced_pod)(
+                execution.pod_name, execution.namespace)
+
+        # the pod name is only known once the job has been scheduled
+        pod = api.list_namespaced_pod(
+            execution.namespace,
+            label_selector='controller-uid={}'.format(execution.engine_id))
+
+        if not pod.items:
+            return None
+
+        execution.pod_name = pod.items[0].metadata.name
+        return pod.items[0]
+
+    def _resolve_references(self, execution):
+        """Discover the resources of executions launched without names."""
+        selector = 'job-uid={0}'.format(execution.engine_id)
+
+        if not execution.job_name:
+            batch = self._kubernetes.client.BatchV1Api(self.api_client)
+            jobs = batch.list_namespaced_job(
+                execution.namespace,
+                label_selector='controller-uid={0}'.format(
+                    execution.engine_id))
+            if jobs.items:
+                execution.job_name = jobs.items[0].metadata.name
+
+        if not execution.service_name and execution.context.spec.get(
+                'ports'):
+            api = self._kubernetes.client.CoreV1Api(self.api_client)
+            services = api.list_namespaced_service(
+                execution.namespace, label_selector=selector)
+            if services.items:
+                service = services.items[0]
+                execution.service_name = service.metadata.name
+                execution.node_ports = [{
+                    'port': port.port,
+                    'node_port': port.node_port,
+                    'protocol': port.protocol,
+                } for port in service.spec.ports]
+
+            if current_app.config.get('DEPLOYER_K8S_INGRESS'):
+                beta_api = self._kubernetes.client.ExtensionsV1beta1Api(
+                    self.api_client)
+                ingresses = beta_api.list_namespaced_ingress(
+                    execution.namespace, label_selector=selector)
+                if ingresses.items:
+                    execution.ingress_name = ingresses.items[0].metadata.name
+
+        return execution
+
+    def _ignore_not_found(self, func):
+        """Return ``None`` instead of raising if a resource is gone."""
+        ApiException = self._kubernetes.client.rest.ApiException
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+
+        return wrapper
+
     @staticmethod
     def _k8s_job_template(namespace, execution):
         """Return simple kubernetes job JSON."""
@@ -411,20 +662,50 @@ class K8SEngine(Engine):
         } for k, v in execution.environment.items()]
 
         spec['containers'][0]['env'] += context_spec.pop('env', [])
-        spec['volumes'] = context_spec.pop('volumes', [])
+        spec['volumes'] = list(context_spec.pop('volumes', []))
+
+        # shared memory is not a Kubernetes resource, mount a memory volume
+        if context_spec.get('resources'):
+            resources = copy.deepcopy(context_spec['resources'])
+            shm = None
+            for kind in ('requests', 'limits'):
+                shm = (resources.get(kind) or {}).pop('shm', None) or shm
+            context_spec['resources'] = resources
+
+            if shm:
+                spec['volumes'].append({
+                    'name': 'dshm',
+                    'emptyDir': {
+                        'medium': 'Memory',
+                        'sizeLimit': shm
+                    }
+                })
+                context_spec['volumeMounts'] = list(
+                    context_spec.get('volumeMounts', [])) + [{
+                        'name': 'dshm',
+                        'mountPath': '/dev/shm'
+                    }]
 
         # add all other stuff to spec
         spec['containers'][0].update(context_spec)
 
+        # creators are not valid label values
+        labels = execution_labels(execution)
+        labels.pop(CREATOR_LABEL)
+
         # finalize job template
         template = {
             "kind": "Job",
             "metadata": {
                 "namespace": "{0}".format(namespace),
-                "generateName": "{0}-".format(context.id)
+                "generateName": "{0}-".format(context.id),
+                "labels": labels
             },
             "spec": {
                 "template": {
+                    "metadata": {
+                        "labels": labels
+                    },
                     "spec": spec
                 }
             }
@@ -497,101 +778,136 @@ class K8SEngine(Engine):
 
     def get_logs(self, execution, timeout=None, **kwargs):
         """Extract logs for the Job from the Pod."""
-        api = self._kubernetes.client.CoreV1Api()
+        api = self._kubernetes.client.CoreV1Api(self.api_client)
         namespace = execution.namespace
 
-        pod = api.list_namespaced_pod(
-            namespace,
-            label_selector='controller-uid={0}'.format(execution.engine_id))
+        pod = self._get_pod(execution)
 
-        if not pod.items:
+        if pod is None:
             # FIXME: implement proper exception handling and propagation
             raise NotFound('Execution container not found.')
 
         timein = time.time()
         while not resource_available(api.read_namespaced_pod_log)(
-                pod.items[0].metadata.name, namespace):
+                pod.metadata.name, namespace):
             if time.time() - timein > (timeout or self.timeout):
                 raise RuntimeError("Timeout while fetching logs.")
 
-        return api.read_namespaced_pod_log(pod.items[0].metadata.name,
-                                           namespace)
+        return api.read_namespaced_pod_log(pod.metadata.name, namespace)
 
     def get_host_ports(self, execution):
         """Return host ip and port bindings for the running execution."""
-        api = self._kubernetes.client.CoreV1Api()
-        service = api.list_namespaced_service(
-            execution.namespace,
-            label_selector='job-uid={0}'.format(execution.engine_id))
-
-        pod = api.list_namespaced_pod(
-            execution.namespace,
-            label_selector='controller-uid={0}'.format(execution.engine_id))
+        self._resolve_references(execution)
+        if not execution.service_name:
+            # this service doesn't exist
+            return {'ports': []}
 
-        if not service.items or not execution.check_state(
-                ExecutionStates.RUNNING, self):
-            # this service doesn't exist or job isn't running yet
+        pod = self._get_pod(execution)
+        if self._pod_state(execution, pod) != ExecutionStates.RUNNING:
+            # job isn't running yet
             return {'ports': []}
 
-        else:
-            if current_app.config.get(
-                    'DEPLOYER_K8S_INGRESS'):
+        ingress = None
+        if execution.ingress_name:
+            beta_api = self._kubernetes.client.ExtensionsV1beta1Api(
+                self.api_client)
+            ingress = beta_api.read_namespaced_ingress(
+                execution.ingress_name, execution.namespace)
 
-                beta_api = self._kubernetes.client.ExtensionsV1beta1Api()
-                ingress = beta_api.list_namespaced_ingress(
-                    execution.namespace,
-                    label_selector='job-uid={0}'.format(
-                        execution.engine_id)).items[0]
-
-                if not ingress.status.load_balancer.ingress or \
-                        not ingress.status.load_balancer.ingress[0].ip:
-                    host = None
-
-                else:
-                    host = ingress.status.load_balancer.ingress[0].ip
-
-                return {
-                    'ports': [{
-                        'specified':
-                        port.port,
-                        'host':
-                        current_app.config[
-                            'DEPLOYER_K8S_CONTAINER_IP'] or host,
-                        'path':
-                        ingress.spec.rules[0].http.paths[0].path,
-                        'exposed':
-                        '443',
-                        'protocol':
-                        port.protocol,
-                    } for port in service.items[0].spec.ports]
-                }
+        return self._host_ports(execution, pod, ingress)
+
+    @staticmethod
+    def _host_ports(execution, pod, ingress=None):
+        """Format the node ports of an execution service."""
+        if ingress is not None:
+            if not ingress.status.load_balancer.ingress or \
+                    not ingress.status.load_balancer.ingress[0].ip:
+                host = None
+
+            else:
+                host = ingress.status.load_balancer.ingress[0].ip
 
             return {
                 'ports': [{
                     'specified':
-                    port.port,
+                    port['port'],
                     'host':
                     current_app.config[
-                        'DEPLOYER_K8S_CONTAINER_IP'] or pod.items[
-                            0].status.host_ip,
+                        'DEPLOYER_K8S_CONTAINER_IP'] or host,
+                    'path':
+                    ingress.spec.rules[0].http.paths[0].path,
                     'exposed':
-                    port.node_port,
+                    '443',
                     'protocol':
-                    port.protocol,
-                } for port in service.items[0].spec.ports]
+                    port['protocol'],
+                } for port in execution.node_ports]
             }
 
+        return {
+            'ports': [{
+                'specified':
+                port['port'],
+                'host':
+                current_app.config[
+                    'DEPLOYER_K8S_CONTAINER_IP'] or pod.status.host_ip,
+                'exposed':
+                port['node_port'],
+                'protocol':
+                port['protocol'],
+            } for port in execution.node_ports]
+        }
+
+    def list_resources(self):
+        """List jobs of this deployer instance in all namespaces."""
+        batch = self._kubernetes.client.BatchV1Api(self.api_client)
+        jobs = batch.list_job_for_all_namespaces(
+            label_selector='{0}={1}'.format(
+                INSTANCE_LABEL, current_app.config['DEPLOYER_INSTANCE_ID']))
+
+        return [{
+            'engine_id': job.metadata.uid,
+            'execution': job.metadata.labels.get(EXECUTION_LABEL),
+            'name': job.metadata.name,
+            'namespace': job.metadata.namespace,
+            'created': job.metadata.creation_timestamp.timestamp(),
+        } for job in jobs.items]
+
+    def remove_resource(self, resource):
+        """Remove a job together with its pods, service and ingress."""
+        api = self._kubernetes.client.CoreV1Api(self.api_client)
+        batch = self._kubernetes.client.BatchV1Api(self.api_client)
+        beta_api = self._kubernetes.client.ExtensionsV1beta1Api(
+            self.api_client)
+        namespace = resource['namespace']
+        selector = 'job-uid={0}'.format(resource['engine_id'])
+
+        for service in api.list_namespaced_service(
+                namespace, label_selector=selector).items:
+            api.delete_namespaced_service(service.metadata.name, namespace)
+
+        for ingress in beta_api.list_namespaced_ingress(
+                namespace, label_selector=selector).items:
+            beta_api.delete_namespaced_ingress(
+                ingress.metadata.name, namespace,
+                self._kubernetes.client.V1DeleteOptions())
+
+        batch.delete_namespaced_job(
+            resource['name'], namespace,
+            self._kubernetes.client.V1DeleteOptions(
+                propagation_policy='Background'))
+
     def get_execution_environment(self, execution) -> dict:
         """Retrieve the environment specified for an execution container."""
-        client = self._kubernetes.client.BatchV1Api()
-        job = client.list_namespaced_job(
-            execution.namespace,
-            label_selector='controller-uid={0}'.format(execution.engine_id))
-        if not job.items:
+        self._resolve_references(execution)
+        client = self._kubernetes.client.BatchV1Api(self.api_client)
+        job = self._ignore_not_found(client.read_namespaced_job)(
+            execution.job_name, execution.namespace
+        ) if execution.job_name else None
+        if job is None:
             # FIXME: implement proper exception handling and propagation
             raise NotFound('Execution container not found.')
 
         return {
             e.name: e.value
-            for e in job.items[0].spec.template.spec.containers[0].env
+            for e in job.spec.template.spec.containers[0].env
         }
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stream execution events to many subscribers.
+
+``GET /events`` sends `server-sent events`_ for all executions, the
+executions of a context (``?context_id=``) or one execution
+(``?execution_id=``)::
+
+    id: 1508498400123456
+    event: running
+    data: {"execution_id": "...", "context_id": "...", "state": "running"}
+
+The event types are ``created``, ``launched``, ``stopped``, ``failed`` and
+the new state of an execution, e.g. ``running`` or ``exited``.
+
+Events are published when the deployer signals are committed. While
+streams are open, the :class:`~renga_deployer.watcher.StateWatcher` also
+refreshes the states of the live executions the streams subscribe to and
+reads the executions changed by other processes, so every process streams
+all events.
+
+Each subscriber has a bounded queue. A subscriber that does not keep up
+is disconnected and resumes from the recent events with the
+``Last-Event-ID`` header. The recent events are buffered by each process
+and only while it has open streams, so resuming is reliable on the same
+process only; behind several workers, keep the clients on their process
+with sticky sessions.
+
+.. _server-sent events: https://html.spec.whatwg.org/#server-sent-events
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, false, or_
+from sqlalchemy.orm import Session
+
+from .deployer import execution_created, execution_failed, \
+    execution_launched, execution_state_changed, execution_stopped
+from .models import Execution, ExecutionStates, db
+
+logger = logging.getLogger('renga.deployer.events')
+
+PENDING = 'renga_deployer_after_commit'
+"""Session key of the callbacks run after the next commit."""
+
+
+def after_commit(callback, *args):
+    """Call a function once the current session is committed."""
+    db.session().info.setdefault(PENDING, []).append((callback, args))
+
+
+class Event(object):
+    """An execution event."""
+
+    def __init__(self, id, kind, execution_id, context_id, state):
+        """Describe what happened to an execution."""
+        self.id = id
+        self.kind = kind
+        self.execution_id = execution_id
+        self.context_id = context_id
+        self.state = state
+
+    def matches(self, context_id=None, execution_id=None):
+        """Check whether the event belongs to a context or execution."""
+        return (context_id is None or self.context_id == context_id) and (
+            execution_id is None or self.execution_id == execution_id)
+
+    def format(self):
+        """Return the event in the ``text/event-stream`` format."""
+        return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(
+            self.id, self.kind,
+            json.dumps({
+                'execution_id': str(self.execution_id),
+                'context_id': str(self.context_id),
+                'state': self.state,
+            }, sort_keys=True))
+
+
+class Subscription(object):
+    """Events of a stream waiting to be sent to a client."""
+
+    def __init__(self, stream, context_id=None, execution_id=None,
+                 maxsize=0):
+        """Subscribe to the events of a context or execution."""
+        self.stream = stream
+        self.context_id = context_id
+        self.execution_id = execution_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        """Queue an event, disconnecting the subscriber when full."""
+        if not event.matches(self.context_id, self.execution_id):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def __iter__(self):
+        """Yield the formatted events until the subscriber is too slow."""
+        try:
+            # the queued events are sent before closing an overflowed stream
+            while not (self.overflowed and self.queue.empty()):
+                try:
+                    events = [self.queue.get(timeout=self.stream.keepalive)]
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                # the events queued meanwhile are sent in the same chunk
+                while True:
+                    try:
+                        events.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                yield ''.join(event.format() for event in events)
+        finally:
+            self.stream.unsubscribe(self)
+
+
+class EventStream(object):
+    """Fan out execution events to the subscribers of this process."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        self._subscribers = []
+        self._known = {}
+        self._since = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.buffer = deque(maxlen=app.config['DEPLOYER_EVENTS_BUFFER'])
+        self.queue_size = app.config['DEPLOYER_EVENTS_QUEUE_SIZE']
+        self.keepalive = app.config['DEPLOYER_EVENTS_KEEPALIVE']
+        self.watcher = app.extensions['renga-deployer-watcher']
+        self.margin = timedelta(seconds=max(5, 5 * self.watcher.interval))
+
+        execution_created.connect(self.created)
+        execution_launched.connect(self.launched)
+        execution_stopped.connect(self.stopped)
+        execution_failed.connect(self.failed)
+        execution_state_changed.connect(self.state_changed)
+
+        app.extensions['renga-deployer-events'] = self
+        logger.debug('Event stream extension started.')
+
+    def subscribe(self, context_id=None, execution_id=None,
+                  last_event_id=None):
+        """Return a new subscription, replaying events after an id."""
+        self.watcher.park()
+        subscription = Subscription(
+            self, context_id=context_id, execution_id=execution_id,
+            maxsize=self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self.buffer:
+                    if event.id > last_event_id:
+                        subscription.put(event)
+            self._subscribers.append(subscription)
+            if len(self._subscribers) == 1:
+                self._since = datetime.utcnow()
+                self.watcher.add_listener(self.refresh, self._live)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop delivering events to a subscription."""
+        with self._lock:
+            if subscription not in self._subscribers:
+                return
+            self._subscribers.remove(subscription)
+            if not self._subscribers:
+                self.watcher.remove_listener(self.refresh)
+                self._known.clear()
+        self.watcher.unpark()
+
+    def publish(self, kind, execution_id, context_id, state):
+        """Send an event to the buffer and to matching subscribers."""
+        with self._lock:
+            # identifiers are timestamps, unique within the process
+            self._last_id = max(self._last_id + 1, int(time.time() * 1e6))
+            event = Event(self._last_id, kind, execution_id, context_id,
+                          state)
+            self.buffer.append(event)
+
+            launched = kind == 'launched' or (
+                self._known.get(execution_id, (False, ))[0])
+            self._known[execution_id] = (launched, state)
+
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            subscription.put(event)
+        return event
+
+    def created(self, execution):
+        """Publish a created execution once committed."""
+        self._pending('created', execution)
+
+    def launched(self, execution):
+        """Publish a launched execution once committed."""
+        self._pending('launched', execution)
+
+    def stopped(self, execution):
+        """Publish a stopped execution once committed."""
+        self._pending('stopped', execution)
+
+    def failed(self, execution):
+        """Publish a failed launch once committed."""
+        self._pending('failed', execution)
+
+    def state_changed(self, execution, state=None):
+        """Publish a new state once committed."""
+        self._pending(state.value, execution, state=state.value)
+
+    def refresh(self):
+        """Detect the changes of executions of other processes.
+
+        The watcher has refreshed the live executions of the subscribers
+        before; new states are published by the signals of the deployer.
+        """
+        now = datetime.utcnow()
+        seen = set()
+        for execution in Execution.query.filter(
+                Execution.updated >= self._since - self.margin):
+            self._detect(execution)
+            seen.add(execution.id)
+        self._since = now
+
+        # exited executions are forgotten once they leave the window
+        with self._lock:
+            for execution_id, (_, state) in list(self._known.items()):
+                if state == ExecutionStates.EXITED.value and \
+                        execution_id not in seen:
+                    del self._known[execution_id]
+
+    def _live(self):
+        """Return a query of the live executions the streams subscribe to."""
+        live = Execution.query.filter(
+            Execution.engine_id.isnot(None),
+            or_(Execution.state.is_(None),
+                Execution.state != ExecutionStates.EXITED.value))
+        scope = self._scope()
+        if scope is not None:
+            live = live.filter(or_(false(), *scope))
+        return live
+
+    def _scope(self):
+        """Return the filters of the subscribed executions, if limited."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        scope = []
+        for subscription in subscribers:
+            clauses = []
+            if subscription.context_id is not None:
+                clauses.append(Execution.context_id == subscription.context_id)
+            if subscription.execution_id is not None:
+                clauses.append(Execution.id == subscription.execution_id)
+            if not clauses:
+                # a subscriber of all executions needs all of them
+                return None
+            scope.append(and_(*clauses))
+        return scope
+
+    def _detect(self, execution):
+        """Publish the changes of an execution since it was last seen."""
+        launched = execution.engine_id is not None
+        state = execution.state
+        context_id = execution.context_id
+
+        previous = self._known.get(execution.id)
+        if previous is None:
+            if execution.created < self._since - self.margin:
+                # its history before the stream opened is unknown
+                with self._lock:
+                    self._known[execution.id] = (launched, state)
+                return
+            previous = (False, None)
+            self.publish('created', execution.id, context_id, None)
+
+        if launched and not previous[0]:
+            self.publish('launched', execution.id, context_id, None)
+        if state and state != previous[1]:
+            self.publish(state, execution.id, context_id, state)
+
+    def _pending(self, kind, execution, state=None):
+        """Remember an event until the session is committed."""
+        # the signals are shared by all applications of the process
+        if current_app.extensions.get('renga-deployer-events') is not self:
+            return
+        context_id = execution.context_id or (
+            execution.context.id if execution.context else None)
+        after_commit(self.publish, kind, execution.id, context_id,
+                     state or execution.state)
+
+
+@event.listens_for(Session, 'after_commit')
+def run_pending(session):
+    """Run the callbacks waiting for the commit of a session."""
+    for callback, args in session.info.pop(PENDING, ()):
+        callback(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending(session):
+    """Discard the callbacks of a rolled back session."""
+    session.info.pop(PENDING, None)
@@ -19,6 +19,8 @@
 
 from __future__ import absolute_import, print_function
 
+import threading
+
 from flask import current_app, request
 from werkzeug.local import LocalProxy
 
@@ -26,11 +28,6 @@ from . import config
 from .deployer import Deployer
 from .views import blueprint
 
-try:
-    from flask import _app_ctx_stack as stack
-except ImportError:
-    from flask import _request_ctx_stack as stack
-
 current_deployer = LocalProxy(lambda: current_app.extensions['renga-deployer'])
 
 
@@ -39,6 +36,8 @@ class RengaDeployer(object):
 
     def __init__(self, app=None):
         """Extension initialization."""
+        self._deployer = None
+        self._lock = threading.Lock()
         if app:
             self.init_app(app)
 
@@ -66,10 +65,13 @@ class RengaDeployer(object):
 
     @property
     def deployer(self):
-        """Returns a local app :class:`~renga_deployer.deployer.Deployer`."""
-        ctx = stack.top
-        if ctx is not None:
-            if not hasattr(ctx, 'renga_deployer'):
-                ctx.renga_deployer = Deployer(
-                    engines={'docker', 'docker:///var/lib/docker.sock'})
-            return ctx.renga_deployer
+        """Returns the app :class:`~renga_deployer.deployer.Deployer`.
+
+        The deployer is shared by all threads and greenlets of the process.
+        """
+        if self._deployer is None:
+            with self._lock:
+                if self._deployer is None:
+                    self._deployer = Deployer(
+                        engines={'docker': 'docker:///var/lib/docker.sock'})
+        return self._deployer
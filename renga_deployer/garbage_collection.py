@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Remove engine resources that have no execution."""
+
+import logging
+import time
+from collections import Counter
+
+from flask import current_app
+
+from .metrics import GC_RESOURCES
+from .models import Execution, db
+
+logger = logging.getLogger('renga.deployer.garbage_collection')
+
+
+class GarbageCollector(object):
+    """Find and remove orphaned engine resources.
+
+    Engines start their resources before the execution is committed. When
+    the commit fails, or a signal handler aborts the request afterwards, the
+    resource keeps running without an execution referring to it.
+    """
+
+    def __init__(self, deployer, grace_period=None, batch_size=None,
+                 dry_run=False):
+        """Create a garbage collector.
+
+        :param deployer: deployer providing the engines
+        :param grace_period: seconds during which new resources are kept
+        :param batch_size: number of resources checked in one query
+        :param dry_run: only report orphans without removing them
+        """
+        self.deployer = deployer
+        self.grace_period = grace_period if grace_period is not None else \
+            current_app.config['DEPLOYER_GC_GRACE_PERIOD']
+        self.batch_size = batch_size or \
+            current_app.config['DEPLOYER_GC_BATCH_SIZE']
+        self.dry_run = dry_run
+
+    def orphans(self, engine):
+        """Yield resources of an engine without an execution."""
+        resources = engine.list_resources()
+        for start in range(0, len(resources), self.batch_size):
+            batch = resources[start:start + self.batch_size]
+            known = {
+                engine_id
+                for engine_id, in db.session.query(Execution.engine_id).
+                filter(
+                    Execution.engine_id.in_(
+                        [resource['engine_id'] for resource in batch]))
+            }
+            for resource in batch:
+                if resource['engine_id'] not in known:
+                    yield resource
+
+    def collect(self, engines=None):
+        """Remove orphaned resources and return counts per engine."""
+        stats = {}
+        now = time.time()
+
+        for name in engines or self.deployer.ENGINES:
+            engine = self.deployer.engine(name)
+            counts = stats[name] = Counter(orphans=0, removed=0, errors=0)
+
+            for resource in self.orphans(engine):
+                if now - resource['created'] < self.grace_period:
+                    counts['recent'] += 1
+                    continue
+
+                counts['orphans'] += 1
+                if self.dry_run:
+                    logger.info(
+                        'Found orphaned {0} resource {1}'.format(
+                            name, resource['engine_id']),
+                        extra={'resource': resource})
+                    continue
+
+                try:
+                    engine.remove_resource(resource)
+                except Exception:
+                    counts['errors'] += 1
+                    logger.exception(
+                        'Removing orphaned {0} resource {1} failed'.format(
+                            name, resource['engine_id']))
+                else:
+                    counts['removed'] += 1
+                    logger.info(
+                        'Removed orphaned {0} resource {1}'.format(
+                            name, resource['engine_id']),
+                        extra={'resource': resource})
+
+            for outcome, count in counts.items():
+                GC_RESOURCES.labels(engine=name, outcome=outcome).inc(count)
+
+        logger.info(
+            'Garbage collection finished.',
+            extra={'stats': stats,
+                   'dry_run': self.dry_run})
+        return stats
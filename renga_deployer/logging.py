@@ -15,24 +15,175 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Renga Logging."""
+"""Renga Logging.
 
+Log records of the ``renga`` loggers are put on a queue and emitted by a
+background thread, so that slow handlers, e.g. logstash or Sentry, do not
+block the request threads. Expensive ``extra`` values can be wrapped with
+:func:`lazy`; they are computed only if a handler is going to emit the
+record. They are computed by the thread logging the record, which holds
+the application context, so they should only read stored values.
+
+Processes forked from the one that configured logging, e.g. the workers of
+a uWSGI master preloading the application, start their own listener
+thread with the first record they log:
+
+>>> calls = []
+>>> value = lazy(calls.append, 1)
+>>> calls
+[]
+>>> value.resolve() is None and calls
+[1]
+"""
+
+import atexit
+import copy
 import os
+import threading
 from logging import DEBUG, INFO, getLogger
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
 
 import yaml
 
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
 
-def setup_logging(conf):
-    """Configure logging for the deployer app."""
-    if conf and os.path.exists(os.path.dirname(conf)):
-        with open(conf, 'r') as fp:
-            dictConfig(yaml.load(fp))
 
-    elif isinstance(conf, dict):
+class lazy(object):
+    """Value of a log record ``extra`` computed on demand."""
+
+    __slots__ = ('function', 'args', 'kwargs')
+
+    def __init__(self, function, *args, **kwargs):
+        """Defer ``function(*args, **kwargs)``."""
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def resolve(self):
+        """Compute the value."""
+        return self.function(*self.args, **self.kwargs)
+
+    def __repr__(self):
+        """Represent the computed value."""
+        return repr(self.resolve())
+
+
+def resolve_extras(record):
+    """Replace lazy values of a record with their computed value."""
+    for key, value in list(vars(record).items()):
+        if isinstance(value, lazy):
+            try:
+                setattr(record, key, value.resolve())
+            except Exception as error:
+                setattr(record, key, '<unavailable: {0!r}>'.format(error))
+    return record
+
+
+class AsyncHandler(QueueHandler):
+    """Queue records for a listener thread after resolving lazy extras.
+
+    Lazy values are resolved in the calling thread, which holds the
+    application context they may need, and only if one of the listener's
+    handlers accepts the record level.
+    """
+
+    def __init__(self, queue, handlers):
+        """Queue records for ``handlers``."""
+        super(AsyncHandler, self).__init__(queue)
+        self.handlers = handlers
+
+    def prepare(self, record):
+        """Resolve the record in the calling thread."""
+        record = copy.copy(record)
+        if any(record.levelno >= handler.level for handler in self.handlers):
+            resolve_extras(record)
+        # merge the arguments now, they may not be safe to use later
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        """Queue a record for the listener of the current process."""
+        if _listener_pid != os.getpid():
+            self.queue = _restart_listener() or self.queue
+        super(AsyncHandler, self).enqueue(record)
+
+
+def _start_listener(handlers):
+    """Start a thread emitting queued records to the handlers."""
+    global _listener, _listener_pid
+
+    queue = Queue(-1)
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    return queue
+
+
+def _stop_listener():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+
+    # the listener of a parent process has no thread in forked ones
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+
+def _restart_listener():
+    """Restart the listener in a forked process and return its queue."""
+    global _listener_pid
+
+    with _listener_lock:
+        if _listener is None:
+            return None
+        if _listener_pid != os.getpid():
+            # the records queued in the parent are emitted by the parent
+            _listener.queue = Queue(-1)
+            _listener._thread = None
+            _listener.start()
+            _listener_pid = os.getpid()
+        return _listener.queue
+
+
+atexit.register(_stop_listener)
+
+
+def setup_async_handlers(logger):
+    """Move the handlers of a logger behind a queue."""
+    handlers = [
+        handler for handler in logger.handlers
+        if not isinstance(handler, AsyncHandler)
+    ]
+    if not handlers:
+        return
+
+    queue = _start_listener(handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(AsyncHandler(queue, handlers))
+
+
+def setup_logging(conf, use_queue=True):
+    """Configure logging for the deployer app.
+
+    :param conf: path to a YAML file or a dictionary configuration
+    :param use_queue: emit records of the ``renga`` loggers from a
+                      background thread
+    """
+    _stop_listener()
+
+    if isinstance(conf, dict):
         dictConfig(conf)
 
+    elif conf and os.path.exists(os.path.dirname(conf)):
+        with open(conf, 'r') as fp:
+            dictConfig(yaml.load(fp))
+
     else:
         # no configuration provided, use a default
         dictConfig({
@@ -58,5 +209,13 @@ def setup_logging(conf):
             }
         })
 
+    if use_queue:
+        setup_async_handlers(getLogger('renga'))
+    else:
+        # handlers only filter the records they are going to emit
+        for handler in getLogger('renga').handlers:
+            if resolve_extras not in handler.filters:
+                handler.addFilter(resolve_extras)
+
     logger = getLogger('renga.deployer.logging')
     logger.debug('Logging initialized.')
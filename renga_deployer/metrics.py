@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Prometheus metrics.
+
+Metrics are recorded only if ``prometheus_client`` is installed. When the
+application runs in several processes, e.g. uWSGI workers, point the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable to an empty directory
+shared by the workers so that ``/metrics`` aggregates all of them.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, request
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from .models import Execution, db
+from .tracing import traced
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+logger = logging.getLogger('renga.deployer.metrics')
+
+
+class _NoopMetric(object):
+    """Stand-in metric used when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs):
+        """Return the same metric."""
+        return self
+
+    def inc(self, amount=1):
+        """Ignore the increment."""
+
+    def dec(self, amount=1):
+        """Ignore the decrement."""
+
+    def observe(self, amount):
+        """Ignore the observation."""
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    """Create a metric of the given kind if prometheus_client is present."""
+    if prometheus_client is None:  # pragma: no cover
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames,
+                                            **kwargs)
+
+
+ENGINE_LATENCY = _metric('Histogram', 'renga_deployer_engine_seconds',
+                         'Latency of engine calls.', ['engine', 'operation'])
+
+ENGINE_ERRORS = _metric('Counter', 'renga_deployer_engine_errors_total',
+                        'Failed engine calls.', ['engine', 'operation'])
+
+DEPLOYER_LATENCY = _metric('Histogram', 'renga_deployer_operation_seconds',
+                           'Latency of deployer operations.', ['operation'])
+
+DEPLOYER_ERRORS = _metric('Counter', 'renga_deployer_operation_errors_total',
+                          'Failed deployer operations.', ['operation'])
+
+OUTBOUND_LATENCY = _metric('Histogram', 'renga_deployer_outbound_seconds',
+                           'Latency of requests to other services.',
+                           ['service', 'operation'])
+
+OUTBOUND_ERRORS = _metric('Counter', 'renga_deployer_outbound_errors_total',
+                          'Failed requests to other services.',
+                          ['service', 'operation'])
+
+DB_LATENCY = _metric('Histogram', 'renga_deployer_db_query_seconds',
+                     'Latency of database queries.', ['statement'])
+
+CACHE = _metric('Counter', 'renga_deployer_cache_total',
+                'Lookups of stored engine information.', ['cache', 'result'])
+
+GC_RESOURCES = _metric('Counter', 'renga_deployer_gc_resources_total',
+                       'Orphaned engine resources by outcome.',
+                       ['engine', 'outcome'])
+
+REQUEST_LATENCY = _metric('Histogram', 'renga_deployer_request_seconds',
+                          'Latency of HTTP requests.', ['method', 'endpoint'])
+
+REQUESTS_IN_PROGRESS = _metric(
+    'Gauge',
+    'renga_deployer_requests_in_progress',
+    'HTTP requests being handled.', ['method'],
+    multiprocess_mode='livesum')
+
+
+@contextmanager
+def observe(histogram, errors=None, **labels):
+    """Observe the duration of a block and count its failures."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def timed(histogram, errors=None, **labels):
+    """Decorate a function to observe its duration and failures."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with observe(histogram, errors, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class InstrumentedEngine(object):
+    """Engine proxy observing the latency and failures of its calls."""
+
+    def __init__(self, name, engine):
+        """Wrap an engine instance registered under a name."""
+        self._name = name
+        self._engine = engine
+
+    def __getattr__(self, attr):
+        """Return engine attributes, timing and tracing public methods."""
+        value = getattr(self._engine, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+        return traced('{0}.{1}'.format(self._name, attr), kind='CLIENT')(
+            timed(ENGINE_LATENCY, ENGINE_ERRORS, engine=self._name,
+                  operation=attr)(value))
+
+
+class ExecutionsCollector(object):
+    """Report the number of executions per engine and known state."""
+
+    def collect(self):
+        """Count executions in the database."""
+        gauge = GaugeMetricFamily(
+            'renga_deployer_executions',
+            'Executions per engine and last known state.',
+            labels=['engine', 'state'])
+        for engine, state, count in db.session.query(
+                Execution.engine, Execution.state,
+                func.count(Execution.id)).group_by(
+                    Execution.engine, Execution.state):
+            gauge.add_metric([engine or '', state or 'unknown'], count)
+        yield gauge
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    """Remember when a query started."""
+    conn.info.setdefault('renga_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Observe the duration of a query."""
+    start = conn.info['renga_query_start'].pop()
+    DB_LATENCY.labels(statement=statement.split(None, 1)[0].upper()).observe(
+        time.perf_counter() - start)
+
+
+def _multiprocess_dir():
+    """Return the directory shared by processes, if any."""
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get(
+        'prometheus_multiproc_dir')
+
+
+def metrics():
+    """Expose metrics in the Prometheus text format."""
+    if _multiprocess_dir():
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+
+    executions = prometheus_client.CollectorRegistry()
+    executions.register(ExecutionsCollector())
+
+    return Response(
+        prometheus_client.generate_latest(registry) +
+        prometheus_client.generate_latest(executions),
+        mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+class Metrics(object):
+    """Prometheus metrics extension."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        if prometheus_client is None:  # pragma: no cover
+            logger.warning('Install prometheus_client to expose metrics.')
+            return
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/metrics', 'metrics', metrics)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+
+        app.extensions['renga-deployer-metrics'] = self
+        logger.debug('Metrics extension started.')
+
+    @staticmethod
+    def before_request():
+        """Count the request as in progress."""
+        request._metrics_start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(method=request.method).inc()
+
+    @staticmethod
+    def teardown_request(exception=None):
+        """Observe the request duration."""
+        start = getattr(request, '_metrics_start', None)
+        if start is None:
+            return
+
+        REQUESTS_IN_PROGRESS.labels(method=request.method).dec()
+        REQUEST_LATENCY.labels(
+            method=request.method, endpoint=request.endpoint or '').observe(
+                time.perf_counter() - start)
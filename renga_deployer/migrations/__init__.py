@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Database schema migrations.
+
+The schema is versioned with `Alembic`_ and upgraded with::
+
+    $ flask deployer db upgrade
+
+Databases created by ``db.create_all()`` before migrations existed are
+stamped with the initial revision on their first upgrade.
+
+.. _Alembic: https://alembic.sqlalchemy.org/
+"""
+
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+
+from ..models import db
+
+logger = logging.getLogger('renga.deployer.migrations')
+
+INITIAL_REVISION = '2c5c0fa3b1e4'
+"""Revision of the schema created by ``db.create_all()`` before migrations."""
+
+
+def alembic_config():
+    """Return the Alembic configuration for the application database."""
+    config = Config()
+    config.set_main_option('script_location', os.path.dirname(__file__))
+    config.set_main_option(
+        'sqlalchemy.url', str(db.engine.url).replace('%', '%%'))
+    return config
+
+
+def current_revision():
+    """Return the revision of the database schema."""
+    with db.engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def upgrade(revision='head', sql=False):
+    """Upgrade the schema, or print the SQL statements doing it."""
+    config = alembic_config()
+    if not sql and current_revision() is None and \
+            db.engine.has_table('contexts'):
+        logger.info('Stamping tables created without migrations.')
+        command.stamp(config, INITIAL_REVISION)
+    command.upgrade(config, revision, sql=sql)
+
+
+def downgrade(revision, sql=False):
+    """Downgrade the schema, or print the SQL statements doing it."""
+    command.downgrade(alembic_config(), revision, sql=sql)
+
+
+def stamp(revision):
+    """Set the revision of the schema without running migrations."""
+    command.stamp(alembic_config(), revision)
+
+
+def history():
+    """Print the list of revisions."""
+    command.history(alembic_config())
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Alembic environment running inside the Flask application context."""
+
+from alembic import context
+
+from renga_deployer.contrib import knowledge_graph  # noqa: F401
+from renga_deployer.models import db
+
+config = context.config
+
+
+def run_migrations_offline():
+    """Print the SQL statements of the migrations."""
+    context.configure(
+        url=config.get_main_option('sqlalchemy.url'),
+        target_metadata=db.metadata,
+        literal_binds=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Run the migrations on the application database."""
+    with db.engine.connect() as connection:
+        context.configure(
+            connection=connection, target_metadata=db.metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
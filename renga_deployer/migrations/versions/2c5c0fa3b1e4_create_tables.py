@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Create tables.
+
+Revision ID: 2c5c0fa3b1e4
+Revises:
+Create Date: 2026-10-19 09:12:41.318512
+"""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2c5c0fa3b1e4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def json():
+    """Return the JSON column type of the models."""
+    return sa.JSON(none_as_null=True).with_variant(
+        sqlalchemy_utils.types.JSONType(), 'sqlite')
+
+
+def upgrade():
+    """Upgrade the schema."""
+    op.create_table(
+        'contexts',
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=False),
+        sa.Column('id', sqlalchemy_utils.types.UUIDType(), nullable=False),
+        sa.Column('spec', json(), nullable=True),
+        sa.Column('jwt', json(), nullable=True),
+        sa.Column('creator', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'executions',
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=False),
+        sa.Column('id', sqlalchemy_utils.types.UUIDType(), nullable=False),
+        sa.Column('engine', sa.String(), nullable=True),
+        sa.Column('engine_id', sa.String(), nullable=True),
+        sa.Column('namespace', sa.String(), nullable=True),
+        sa.Column('environment', json(), nullable=True),
+        sa.Column('context_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=True),
+        sa.Column('jwt', json(), nullable=True),
+        sa.ForeignKeyConstraint(['context_id'], ['contexts.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    for column in ('engine', 'engine_id'):
+        op.create_index('ix_executions_{0}'.format(column), 'executions',
+                        [column])
+
+    op.create_table(
+        'graph_context',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('context_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=True),
+        sa.ForeignKeyConstraint(['context_id'], ['contexts.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'graph_execution',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('execution_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=True),
+        sa.ForeignKeyConstraint(['execution_id'], ['executions.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    """Downgrade the schema."""
+    op.drop_table('graph_execution')
+    op.drop_table('graph_context')
+    for column in ('engine', 'engine_id'):
+        op.drop_index('ix_executions_{0}'.format(column), 'executions')
+    op.drop_table('executions')
+    op.drop_table('contexts')
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Add the context label index.
+
+Labels of the context specifications are copied to ``context_labels`` so
+that contexts and executions can be filtered by labels.
+
+Revision ID: 4f1d2a7c9b30
+Revises: 8e3b7d1f6a92
+Create Date: 2026-10-19 11:12:40.518203
+"""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+from renga_deployer.utils import split_labels
+
+# revision identifiers, used by Alembic.
+revision = '4f1d2a7c9b30'
+down_revision = '8e3b7d1f6a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the schema."""
+    context_labels = op.create_table(
+        'context_labels',
+        sa.Column('context_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['context_id'], ['contexts.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('context_id', 'key', 'value'),
+    )
+    op.create_index('ix_context_labels_key_value', 'context_labels',
+                    ['key', 'value'])
+
+    if op.get_context().as_sql:
+        return
+
+    contexts = sa.table(
+        'contexts',
+        sa.column('id', sqlalchemy_utils.types.UUIDType()),
+        sa.column('spec', sqlalchemy_utils.types.JSONType()),
+    )
+    rows = []
+    query = sa.select([contexts.c.id, contexts.c.spec])
+    for context_id, spec in op.get_bind().execute(query):
+        rows.extend({
+            'context_id': context_id,
+            'key': key,
+            'value': value,
+        } for key, value in split_labels((spec or {}).get('labels')))
+    if rows:
+        op.bulk_insert(context_labels, rows)
+
+
+def downgrade():
+    """Downgrade the schema."""
+    op.drop_index('ix_context_labels_key_value', 'context_labels')
+    op.drop_table('context_labels')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Add execution columns.
+
+The creator and the last known state of executions are indexed. The
+other columns store the engine resources and port bindings.
+
+Existing executions are given a state so that the scheduler does not take
+them for claims: launched ones are ``unavailable`` until their engine is
+asked again, the others never started and are ``exited``.
+
+Revision ID: 5a7d3e9c2f18
+Revises: 2c5c0fa3b1e4
+Create Date: 2026-10-19 09:30:26.714093
+"""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5a7d3e9c2f18'
+down_revision = '2c5c0fa3b1e4'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('creator', 'state', 'job_name', 'pod_name', 'service_name',
+           'ingress_name')
+JSON_COLUMNS = ('node_ports', 'ports', 'effective_environment')
+INDEXED = ('creator', 'state')
+
+
+def json():
+    """Return the JSON column type of the models."""
+    return sa.JSON(none_as_null=True).with_variant(
+        sqlalchemy_utils.types.JSONType(), 'sqlite')
+
+
+def upgrade():
+    """Upgrade the schema."""
+    with op.batch_alter_table('executions') as batch_op:
+        for column in COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.String(), nullable=True))
+        for column in JSON_COLUMNS:
+            batch_op.add_column(sa.Column(column, json(), nullable=True))
+        for column in INDEXED:
+            batch_op.create_index('ix_executions_{0}'.format(column),
+                                  [column])
+
+    executions = sa.table(
+        'executions', sa.column('engine_id', sa.String()),
+        sa.column('state', sa.String()))
+    op.execute(executions.update().where(
+        executions.c.engine_id.isnot(None)).values(state='unavailable'))
+    op.execute(executions.update().where(
+        executions.c.engine_id.is_(None)).values(state='exited'))
+
+
+def downgrade():
+    """Downgrade the schema."""
+    with op.batch_alter_table('executions') as batch_op:
+        for column in INDEXED:
+            batch_op.drop_index('ix_executions_{0}'.format(column))
+        for column in COLUMNS + JSON_COLUMNS:
+            batch_op.drop_column(column)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Add query indexes.
+
+Executions are listed per context and contexts per creator, both in
+creation order. On PostgreSQL the context specification is stored as
+``jsonb`` with a GIN index for containment queries.
+
+Revision ID: 8e3b7d1f6a92
+Revises: 5a7d3e9c2f18
+Create Date: 2026-10-19 09:47:03.906155
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8e3b7d1f6a92'
+down_revision = '5a7d3e9c2f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the schema."""
+    op.create_index('ix_executions_context_id_created', 'executions',
+                    ['context_id', 'created'])
+    op.create_index('ix_contexts_creator_created', 'contexts',
+                    ['creator', 'created'])
+
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE contexts ALTER COLUMN spec '
+                   'TYPE jsonb USING spec::jsonb')
+        op.create_index('ix_contexts_spec', 'contexts', ['spec'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    """Downgrade the schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index('ix_contexts_spec', 'contexts')
+        op.execute('ALTER TABLE contexts ALTER COLUMN spec '
+                   'TYPE json USING spec::json')
+
+    op.drop_index('ix_contexts_creator_created', 'contexts')
+    op.drop_index('ix_executions_context_id_created', 'executions')
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Add webhooks.
+
+Revision ID: 9b6e2d4c1a57
+Revises: 4f1d2a7c9b30
+Create Date: 2026-10-19 14:05:12.334871
+"""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9b6e2d4c1a57'
+down_revision = '4f1d2a7c9b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the schema."""
+    op.create_table(
+        'webhooks',
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=False),
+        sa.Column('id', sqlalchemy_utils.types.UUIDType(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('secret', sa.String(), nullable=True),
+        sa.Column('context_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=True),
+        sa.Column('execution_id', sqlalchemy_utils.types.UUIDType(),
+                  nullable=True),
+        sa.Column('creator', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['context_id'], ['contexts.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['execution_id'], ['executions.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_webhooks_context_id', 'webhooks', ['context_id'])
+    op.create_index('ix_webhooks_execution_id', 'webhooks', ['execution_id'])
+
+
+def downgrade():
+    """Downgrade the schema."""
+    op.drop_index('ix_webhooks_execution_id', 'webhooks')
+    op.drop_index('ix_webhooks_context_id', 'webhooks')
+    op.drop_table('webhooks')
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Add context specification hashes.
+
+Revision ID: c3a8f5e1d2b4
+Revises: 9b6e2d4c1a57
+Create Date: 2026-10-19 16:42:07.518220
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f5e1d2b4'
+down_revision = '9b6e2d4c1a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Upgrade the schema."""
+    with op.batch_alter_table('contexts') as batch_op:
+        batch_op.add_column(sa.Column('spec_hash', sa.String(),
+                                      nullable=True))
+        batch_op.create_index('ix_contexts_spec_hash', ['spec_hash'],
+                              unique=True)
+
+
+def downgrade():
+    """Downgrade the schema."""
+    with op.batch_alter_table('contexts') as batch_op:
+        batch_op.drop_index('ix_contexts_spec_hash')
+        batch_op.drop_column('spec_hash')
@@ -17,16 +17,23 @@
 # limitations under the License.
 """Models sub-module."""
 
+import hashlib
+import json
 import uuid
 from collections import namedtuple
 from enum import Enum
 
 from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, and_, event, exists
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, attributes
 from sqlalchemy.types import String
 from sqlalchemy_utils.models import Timestamp
 from sqlalchemy_utils.types import JSONType, UUIDType
 
+from .utils import parse_label_selectors, split_labels
+
 db = SQLAlchemy()
 """Core database object."""
 
@@ -37,9 +44,16 @@ def load_jwt():
         return g.jwt
 
 
+def load_creator():
+    """Load the JWT subject from a context."""
+    if has_request_context():
+        return (getattr(g, 'jwt', None) or {}).get('sub')
+
+
 class ExecutionStates(Enum):
     """Valid execution states."""
 
+    QUEUED = 'queued'
     RUNNING = 'running'
     EXITED = 'exited'
     UNAVAILABLE = 'unavailable'
@@ -53,12 +67,17 @@ class Context(db.Model, Timestamp):
     """
 
     __tablename__ = 'contexts'
+    __table_args__ = (
+        db.Index('ix_contexts_creator_created', 'creator', 'created'),
+        db.Index('ix_contexts_spec_hash', 'spec_hash', unique=True),
+    )
 
     id = db.Column(UUIDType, primary_key=True, default=uuid.uuid4)
     """Context identifier."""
 
     spec = db.Column(
-        db.JSON(none_as_null=True).with_variant(JSONType, 'sqlite'))
+        db.JSON(none_as_null=True).with_variant(JSONType, 'sqlite')
+        .with_variant(postgresql.JSONB(none_as_null=True), 'postgresql'))
     """Context specification."""
 
     jwt = db.Column(
@@ -66,17 +85,111 @@ class Context(db.Model, Timestamp):
         default=load_jwt)
     """JWT with which the context has been created."""
 
-    creator = db.Column(String)
+    creator = db.Column(String, default=load_creator)
     """Creator of the context."""
 
+    spec_hash = db.Column(db.String)
+    """Digest of the creator and specification of a deduplicated context."""
+
     @classmethod
-    def create(cls, spec=None):
-        """Create a new context."""
+    def create(cls, spec=None, deduplicate=False):
+        """Create a new context.
+
+        :param deduplicate: set the ``spec_hash`` of the new context
+        """
         if 'ports' in spec:
             spec['ports'] = list(filter(None, spec['ports']))
         context = cls(spec=spec, id=uuid.uuid4())
+        if deduplicate:
+            context.creator = load_creator()
+            context.spec_hash = cls.digest(spec, context.creator)
         return context
 
+    @staticmethod
+    def digest(spec, creator=None):
+        """Return the digest of a specification created by someone.
+
+        >>> digest = Context.digest({'image': 'a', 'ports': ['80']})
+        >>> digest == Context.digest({'ports': ['80'], 'image': 'a'})
+        True
+        >>> digest == Context.digest({'image': 'a', 'ports': ['80']}, 'b')
+        False
+        """
+        return hashlib.sha256(json.dumps(
+            [creator, spec], sort_keys=True, separators=(',', ':'))
+            .encode('utf-8')).hexdigest()
+
+    @classmethod
+    def label_filter(cls, selectors):
+        """Return a filter matching contexts with all label selectors.
+
+        :param selectors: label selectors parsed by
+                          :func:`~renga_deployer.utils.parse_label_selectors`
+        """
+        clauses = []
+        for key, operator, values in parse_label_selectors(selectors):
+            condition = and_(ContextLabel.context_id == cls.id,
+                             ContextLabel.key == key)
+            if values:
+                condition = and_(condition, ContextLabel.value.in_(values))
+            clause = exists().where(condition)
+            clauses.append(~clause if operator in ('!', 'notin') else clause)
+        return and_(*clauses)
+
+
+event.listen(
+    Context.__table__, 'after_create',
+    DDL('CREATE INDEX ix_contexts_spec ON contexts USING gin (spec)')
+    .execute_if(dialect='postgresql'))
+
+
+class ContextLabel(db.Model):
+    """Label of a context indexed by key and value.
+
+    The rows mirror the ``labels`` of the context specification and are
+    updated whenever the specification changes.
+    """
+
+    __tablename__ = 'context_labels'
+    __table_args__ = (db.Index('ix_context_labels_key_value', 'key',
+                               'value'), )
+
+    context_id = db.Column(
+        UUIDType,
+        db.ForeignKey(Context.id, ondelete='CASCADE'),
+        primary_key=True)
+    """Context identifier."""
+
+    key = db.Column(db.String, primary_key=True)
+    """Label key."""
+
+    value = db.Column(db.String, primary_key=True)
+    """Label value, empty for labels without a value."""
+
+    context = db.relationship(
+        Context,
+        backref=db.backref(
+            'label_index', cascade='all, delete-orphan'))
+
+
+@event.listens_for(Session, 'before_flush')
+def index_labels(session, flush_context, instances):
+    """Update the label index of new or changed contexts."""
+    for context in list(session.new) + list(session.dirty):
+        if not isinstance(context, Context) or (
+                context not in session.new and
+                not attributes.get_history(context, 'spec').has_changes()):
+            continue
+
+        labels = set(split_labels((context.spec or {}).get('labels')))
+        for label in list(context.label_index):
+            if (label.key, label.value) in labels:
+                labels.remove((label.key, label.value))
+            else:
+                context.label_index.remove(label)
+        for key, value in sorted(labels):
+            context.label_index.append(ContextLabel(key=key, value=value))
+
 
 class Execution(db.Model, Timestamp):
     """Represent an execution of a context.
@@ -86,6 +199,8 @@ class Execution(db.Model, Timestamp):
     """
 
     __tablename__ = 'executions'
+    __table_args__ = (db.Index('ix_executions_context_id_created',
+                               'context_id', 'created'), )
 
     id = db.Column(UUIDType, primary_key=True, default=uuid.uuid4)
     """Execution identifier."""
@@ -117,11 +232,42 @@ class Execution(db.Model, Timestamp):
         default=load_jwt)
     """JWT with which the execution has been created."""
 
+    creator = db.Column(String, index=True)
+    """Creator of the execution."""
+
+    state = db.Column(db.String, index=True)
+    """Last known state of the execution."""
+
+    job_name = db.Column(db.String)
+    """Name of the Kubernetes job."""
+
+    pod_name = db.Column(db.String)
+    """Name of the Kubernetes pod once the job has been scheduled."""
+
+    service_name = db.Column(db.String)
+    """Name of the Kubernetes service exposing the ports."""
+
+    ingress_name = db.Column(db.String)
+    """Name of the Kubernetes ingress routing to the service."""
+
+    node_ports = db.Column(
+        db.JSON(none_as_null=True).with_variant(JSONType, 'sqlite'))
+    """Node ports allocated to the Kubernetes service."""
+
+    ports = db.Column(
+        db.JSON(none_as_null=True).with_variant(JSONType, 'sqlite'))
+    """Host and port bindings of the running execution."""
+
+    effective_environment = db.Column(
+        db.JSON(none_as_null=True).with_variant(JSONType, 'sqlite'))
+    """Environment of the execution container as reported by the engine."""
+
     @classmethod
     def from_context(cls, context, **kwargs):
         """Create a new execution for a given context."""
         kwargs.setdefault('environment', {})
         kwargs.setdefault('id', uuid.uuid4())
+        kwargs.setdefault('creator', load_creator() or context.creator)
         kwargs['environment']['RENGA_CONTEXT_ID'] = str(context.id)
         execution = cls(context=context, **kwargs)
         return execution
@@ -133,3 +279,45 @@ class Execution(db.Model, Timestamp):
         if not isinstance(states, set):
             states = set(states)
         return engine.get_state(self) in states
+
+
+class Webhook(db.Model, Timestamp):
+    """Callback URL notified of the events of a context or an execution."""
+
+    __tablename__ = 'webhooks'
+
+    id = db.Column(UUIDType, primary_key=True, default=uuid.uuid4)
+    """Webhook identifier."""
+
+    url = db.Column(db.String, nullable=False)
+    """URL receiving the events."""
+
+    secret = db.Column(db.String)
+    """Key signing the deliveries instead of ``DEPLOYER_WEBHOOK_SECRET``."""
+
+    context_id = db.Column(
+        UUIDType, db.ForeignKey(Context.id, ondelete='CASCADE'), index=True)
+    """Context whose executions are notified."""
+
+    execution_id = db.Column(
+        UUIDType, db.ForeignKey(Execution.id, ondelete='CASCADE'),
+        index=True)
+    """Execution that is notified."""
+
+    creator = db.Column(String, default=load_creator)
+    """Creator of the webhook."""
+
+    context = db.relationship(
+        Context,
+        backref=db.backref('webhooks', cascade='all, delete-orphan'))
+
+    execution = db.relationship(
+        Execution,
+        backref=db.backref('webhooks', cascade='all, delete-orphan'))
+
+    @classmethod
+    def of(cls, execution_ids, context_ids):
+        """Return a query of the webhooks notified for many executions."""
+        return cls.query.filter(
+            db.or_(cls.execution_id.in_(execution_ids),
+                   cls.context_id.in_(context_ids)))
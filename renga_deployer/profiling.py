@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""On-demand profiling of live workers.
+
+An administrator starts a profiling session on the worker handling the
+request::
+
+    POST /admin/profiles {"requests": 20, "endpoints": ["/v1/contexts"]}
+
+The next matching requests, or those handled within ``seconds``, are
+profiled either with :mod:`cProfile` (``"mode": "cprofile"``) or by sampling
+the stacks of the request threads (``"mode": "sample"``). The result is
+available from ``GET /admin/profiles/<id>`` as a :mod:`pstats` file or as
+collapsed stacks understood by ``flamegraph.pl`` and speedscope.
+
+Tokens need the ``deployer:admin`` scope. Profiling is refused unless
+token signatures are verified with ``DEPLOYER_JWT_KEY`` and scopes are
+read from ``DEPLOYER_TOKEN_SCOPE_KEY``.
+
+Sessions are local to the worker process that received the ``POST``, while
+the results are written to ``DEPLOYER_PROFILING_DIR`` so that any worker
+can serve them.
+"""
+
+import cProfile
+import logging
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import Blueprint, current_app, jsonify, request, send_file
+from werkzeug.exceptions import BadRequest, Conflict, Forbidden, NotFound
+
+from .authorization import check_token
+
+logger = logging.getLogger('renga.deployer.profiling')
+
+blueprint = Blueprint('renga_deployer_profiling', __name__)
+
+MODES = {'cprofile': 'pstats', 'sample': 'folded'}
+"""Profiling modes and the extension of their result files."""
+
+
+class ProfilingSession(object):
+    """Profile a number of requests or a time window."""
+
+    def __init__(self, mode='cprofile', requests=None, seconds=None,
+                 endpoints=None, interval=0.005, directory=None):
+        """Start a session.
+
+        :param mode: ``cprofile`` or ``sample``
+        :param requests: number of requests to profile
+        :param seconds: length of the profiling window
+        :param endpoints: endpoint names or URL rules to profile, all
+                          endpoints by default
+        :param interval: seconds between stack samples
+        :param directory: directory receiving the result
+        """
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.remaining = requests
+        self.deadline = time.time() + seconds if seconds else None
+        self.endpoints = set(endpoints or ())
+        self.interval = interval
+        self.directory = directory
+        self.profiled = 0
+        self.finished = False
+
+        self._lock = threading.Lock()
+        self._stats = None
+        self._stacks = Counter()
+        self._threads = set()
+        self._sampler = None
+
+        if self.mode == 'sample':
+            self._sampler = threading.Thread(
+                target=self._sample, name='renga-deployer-profiler')
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    @property
+    def path(self):
+        """Return the path of the result file."""
+        return result_path(self.directory, self.id, self.mode)
+
+    @property
+    def expired(self):
+        """Check whether the session should stop profiling."""
+        return (self.remaining is not None and self.remaining <= 0) or (
+            self.deadline is not None and time.time() >= self.deadline)
+
+    def matches(self, endpoint, rule):
+        """Check whether a request should be profiled."""
+        return not self.endpoints or endpoint in self.endpoints or \
+            rule in self.endpoints
+
+    def acquire(self):
+        """Reserve a request slot, returning ``False`` when done."""
+        with self._lock:
+            if self.finished or self.expired:
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+            return True
+
+    def start_request(self):
+        """Start profiling the current request; return a token."""
+        if self.mode == 'sample':
+            ident = threading.current_thread().ident
+            with self._lock:
+                self._threads.add(ident)
+            return ident
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler is active in this process
+            return None
+        return profile
+
+    def stop_request(self, token):
+        """Stop profiling a request and merge its data."""
+        if token is None:
+            return
+
+        with self._lock:
+            self.profiled += 1
+            if self.mode == 'sample':
+                self._threads.discard(token)
+                return
+
+            token.disable()
+            if self._stats is None:
+                self._stats = pstats.Stats(token)
+            else:
+                self._stats.add(token)
+
+    def finish(self):
+        """Write the result file once, unless nothing was profiled."""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            self._threads.clear()
+
+        if self._sampler is not None:
+            self._sampler.join()
+
+        if self.profiled:
+            tmp = self.path + '.tmp'
+            if self.mode == 'sample':
+                with open(tmp, 'w') as output:
+                    for stack, count in sorted(self._stacks.items()):
+                        output.write('{0} {1}\n'.format(stack, count))
+            else:
+                self._stats.dump_stats(tmp)
+            os.rename(tmp, self.path)
+
+        logger.info(
+            'Profiling session {0} finished'.format(self.id),
+            extra={'profiled': self.profiled,
+                   'mode': self.mode})
+
+    def to_dict(self):
+        """Describe the session."""
+        return {
+            'identifier': self.id,
+            'mode': self.mode,
+            'remaining': self.remaining,
+            'deadline': self.deadline,
+            'endpoints': sorted(self.endpoints),
+            'profiled': self.profiled,
+            'finished': self.finished,
+            'pid': os.getpid(),
+        }
+
+    def _sample(self):
+        """Record the stacks of profiled threads until finished."""
+        while not self.finished:
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._stacks[collapse(frame)] += 1
+            time.sleep(self.interval)
+
+
+def collapse(frame):
+    """Return a frame's stack in the collapsed flamegraph format."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('{0}:{1}'.format(
+            os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def result_path(directory, session_id, mode):
+    """Return the result file of a session."""
+    return os.path.join(directory, 'renga-deployer-{0}.{1}'.format(
+        session_id, MODES[mode]))
+
+
+class Profiling(object):
+    """On-demand profiling extension."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        self.session = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.directory = app.config['DEPLOYER_PROFILING_DIR'] or \
+            tempfile.gettempdir()
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.register_blueprint(blueprint)
+
+        app.extensions['renga-deployer-profiling'] = self
+        logger.debug('Profiling extension started.')
+
+    def start(self, **kwargs):
+        """Start a new session unless one is running."""
+        if self.session is not None and not self.session.finished:
+            if not self.session.expired:
+                raise Conflict('A profiling session is already running.')
+            self.session.finish()
+
+        self.session = ProfilingSession(directory=self.directory, **kwargs)
+        logger.info(
+            'Profiling session {0} started'.format(self.session.id),
+            extra={'session': self.session.to_dict()})
+        return self.session
+
+    def before_request(self):
+        """Profile the request if the session asks for it."""
+        session = self.session
+        if session is None or session.finished or \
+                request.blueprint == blueprint.name:
+            return
+
+        if session.expired:
+            session.finish()
+            return
+
+        rule = request.url_rule.rule if request.url_rule else None
+        if session.matches(request.endpoint, rule) and session.acquire():
+            request._profiling = (session, session.start_request())
+
+    @staticmethod
+    def teardown_request(exception=None):
+        """Merge the request profile and finish the session when done."""
+        session, token = getattr(request, '_profiling', (None, None))
+        if session is None:
+            return
+
+        session.stop_request(token)
+        if session.expired:
+            session.finish()
+
+
+def _require_admin():
+    """Check that token signatures and scopes are verified."""
+    # without a key any client could forge the admin scope
+    if not current_app.config['DEPLOYER_JWT_KEY']:
+        raise Forbidden('Profiling requires DEPLOYER_JWT_KEY.')
+    if not current_app.config['DEPLOYER_TOKEN_SCOPE_KEY']:
+        raise Forbidden('Profiling requires DEPLOYER_TOKEN_SCOPE_KEY.')
+
+
+@blueprint.route('/admin/profiles', methods=['POST'])
+@check_token('deployer:admin')
+def start_profile():
+    """Start a profiling session on this worker."""
+    _require_admin()
+    data = request.get_json(silent=True) or {}
+
+    mode = data.get('mode', 'cprofile')
+    if mode not in MODES:
+        raise BadRequest('Unknown mode {0}.'.format(mode))
+
+    requests, seconds = data.get('requests'), data.get('seconds')
+    if not requests and not seconds:
+        raise BadRequest('Set the number of requests or seconds.')
+    limit = current_app.config['DEPLOYER_PROFILING_MAX_SECONDS']
+    if seconds and seconds > limit:
+        raise BadRequest('Profiling is limited to {0} seconds.'.format(limit))
+
+    session = current_app.extensions['renga-deployer-profiling'].start(
+        mode=mode,
+        requests=requests,
+        seconds=seconds or limit,
+        endpoints=data.get('endpoints'))
+    return jsonify(session.to_dict()), 201
+
+
+@blueprint.route('/admin/profiles/<session_id>', methods=['GET'])
+@check_token('deployer:admin')
+def get_profile(session_id):
+    """Return the result of a finished session."""
+    _require_admin()
+    if not re.match(r'^[0-9a-f]{32}$', session_id):
+        raise NotFound('Profiling session not found.')
+    ext = current_app.extensions['renga-deployer-profiling']
+
+    session = ext.session
+    if session is not None and session.id == session_id:
+        if not session.finished and session.expired:
+            session.finish()
+        if not session.finished:
+            return jsonify(session.to_dict()), 202
+
+    for mode in MODES:
+        path = result_path(ext.directory, session_id, mode)
+        if os.path.exists(path):
+            return send_file(
+                path,
+                mimetype='application/octet-stream'
+                if mode == 'cprofile' else 'text/plain',
+                as_attachment=True,
+                attachment_filename=os.path.basename(path))
+
+    raise NotFound('Profiling result not found.')
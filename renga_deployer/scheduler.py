@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fair-share scheduling of execution launches."""
+
+import logging
+import math
+import threading
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, text
+from werkzeug.exceptions import Forbidden
+
+from .models import Execution, ExecutionStates, db
+from .utils import parse_cpu, parse_memory, resource_requests
+
+logger = logging.getLogger('renga.deployer.scheduler')
+
+Usage = namedtuple('Usage', ['executions', 'cpu', 'memory'])
+"""Resources held by the active executions of a creator."""
+
+ADMISSION_LOCK = 0x72656e6761
+"""Key of the PostgreSQL advisory lock serializing admissions."""
+
+
+class Scheduler(object):
+    """Admit launch requests by weighted fair share across creators.
+
+    Launch requests are stored as executions in the ``queued`` state. As long
+    as there is capacity left, the creator with the lowest weighted number of
+    active executions gets its oldest queued execution launched, provided that
+    it fits in the creator's quotas.
+
+    Admitted executions are claimed in the database before they are
+    launched, so that every process sees their resources as held and a
+    queued execution is launched once. The launches run in a thread of the
+    process with its own application context, so the request that admitted
+    them does not wait for the engines.
+    """
+
+    def __init__(self, deployer):
+        """Create a scheduler launching executions with a deployer."""
+        self.deployer = deployer
+        self._lock = threading.Lock()
+        self._watching = False
+        self._admitted = deque()
+        self._launcher = None
+
+    @property
+    def capacity(self):
+        """Maximum number of concurrently active executions."""
+        return current_app.config.get('DEPLOYER_SCHEDULER_CAPACITY')
+
+    @property
+    def quota(self):
+        """Per creator quotas; ``None`` values are unlimited."""
+        config = current_app.config
+        cpu = config.get('DEPLOYER_QUOTA_CPU')
+        memory = config.get('DEPLOYER_QUOTA_MEMORY')
+        return Usage(
+            executions=config.get('DEPLOYER_QUOTA_EXECUTIONS'),
+            cpu=parse_cpu(cpu) if cpu is not None else None,
+            memory=parse_memory(memory) if memory is not None else None)
+
+    @property
+    def enabled(self):
+        """Check whether launches have to go through the queue."""
+        return self.capacity is not None or any(
+            limit is not None for limit in self.quota)
+
+    def weight(self, creator):
+        """Return the fair share weight of a creator."""
+        weights = current_app.config.get('DEPLOYER_SCHEDULER_WEIGHTS') or {}
+        return weights.get(creator, 1)
+
+    @property
+    def claim_timeout(self):
+        """Time an admitted or unavailable execution holds its resources."""
+        return timedelta(
+            seconds=current_app.config['DEPLOYER_SCHEDULER_CLAIM_TIMEOUT'])
+
+    def active(self):
+        """Return executions holding or claiming engine resources.
+
+        Claims and unavailable executions expire after the claim timeout.
+        """
+        expiry = datetime.utcnow() - self.claim_timeout
+        return Execution.query.filter(
+            or_(
+                # claimed executions have no state until they are launched
+                and_(
+                    Execution.engine_id.is_(None),
+                    Execution.state.is_(None),
+                    Execution.updated >= expiry),
+                and_(
+                    Execution.engine_id.isnot(None),
+                    or_(
+                        Execution.state.is_(None),
+                        Execution.state == ExecutionStates.RUNNING.value,
+                        and_(
+                            Execution.state ==
+                            ExecutionStates.UNAVAILABLE.value,
+                            Execution.updated >= expiry)))))
+
+    def queued(self):
+        """Return queued executions in submission order."""
+        return Execution.query.filter_by(
+            state=ExecutionStates.QUEUED.value).order_by(Execution.created)
+
+    def usage(self):
+        """Return the resources held by active executions per creator.
+
+        The stored states are used; exits noticed by the deployer schedule
+        the queued executions again.
+        """
+        usage = defaultdict(lambda: Usage(0, 0.0, 0))
+        for execution in self.active():
+            self._acquire(usage, execution)
+        return usage
+
+    def submit(self, execution):
+        """Queue an execution for launch."""
+        requested = resource_requests(execution.context.spec)
+        quota = self.quota
+        if (quota.cpu is not None and requested['cpu'] > quota.cpu) or (
+                quota.memory is not None
+                and requested['memory'] > quota.memory):
+            raise Forbidden('Requested resources exceed the quota.')
+
+        execution.state = ExecutionStates.QUEUED.value
+        logger.info(
+            'Queued execution {0} of context {1}'.format(
+                execution.id, execution.context.id),
+            extra={'creator': execution.creator})
+        return execution
+
+    def schedule(self):
+        """Admit queued executions while capacity and quotas allow it.
+
+        The admitted executions are returned and launched in the background.
+        """
+        with self._lock:
+            admitted = self._admit()
+        if admitted:
+            self._hand_over([execution.id for execution in admitted])
+
+        if self.queued().first() is not None:
+            self.watch()
+        return admitted
+
+    def launch(self, ids):
+        """Launch the claimed executions with the given identifiers."""
+        claimed = Execution.query.filter(
+            Execution.id.in_(ids), Execution.engine_id.is_(None),
+            Execution.state.is_(None)).all()
+
+        launched = []
+        for execution in claimed:
+            try:
+                self.deployer._launch(execution)
+            except Exception:
+                logger.exception(
+                    'Launching queued execution {0} failed'.format(
+                        execution.id))
+                self.deployer._fail(execution)
+            else:
+                launched.append(execution)
+            db.session.commit()
+
+        if len(launched) < len(claimed):
+            # failed launches free their claims
+            self.schedule()
+        return launched
+
+    def join(self, timeout=None):
+        """Wait until the admitted executions are launched."""
+        with self._lock:
+            launcher = self._launcher
+        if launcher is not None:
+            launcher.join(timeout)
+
+    def watch(self):
+        """Refresh the active executions while executions are queued."""
+        watcher = current_app.extensions.get('renga-deployer-watcher')
+        if watcher is None:
+            return
+        with self._lock:
+            if self._watching:
+                return
+            self._watching = True
+        watcher.add_listener(self.refresh, self._launched)
+
+    def refresh(self):
+        """Admit queued executions once others have exited.
+
+        The watcher has refreshed the launched active executions before, and
+        the deployer schedules again when one of them has exited.
+        """
+        if self.queued().first() is None:
+            with self._lock:
+                self._watching = False
+            current_app.extensions['renga-deployer-watcher'].remove_listener(
+                self.refresh)
+            return
+
+        # expired claims and unavailable executions free resources too
+        self.schedule()
+
+    def _launched(self):
+        """Return a query of the launched active executions."""
+        return self.active().filter(Execution.engine_id.isnot(None))
+
+    def _hand_over(self, ids):
+        """Launch admitted executions in the background."""
+        app = current_app._get_current_object()
+        with self._lock:
+            self._admitted.extend(ids)
+            if self._launcher is None:
+                self._launcher = threading.Thread(
+                    target=self._run, args=(app, ),
+                    name='renga-deployer-launcher')
+                self._launcher.daemon = True
+                self._launcher.start()
+
+    def _run(self, app):
+        """Launch the admitted executions until none is left."""
+        while True:
+            with self._lock:
+                if not self._admitted:
+                    self._launcher = None
+                    return
+                ids = list(self._admitted)
+                self._admitted.clear()
+
+            with app.app_context():
+                try:
+                    self.launch(ids)
+                except Exception:
+                    logger.exception('Launching admitted executions failed')
+                finally:
+                    db.session.remove()
+
+    def _admit(self):
+        """Claim the queued executions that can be launched now."""
+        # the lock is held until the claims are committed
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                               {'key': ADMISSION_LOCK})
+
+        # claims of processes that did not launch them are queued again
+        now = datetime.utcnow()
+        Execution.query.filter(
+            Execution.engine_id.is_(None), Execution.state.is_(None),
+            Execution.updated < now - self.claim_timeout).update(
+                {'state': ExecutionStates.QUEUED.value, 'updated': now},
+                synchronize_session=False)
+
+        usage = self.usage()
+        total = sum(held.executions for held in usage.values())
+        pending = self._by_creator(self.queued().all())
+        admitted = []
+
+        while pending:
+            if self.capacity is not None and total >= self.capacity:
+                break
+
+            creator = self._next_creator(pending, usage)
+            execution = pending[creator][0]
+            if not self._fits(usage[creator], execution):
+                # the creator is at its quota; let the others proceed
+                del pending[creator]
+                continue
+
+            pending[creator].popleft()
+            if not pending[creator]:
+                del pending[creator]
+
+            # another process may have claimed or stopped it meanwhile
+            claimed = Execution.query.filter_by(
+                id=execution.id, state=ExecutionStates.QUEUED.value).update(
+                    {'state': None, 'updated': datetime.utcnow()},
+                    synchronize_session='evaluate')
+            if not claimed:
+                continue
+
+            self._acquire(usage, execution)
+            total += 1
+            admitted.append(execution)
+
+        db.session.commit()
+        return admitted
+
+    def queue(self):
+        """Return queued executions in their expected admission order."""
+        usage = self.usage()
+        pending = self._by_creator(self.queued().all())
+        order = []
+
+        while pending:
+            creator = self._next_creator(pending, usage)
+            execution = pending[creator].popleft()
+            if not pending[creator]:
+                del pending[creator]
+            self._acquire(usage, execution)
+            order.append(execution)
+
+        return order
+
+    def queue_position(self, execution):
+        """Return the number of executions admitted before a queued one."""
+        return [queued.id for queued in self.queue()].index(execution.id)
+
+    def queue_estimates(self):
+        """Return the positions and expected waits of queued executions.
+
+        The queue order and the average duration are computed once for all
+        queued executions, whose identifiers are the keys of the result.
+        """
+        duration = self.average_duration()
+        return {
+            execution.id: (position, self._wait(position, duration))
+            for position, execution in enumerate(self.queue())
+        }
+
+    def expected_wait(self, execution, position=None):
+        """Estimate the number of seconds until a queued execution starts.
+
+        The estimate assumes that active executions finish at the pace of
+        recently exited ones. ``None`` is returned without such history.
+        """
+        duration = self.average_duration()
+        if duration is None:
+            return None
+
+        if position is None:
+            position = self.queue_position(execution)
+        return self._wait(position, duration)
+
+    def average_duration(self, limit=100):
+        """Return the average duration of recently exited executions."""
+        exited = Execution.query.filter(
+            Execution.engine_id.isnot(None),
+            Execution.state == ExecutionStates.EXITED.value).order_by(
+                Execution.updated.desc()).limit(limit).all()
+        if not exited:
+            return None
+        return sum((execution.updated - execution.created).total_seconds()
+                   for execution in exited) / len(exited)
+
+    def _wait(self, position, duration):
+        """Return the wait at a queue position given execution durations."""
+        if duration is None:
+            return None
+        slots = self.capacity or self.quota.executions or 1
+        return duration * math.ceil((position + 1) / slots)
+
+    def _next_creator(self, pending, usage):
+        """Pick the creator with the lowest weighted share."""
+        return min(
+            pending,
+            key=lambda creator: (
+                usage[creator].executions / self.weight(creator),
+                pending[creator][0].created))
+
+    def _fits(self, held, execution):
+        """Check that an execution fits in the creator's quotas."""
+        quota = self.quota
+        requested = resource_requests(execution.context.spec)
+        return not any((
+            quota.executions is not None
+            and held.executions + 1 > quota.executions,
+            quota.cpu is not None and held.cpu + requested['cpu'] > quota.cpu,
+            quota.memory is not None
+            and held.memory + requested['memory'] > quota.memory,
+        ))
+
+    @staticmethod
+    def _acquire(usage, execution):
+        """Account the resources of an execution to its creator."""
+        requested = resource_requests(execution.context.spec)
+        held = usage[execution.creator]
+        usage[execution.creator] = Usage(
+            executions=held.executions + 1,
+            cpu=held.cpu + requested['cpu'],
+            memory=held.memory + requested['memory'])
+
+    @staticmethod
+    def _by_creator(executions):
+        """Group executions by creator preserving their order."""
+        pending = OrderedDict()
+        for execution in executions:
+            pending.setdefault(execution.creator, deque()).append(execution)
+        return pending
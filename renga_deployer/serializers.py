@@ -17,10 +17,94 @@
 # limitations under the License.
 """Model serializers."""
 
-from flask import current_app
-from marshmallow import Schema, fields, post_dump, post_load, pre_dump
+from functools import lru_cache
 
-from .models import Context, Execution
+from flask import Response, current_app, request
+from marshmallow import Schema, ValidationError, fields, post_dump, \
+    post_load, pre_dump, validates
+from sqlalchemy import func, or_
+from werkzeug.exceptions import BadRequest
+
+from .dumper import dumper, dumps
+from .models import Context, Execution, ExecutionStates, Webhook, db
+from .utils import entity_tag, parse_resources
+
+
+def json_response(data, status=200, headers=None):
+    """Return a response with JSON encoded data."""
+    return Response(
+        dumps(data), status, headers, mimetype='application/json')
+
+
+def conditional_dump(schema, obj):
+    """Dump an object with its ETag unless the client already has it.
+
+    The tag is computed by ``schema.etag`` from the stored columns, so an
+    unchanged representation is answered with ``304 Not Modified`` without
+    being serialized. Live execution states are read from the engines with
+    one request per engine before the tag is computed, so an execution that
+    exited changes the tag. Otherwise the object is dumped by the
+    precompiled :class:`~renga_deployer.dumper.Dumper` of the schema.
+    """
+    dumped = refresh_states(schema, obj if schema.many else [obj])
+    etag = _entity_tag(schema, obj)
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': '"{0}"'.format(etag)}
+    data = dumper(dumped).dump(obj)
+    return json_response(data, 200, {'ETag': '"{0}"'.format(etag)})
+
+
+def refresh_states(schema, executions):
+    """Store the engine states of executions dumped live.
+
+    The result is the schema dumping the refreshed executions without
+    asking the engines again.
+    """
+    if not isinstance(schema, ExecutionSchema) or \
+            schema.context.get('state', 'live') != 'live' or \
+            'state' not in schema.fields:
+        return schema
+
+    current_app.extensions['renga-deployer'].deployer.get_states([
+        execution for execution in executions
+        if execution.engine_id and
+        execution.state != ExecutionStates.EXITED.value
+    ])
+    only = tuple(sorted(schema.only)) if schema.only else None
+    return _cached_schema(type(schema), schema.many, only, 'cached')
+
+
+def _entity_tag(schema, obj):
+    """Return the entity tag of an object dumped by a schema."""
+    # sparse representations of the same objects have their own tags
+    return entity_tag(
+        schema.etag(obj), sorted(schema.fields), schema.context.get('state'))
+
+
+@lru_cache(maxsize=128)
+def _cached_schema(schema_class, many, only, state):
+    """Return a shared schema instance for the given options."""
+    exclude = STATE_FIELDS if state == 'none' else ()
+    return schema_class(
+        many=many, only=only, exclude=exclude, context={'state': state})
+
+
+def sparse_schema(schema_class, many=False, fields=None, state='live'):
+    """Return a schema dumping only the requested fields.
+
+    :param fields: names of the dumped fields, all of them by default
+    :param state: ``live`` reads the state of launched executions from
+                  their engine, ``cached`` dumps the stored state and
+                  ``none`` leaves the state out
+    """
+    only = None
+    if fields:
+        unknown = set(fields) - set(schema_class._declared_fields)
+        if unknown:
+            raise BadRequest('Unknown fields: {0}'.format(
+                ', '.join(sorted(unknown))))
+        only = tuple(sorted(set(fields)))
+    return _cached_schema(schema_class, many, only, state)
 
 
 class SpecificationSchema(Schema):
@@ -32,9 +116,16 @@ class SpecificationSchema(Schema):
     resources = fields.Dict()
     volumeMounts = fields.List(fields.Dict)
     volumes = fields.List(fields.Dict)
-    resources = fields.Dict()
     env = fields.List(fields.Dict)
 
+    @validates('resources')
+    def validate_resources(self, resources):
+        """Check that resource quantities can be parsed."""
+        try:
+            parse_resources(resources)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
 
 class ContextSchema(Schema):
     """Context schema for use with REST API."""
@@ -51,16 +142,30 @@ class ContextSchema(Schema):
             return {'contexts': data}
         return data
 
+    def etag(self, obj):
+        """Return the entity tag of one or many contexts."""
+        contexts = obj if self.many else [obj]
+        return entity_tag([(context.id, context.updated)
+                           for context in contexts])
+
     @post_load
     def make_context(self, data):
         """Create a context."""
         return Context(**data)
 
 
+STATE_FIELDS = ('state', 'queue_position', 'expected_wait')
+"""Execution fields left out of responses with ``state=none``."""
+
+QUEUE_FIELDS = {'queue_position', 'expected_wait'}
+"""Execution fields computed from the queue of the scheduler."""
+
+
 class ExecutionSchema(Schema):
     """Execution schema for use with REST API."""
 
     identifier = fields.UUID(attribute='id', dump_only=True)
+    context_id = fields.UUID(dump_only=True)
     engine = fields.String(required=True)
     environment = fields.Dict()
     engine_id = fields.String(load_only=True)
@@ -68,14 +173,35 @@ class ExecutionSchema(Schema):
     namespace = fields.String(default='default')
     created = fields.DateTime(attribute='created', dump_only=True)
     state = fields.String(dump_only=True)
+    queue_position = fields.Integer(dump_only=True)
+    expected_wait = fields.Float(dump_only=True)
+
+    @pre_dump(pass_many=True)
+    def get_queue_estimates(self, obj, many):
+        """Get the queue positions and waits of queued executions."""
+        executions = obj if many else [obj]
+        queued = [
+            execution for execution in executions
+            if execution.engine_id is None and
+            execution.state == ExecutionStates.QUEUED.value
+        ]
+        if queued and self.fields.keys() & QUEUE_FIELDS:
+            # the queue is ordered once for all dumped executions
+            scheduler = current_app.extensions['renga-deployer'].deployer \
+                .scheduler
+            estimates = scheduler.queue_estimates()
+            for execution in queued:
+                execution.queue_position, execution.expected_wait = \
+                    estimates.get(execution.id, (None, None))
+        return obj
 
     @pre_dump
     def get_state(self, execution):
         """Get state of an execution."""
-        if execution.engine_id:
-            execution.state = current_app.extensions[
-                'renga-deployer'].deployer.ENGINES[
-                    execution.engine]().get_state(execution).value
+        if execution.engine_id and 'state' in self.fields and \
+                self.context.get('state', 'live') == 'live':
+            current_app.extensions['renga-deployer'].deployer.get_state(
+                execution)
         return execution
 
     @post_dump(pass_many=True)
@@ -85,7 +211,50 @@ class ExecutionSchema(Schema):
             return {'executions': data}
         return data
 
+    def etag(self, obj):
+        """Return the entity tag of one or many executions.
+
+        The tag depends on the stored states, which are refreshed first
+        for live representations by :func:`conditional_dump`.
+        """
+        executions = obj if self.many else [obj]
+        values = [(execution.id, execution.updated, execution.state)
+                  for execution in executions]
+        if self.fields.keys() & QUEUE_FIELDS and any(
+                execution.state == ExecutionStates.QUEUED.value
+                for execution in executions):
+            # positions and estimates depend on the unfinished executions
+            values.append(db.session.query(
+                func.count(Execution.id), func.max(Execution.updated)).filter(
+                    or_(Execution.state.is_(None),
+                        Execution.state != ExecutionStates.EXITED.value))
+                .one())
+        return entity_tag(values)
+
     @post_load
     def make_execution(self, data):
         """Create an execution."""
         return Execution(**data)
+
+
+class WebhookSchema(Schema):
+    """Webhook schema for use with REST API."""
+
+    identifier = fields.UUID(attribute='id', dump_only=True)
+    url = fields.Url(required=True)
+    secret = fields.String(load_only=True)
+    context_id = fields.UUID(dump_only=True)
+    execution_id = fields.UUID(dump_only=True)
+    created = fields.DateTime(attribute='created', dump_only=True)
+
+    @post_dump(pass_many=True)
+    def add_envelope(self, data, many):
+        """Add envelope if needed."""
+        if many:
+            return {'webhooks': data}
+        return data
+
+    @post_load
+    def make_webhook(self, data):
+        """Create a webhook."""
+        return Webhook(**data)
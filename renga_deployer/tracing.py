@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Lightweight request tracing.
+
+A trace is started for every sampled request. Its identifier is taken from
+the W3C ``traceparent`` header when present, so that the deployer spans join
+the trace of the caller. Spans are written as `Zipkin v2`_ JSON objects, one
+per line, once the request is finished.
+
+.. _Zipkin v2: https://zipkin.io/zipkin-api/#/default/post_spans
+"""
+
+import binascii
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('renga.deployer.tracing')
+
+TRACEPARENT = re.compile(
+    r'^00-(?P<trace_id>[0-9a-f]{32})-(?P<parent_id>[0-9a-f]{16})-'
+    r'(?P<flags>[0-9a-f]{2})$')
+"""Format of the W3C ``traceparent`` header."""
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def _random_id(size):
+    """Return a random hexadecimal identifier of ``size`` bytes."""
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class Trace(object):
+    """Spans recorded while handling one request."""
+
+    def __init__(self, trace_id=None, parent_id=None, service_name=None):
+        """Start a trace, possibly continuing a remote one."""
+        self.trace_id = trace_id or _random_id(16)
+        self.parent_id = parent_id
+        self.service_name = service_name or 'renga-deployer'
+        self.spans = []
+        self.stack = []
+
+    @property
+    def current_id(self):
+        """Return the identifier of the innermost open span."""
+        if self.stack:
+            return self.stack[-1]['id']
+        return self.parent_id
+
+    def start(self, name, kind=None, **tags):
+        """Open a span as a child of the innermost open span."""
+        span = {
+            'traceId': self.trace_id,
+            'id': _random_id(8),
+            'name': name,
+            'timestamp': int(time.time() * 1e6),
+            'localEndpoint': {'serviceName': self.service_name},
+            'tags': {key: str(value) for key, value in tags.items()},
+            '_start': time.perf_counter(),
+        }
+        if self.current_id:
+            span['parentId'] = self.current_id
+        if kind:
+            span['kind'] = kind
+        self.stack.append(span)
+        return span
+
+    def finish(self, span, error=None):
+        """Close a span and record it."""
+        span['duration'] = max(
+            int((time.perf_counter() - span.pop('_start')) * 1e6), 1)
+        if error is not None:
+            span['tags']['error'] = repr(error)
+        self.stack.remove(span)
+        self.spans.append(span)
+
+    def traceparent(self):
+        """Return a ``traceparent`` header value for outgoing requests."""
+        return '00-{0}-{1}-01'.format(self.trace_id, self.current_id)
+
+
+def current_trace():
+    """Return the trace of the current thread, if it is sampled."""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name, kind=None, **tags):
+    """Record the duration of a block in the current trace."""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+
+    record = trace.start(name, kind=kind, **tags)
+    try:
+        yield record
+    except Exception as error:
+        trace.finish(record, error=error)
+        raise
+    else:
+        trace.finish(record)
+
+
+def traced(name, kind=None):
+    """Decorate a function to record its calls as spans."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, kind=kind):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracedClient(object):
+    """Client proxy recording the calls of its public methods as spans."""
+
+    def __init__(self, name, client):
+        """Wrap a client, naming its spans ``<name>.<method>``."""
+        self._name = name
+        self._client = client
+
+    def __getattr__(self, attr):
+        """Return client attributes, tracing public methods."""
+        value = getattr(self._client, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+        return traced('{0}.{1}'.format(self._name, attr), kind='CLIENT')(value)
+
+
+def inject(headers=None):
+    """Add the ``traceparent`` header to outgoing request headers."""
+    trace = current_trace()
+    if trace is None:
+        return headers
+
+    headers = dict(headers or {})
+    headers['traceparent'] = trace.traceparent()
+    return headers
+
+
+class SpanWriter(object):
+    """Write finished spans as JSON lines to a file or standard output."""
+
+    def __init__(self, output=None):
+        """Write to ``output`` path, or to standard output for ``-``."""
+        self.output = output or '-'
+
+    def write(self, spans):
+        """Append spans to the output."""
+        lines = ''.join(
+            json.dumps(span, sort_keys=True) + '\n' for span in spans)
+        with _lock:
+            if self.output == '-':
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+            else:
+                with open(self.output, 'a') as output:
+                    output.write(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    """Open a span for a database query."""
+    trace = current_trace()
+    if trace is not None:
+        conn.info.setdefault('renga_spans', []).append(
+            trace.start('db.query', kind='CLIENT',
+                        statement=statement.split(None, 1)[0].upper()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Close the span of a database query."""
+    spans = conn.info.get('renga_spans')
+    trace = current_trace()
+    if spans and trace is not None:
+        trace.finish(spans.pop())
+
+
+def _handle_error(context):
+    """Close the span of a failed database query."""
+    spans = context.connection.info.get('renga_spans') \
+        if context.connection is not None else None
+    trace = current_trace()
+    if spans and trace is not None:
+        trace.finish(spans.pop(), error=context.original_exception)
+
+
+class Tracing(object):
+    """Request tracing extension."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.sample_rate = app.config['DEPLOYER_TRACING_SAMPLE_RATE']
+        self.service_name = app.config['DEPLOYER_TRACING_SERVICE_NAME']
+        self.writer = SpanWriter(app.config['DEPLOYER_TRACING_OUTPUT'])
+
+        # connexion registers the API handlers before extensions are loaded
+        for endpoint, view in list(app.view_functions.items()):
+            app.view_functions[endpoint] = traced(
+                'handler {0}'.format(endpoint))(view)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.extensions['renga-deployer-tracing'] = self
+        logger.debug('Tracing extension started.')
+
+    def sampled(self, flags=None):
+        """Decide whether a request is traced."""
+        if flags is not None and int(flags, 16) & 1:
+            return True
+        return random.random() < self.sample_rate
+
+    def before_request(self):
+        """Start a trace, continuing the caller's one if any."""
+        _local.trace = None
+
+        match = TRACEPARENT.match(request.headers.get('traceparent', ''))
+        parent = match.groupdict() if match else {}
+        if not self.sampled(parent.get('flags')):
+            return
+
+        trace = _local.trace = Trace(
+            trace_id=parent.get('trace_id'),
+            parent_id=parent.get('parent_id'),
+            service_name=self.service_name)
+        trace.start(
+            '{0} {1}'.format(request.method, request.url_rule or request.path),
+            kind='SERVER', **{'http.method': request.method,
+                              'http.path': request.path})
+
+    @staticmethod
+    def after_request(response):
+        """Return the trace identifier to the caller."""
+        trace = current_trace()
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+            if trace.stack:
+                trace.stack[0]['tags']['http.status_code'] = str(
+                    response.status_code)
+        return response
+
+    def teardown_request(self, exception=None):
+        """Finish the trace and export its spans."""
+        trace = current_trace()
+        _local.trace = None
+        if trace is None:
+            return
+
+        while trace.stack:
+            trace.finish(trace.stack[-1], error=exception)
+
+        try:
+            self.writer.write(trace.spans)
+        except Exception:
+            logger.exception('Exporting trace {0} failed'.format(
+                trace.trace_id))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stream contexts and executions as newline delimited JSON.
+
+The listings answer requests accepting ``application/x-ndjson`` with one
+object per line. Rows are read in batches of ``DEPLOYER_STREAM_BATCH_SIZE``
+with server-side cursors where the database supports them, and written as
+soon as they are serialized, so memory does not grow with the listing.
+Streamed executions have their stored state, as reading live states from
+the engines would hold the stream.
+
+The command line moves the history of a deployer to another database::
+
+    $ flask deployer export history.ndjson
+    $ flask deployer import history.ndjson
+
+Exports contain every column of the contexts, the executions and then the
+webhooks. Imports insert them in bulk, skipping the rows that already exist,
+so an interrupted import can be run again.
+
+The knowledge graph mapping is not exported, as its vertices belong to the
+graph of the exporting deployer. When the importing deployer has the
+knowledge graph extension, the contexts and executions of each batch are
+registered as new vertices of its graph.
+"""
+
+import json
+import uuid
+from datetime import datetime
+from itertools import islice
+
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import DateTime
+from sqlalchemy_utils.types import UUIDType
+
+from .deployer import contexts_imported, executions_imported
+from .dumper import dumper, dumps
+from .models import Context, ContextLabel, Execution, Webhook, db
+from .utils import split_labels
+
+NDJSON = 'application/x-ndjson'
+"""Media type of newline delimited JSON."""
+
+MODELS = (Context, Execution, Webhook)
+"""Exported models in the order of their foreign keys."""
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def wants_ndjson():
+    """Check whether the client prefers newline delimited JSON."""
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def stream(schema, query):
+    """Return a response streaming one serialized object per line."""
+    batch_size = current_app.config['DEPLOYER_STREAM_BATCH_SIZE']
+
+    def generate():
+        compiled = dumper(schema)
+        rows = iter(query.enable_eagerloads(False).yield_per(batch_size))
+        while True:
+            # hooks of many objects, like queue estimates, run per batch
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            for obj in compiled.prepare(batch):
+                yield dumps(compiled.dump_one(obj))
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def _encode(value):
+    """Return a JSON compatible column value."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
+
+
+def _decode(column, value):
+    """Return the column value of an exported JSON value."""
+    if value is None:
+        return value
+    if isinstance(column.type, UUIDType):
+        return uuid.UUID(value)
+    if isinstance(column.type, DateTime):
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    return value
+
+
+def _default(column):
+    """Return the default value of a column missing from an export."""
+    default = column.default
+    if default is None:
+        return None
+    return default.arg(None) if default.is_callable else default.arg
+
+
+def export_lines(batch_size=None):
+    """Yield every context, execution and webhook as a line of JSON."""
+    batch_size = batch_size or current_app.config[
+        'DEPLOYER_STREAM_BATCH_SIZE']
+    for model in MODELS:
+        columns = model.__table__.columns
+        for row in db.session.query(*columns).yield_per(batch_size):
+            yield json.dumps({
+                'table': model.__tablename__,
+                'row': {
+                    column.key: _encode(value)
+                    for column, value in zip(columns, row)
+                },
+            }, sort_keys=True) + '\n'
+
+
+class Importer(object):
+    """Insert exported rows in batches."""
+
+    def __init__(self, batch_size=None):
+        """Prepare empty batches."""
+        self.batch_size = batch_size or current_app.config[
+            'DEPLOYER_STREAM_BATCH_SIZE']
+        self.models = {model.__tablename__: model for model in MODELS}
+        self.pending = {model: [] for model in MODELS}
+        self.counts = {model.__tablename__: 0 for model in MODELS}
+        self.skipped = 0
+
+    def add(self, line):
+        """Queue a line of an export."""
+        record = json.loads(line)
+        model = self.models[record['table']]
+        self.pending[model].append({
+            column.key: _decode(column, record['row'][column.key])
+            if column.key in record['row'] else _default(column)
+            for column in model.__table__.columns
+        })
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the queued rows."""
+        # rows reference the contexts and executions of the same or earlier
+        # batches
+        for model in MODELS:
+            rows, self.pending[model] = self.pending[model], []
+            if rows:
+                self._insert(model, rows)
+        db.session.commit()
+
+    def _insert(self, model, rows):
+        """Insert the rows of a model that do not exist yet."""
+        existing = {
+            id for id, in db.session.query(model.id).filter(
+                model.id.in_([row['id'] for row in rows]))
+        }
+        rows = [row for row in rows if row['id'] not in existing]
+        self.skipped += len(existing)
+        if not rows:
+            return
+
+        # the values are inserted as exported, without column defaults
+        if model is Context:
+            # receivers may register the contexts and update their labels
+            contexts_imported.send(rows)
+            db.session.execute(Context.__table__.insert(), rows)
+            labels = [
+                {'context_id': row['id'], 'key': key, 'value': value}
+                for row in rows
+                for key, value in sorted(set(
+                    split_labels((row['spec'] or {}).get('labels'))))
+            ]
+            if labels:
+                db.session.execute(ContextLabel.__table__.insert(), labels)
+        else:
+            if model is Execution:
+                executions_imported.send(rows)
+            db.session.execute(model.__table__.insert(), rows)
+        self.counts[model.__tablename__] += len(rows)
+
+
+def import_lines(lines, batch_size=None):
+    """Insert the contexts, executions and webhooks of an export.
+
+    :returns: an :class:`Importer` with the numbers of inserted rows
+    """
+    importer = Importer(batch_size=batch_size)
+    for line in lines:
+        if line.strip():
+            importer.add(line)
+    importer.flush()
+    return importer
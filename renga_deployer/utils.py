@@ -17,8 +17,12 @@
 # limitations under the License.
 """Utility functions."""
 
+import hashlib
+import math
+import re
 import time
 import uuid
+from collections import OrderedDict
 from functools import wraps
 from inspect import signature
 
@@ -39,6 +43,15 @@ def decode_bytes(func):
     return wrapper
 
 
+def entity_tag(*values):
+    """Return a strong entity tag of the values a representation depends on.
+
+    >>> entity_tag('a', 1) == entity_tag('a', 1) != entity_tag('a', 2)
+    True
+    """
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
 def resource_available(func):
     """
     Function wrapper to catch that something is not available.
@@ -75,6 +88,180 @@ def dict_from_labels(labels, separator='='):
             raw.split(separator, 1) for raw in labels)))
 
 
+def split_labels(labels, separator='='):
+    """Return the unique key and value pairs of label strings.
+
+    >>> split_labels(['project=42', 'gpu', 'project=42'])
+    [('gpu', ''), ('project', '42')]
+    """
+    return sorted({
+        (key.strip(), value.strip())
+        for key, _, value in (raw.partition(separator)
+                              for raw in labels or [])
+    })
+
+
+LABEL_KEY = r'(?P<key>[^\s!=(),]+)'
+
+LABEL_SELECTORS = (
+    (re.compile(r'^(?P<operator>!?)\s*' + LABEL_KEY + r'$'), None),
+    (re.compile('^' + LABEL_KEY +
+                r'\s*(?P<operator>==|=|!=)\s*(?P<values>.*)$'), None),
+    (re.compile('^' + LABEL_KEY + r'\s+(?P<operator>in|notin)\s*'
+                r'\((?P<values>[^()]*)\)$'), ','),
+)
+"""Label selector syntax of Kubernetes: ``key``, ``!key``, ``key=value``,
+``key!=value``, ``key in (a,b)`` and ``key notin (a,b)``."""
+
+
+def parse_label_selector(selector):
+    """Parse a label selector into a key, an operator and values.
+
+    The operator is ``exists``, ``!``, ``in`` or ``notin``:
+
+    >>> parse_label_selector('project=42')
+    ('project', 'in', ['42'])
+    >>> parse_label_selector('stage notin (dev, test)')
+    ('stage', 'notin', ['dev', 'test'])
+    >>> parse_label_selector('!gpu')
+    ('gpu', '!', [])
+    """
+    for pattern, separator in LABEL_SELECTORS:
+        match = pattern.match(selector.strip())
+        if match:
+            break
+    else:
+        raise ValueError('Invalid label selector "{0}".'.format(selector))
+
+    operator = {
+        '': 'exists',
+        '=': 'in',
+        '==': 'in',
+        '!=': 'notin',
+    }.get(match.group('operator'), match.group('operator'))
+    values = match.groupdict().get('values')
+    if values is None:
+        values = []
+    elif separator:
+        values = [value.strip() for value in values.split(separator)]
+    else:
+        values = [values.strip()]
+    return match.group('key'), operator, values
+
+
+def parse_label_selectors(selectors):
+    """Parse comma separated label selectors.
+
+    Commas inside the values of set based selectors are kept:
+
+    >>> parse_label_selectors(['app in (web', 'api)', 'tier=backend'])
+    [('app', 'in', ['web', 'api']), ('tier', 'in', ['backend'])]
+    """
+    parsed, current = [], ''
+    for part in ','.join(selectors).split(','):
+        current = '{0},{1}'.format(current, part) if current else part
+        if current.count('(') <= current.count(')'):
+            parsed.append(parse_label_selector(current))
+            current = ''
+    if current:
+        parsed.append(parse_label_selector(current))
+    return parsed
+
+
+MEMORY_UNITS = {
+    '': 1,
+    'k': 10**3,
+    'M': 10**6,
+    'G': 10**9,
+    'T': 10**12,
+    'P': 10**15,
+    'Ki': 2**10,
+    'Mi': 2**20,
+    'Gi': 2**30,
+    'Ti': 2**40,
+    'Pi': 2**50,
+}
+"""Multipliers of the Kubernetes memory quantity suffixes."""
+
+
+def parse_cpu(quantity):
+    """Convert a Kubernetes CPU quantity to a number of cores."""
+    quantity = str(quantity).strip()
+    try:
+        if quantity.endswith('m'):
+            cores = float(quantity[:-1]) / 1000
+        else:
+            cores = float(quantity)
+    except ValueError:
+        cores = -1
+
+    # "inf" and "nan" parse as floats but are not a number of cores
+    if not math.isfinite(cores) or cores <= 0:
+        raise ValueError('Invalid CPU quantity: {0}'.format(quantity))
+    return cores
+
+
+def parse_memory(quantity):
+    """Convert a Kubernetes memory quantity to a number of bytes."""
+    match = re.match(r'^([0-9]*\.?[0-9]+)([a-zA-Z]*)$', str(quantity).strip())
+    if not match or match.group(2) not in MEMORY_UNITS:
+        raise ValueError('Invalid memory quantity: {0}'.format(quantity))
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+RESOURCE_PARSERS = {
+    'cpu': parse_cpu,
+    'memory': parse_memory,
+    'shm': parse_memory,
+}
+"""Parsers of the supported resources."""
+
+
+def parse_resources(resources):
+    """Parse the requests and limits of a resources specification.
+
+    Other resources than those of :data:`RESOURCE_PARSERS`, e.g.
+    ``nvidia.com/gpu``, are returned unchanged for the engines supporting
+    them.
+
+    :raises ValueError: if the specification is malformed
+    """
+    resources = resources or {}
+    unknown = set(resources) - {'requests', 'limits'}
+    if unknown:
+        raise ValueError('Unknown resources keys: {0}'.format(
+            ', '.join(sorted(unknown))))
+
+    parsed = {}
+    for kind in ('requests', 'limits'):
+        parsed[kind] = {}
+        for name, quantity in (resources.get(kind) or {}).items():
+            parse = RESOURCE_PARSERS.get(name)
+            parsed[kind][name] = parse(quantity) if parse else quantity
+
+    for name, request in parsed['requests'].items():
+        if name in RESOURCE_PARSERS and \
+                request > parsed['limits'].get(name, request):
+            raise ValueError(
+                'Request of {0} exceeds its limit.'.format(name))
+
+    return parsed
+
+
+def resource_requests(spec):
+    """Return the CPU and memory requested by a context specification.
+
+    Requests fall back to limits as in Kubernetes.
+    """
+    resources = parse_resources((spec or {}).get('resources'))
+    requested = dict(resources['limits'])
+    requested.update(resources['requests'])
+    return {
+        'cpu': requested.get('cpu', 0.0),
+        'memory': requested.get('memory', 0),
+    }
+
+
 def validate_uuid(s, version=4):
     """Check that a string is a valid UUID."""
     try:
@@ -85,6 +272,15 @@ def validate_uuid(s, version=4):
     return s == str(uid)
 
 
+def unique_uuids(values):
+    """Return the distinct UUIDs of a list of strings in their order."""
+    invalid = [value for value in values if not validate_uuid(value)]
+    if invalid:
+        raise BadRequest('Invalid identifiers: {0}'.format(
+            ', '.join(invalid)))
+    return [uuid.UUID(value) for value in OrderedDict.fromkeys(values)]
+
+
 def validate_uuid_args(*names):
     """Check that input arguments are valid UUIDs."""
     def decorator(func):
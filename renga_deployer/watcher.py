@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Wait for execution state transitions.
+
+Requests asking for ``?wait_for=running`` are parked by the
+:class:`StateWatcher` of their process. While requests are waiting, a single
+thread asks the engines for the states of all watched executions at once
+every ``DEPLOYER_WATCH_INTERVAL`` seconds. States stored by the deployer in
+the same process, e.g. when an execution is stopped, wake the waiting
+requests immediately.
+
+Other components, like the :mod:`~renga_deployer.events` stream, register
+listeners which are called by the same thread after each refresh. The
+executions a listener needs are refreshed together with the watched ones,
+so each process asks the engines once per interval.
+
+Parked requests and event streams hold a worker thread each. Above
+``DEPLOYER_MAX_PARKED_REQUESTS`` per process, new ones are refused with
+``503 Service Unavailable`` so that the other requests are still served.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from connexion.exceptions import ProblemException
+from flask import current_app
+from sqlalchemy import or_
+
+from .deployer import execution_state_changed
+from .models import Execution, ExecutionStates, db
+
+logger = logging.getLogger('renga.deployer.watcher')
+
+RETRY_AFTER = 5
+"""Seconds after which refused parked requests may be retried."""
+
+
+class Waiter(object):
+    """A request waiting for an execution to reach a state."""
+
+    def __init__(self, state):
+        """Wait for the given state value."""
+        self.state = state
+        self.event = threading.Event()
+
+    def notify(self, state):
+        """Wake the request if the state is reached or cannot be anymore."""
+        if state in (self.state, ExecutionStates.EXITED.value):
+            self.event.set()
+
+
+class StateWatcher(object):
+    """Wake requests when their executions change state."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        self._waiters = defaultdict(list)
+        self._listeners = []
+        self._scopes = {}
+        self._parked = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.app = app
+        self.interval = app.config['DEPLOYER_WATCH_INTERVAL']
+        execution_state_changed.connect(self.state_changed)
+
+        app.extensions['renga-deployer-watcher'] = self
+        logger.debug('State watcher extension started.')
+
+    def wait(self, execution_id, state, timeout):
+        """Wait until an execution reaches a state, exits or times out.
+
+        :returns: ``True`` unless the timeout expired
+        """
+        execution_id = uuid.UUID(str(execution_id))
+        waiter = Waiter(state)
+        self.park()
+        with self._lock:
+            self._waiters[execution_id].append(waiter)
+            self._start()
+
+        try:
+            return waiter.event.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters[execution_id].remove(waiter)
+                if not self._waiters[execution_id]:
+                    del self._waiters[execution_id]
+            self.unpark()
+
+    def park(self):
+        """Count a request held open by this process.
+
+        :raises connexion.exceptions.ProblemException: with status ``503``
+            if ``DEPLOYER_MAX_PARKED_REQUESTS`` are held already
+        """
+        limit = self.app.config['DEPLOYER_MAX_PARKED_REQUESTS']
+        with self._lock:
+            if limit is not None and self._parked >= limit:
+                raise ProblemException(
+                    status=503, title='Service Unavailable',
+                    detail='Too many waiting requests and event streams.',
+                    headers={'Retry-After': str(RETRY_AFTER)})
+            self._parked += 1
+
+    def unpark(self):
+        """Stop counting a request held open by this process."""
+        with self._lock:
+            self._parked -= 1
+
+    def add_listener(self, listener, executions=None):
+        """Call a function after each refresh until it is removed.
+
+        :param executions: function returning a query of the executions
+            whose states are refreshed before the listener is called
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if executions is not None:
+                self._scopes[listener] = executions
+            self._start()
+
+    def remove_listener(self, listener):
+        """Stop calling a function after each refresh."""
+        with self._lock:
+            self._listeners.remove(listener)
+            self._scopes.pop(listener, None)
+
+    def notify(self, execution_id, state):
+        """Pass the state of an execution to its waiters."""
+        with self._lock:
+            waiters = list(self._waiters.get(execution_id, ()))
+        for waiter in waiters:
+            waiter.notify(state)
+
+    def state_changed(self, execution, state=None):
+        """Receive the states stored by the deployer."""
+        self.notify(execution.id, state.value)
+
+    def refresh(self):
+        """Refresh the states of the watched and listened executions."""
+        with self._lock:
+            watched = list(self._waiters)
+            listeners = list(self._listeners)
+            scopes = list(self._scopes.values())
+
+        criteria = [
+            Execution.id.in_(scope().with_entities(Execution.id))
+            for scope in scopes
+        ]
+        if watched:
+            criteria.append(Execution.id.in_(watched))
+        if criteria:
+            self._refresh(criteria)
+        for listener in listeners:
+            listener()
+
+    def _refresh(self, criteria):
+        """Refresh the states of executions and wake their waiters."""
+        deployer = current_app.extensions['renga-deployer'].deployer
+        executions = Execution.query.filter(or_(*criteria)).all()
+        # a single call shared by the waiters and all listeners
+        deployer.get_states([
+            execution for execution in executions
+            if execution.engine_id and
+            execution.state != ExecutionStates.EXITED.value
+        ])
+        # executions launched by other processes are read from the database
+        for execution in executions:
+            self.notify(execution.id, execution.state)
+
+    def _start(self):
+        """Start the refresh thread unless it is running."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='renga-deployer-watcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        """Refresh the states until nobody is waiting or listening."""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._waiters and not self._listeners:
+                    self._thread = None
+                    return
+
+            with self.app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception('Refreshing execution states failed')
+                finally:
+                    db.session.remove()
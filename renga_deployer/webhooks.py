@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Notify webhooks of execution events.
+
+A callback URL is registered for the executions of a context or for a
+single execution::
+
+    POST /contexts/<context_id>/webhooks
+    {"url": "https://ci.example.com/hooks/deployer", "secret": "..."}
+
+The ``launched``, ``stopped`` and ``failed`` events and the state changes,
+e.g. ``running`` and ``exited``, are posted as JSON once committed::
+
+    {"events": [{"id": "...", "event": "exited", "state": "exited",
+                 "execution_id": "...", "context_id": "...",
+                 "time": "2017-10-20T12:00:00.000000Z"}]}
+
+A thread of each process delivers the events. Events for the same URL
+collected within ``DEPLOYER_WEBHOOK_BATCH_DELAY`` seconds are sent
+together. Failed deliveries are retried with exponential backoff and a
+state change may be noticed by several processes, so receivers should
+ignore events whose ``id`` they have already seen. The identifier is
+derived from the execution, its previous state and the event, so it is
+the same in every process. The
+body is signed with HMAC-SHA256 in the ``X-Renga-Deployer-Signature:
+sha256=<hex digest>`` header using the secret of the webhook or
+``DEPLOYER_WEBHOOK_SECRET``.
+
+While launched executions have webhooks, the
+:class:`~renga_deployer.watcher.StateWatcher` refreshes their states so
+that exits are noticed without anybody polling.
+"""
+
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import requests
+from flask import current_app
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session, attributes
+
+from .deployer import execution_failed, execution_launched, \
+    execution_state_changed, execution_stopped
+from .events import after_commit
+from .metrics import OUTBOUND_ERRORS, OUTBOUND_LATENCY, timed
+from .models import Execution, ExecutionStates, Webhook, db
+
+logger = logging.getLogger('renga.deployer.webhooks')
+
+EVENTS = uuid.UUID('5d1f0a4e-8c3b-4f6e-9a27-3b8e6c0d2f19')
+"""Namespace of the event identifiers."""
+
+PENDING = 'renga_deployer_webhook_events'
+"""Session key of the events waiting for their webhooks to be found."""
+
+
+def sign(secret, body):
+    """Return the signature header value of a body.
+
+    >>> sign('secret', b'{}')
+    'sha256=77325902caca812dc259733aacd046b73817372c777b8d95b402647474516e13'
+    """
+    return 'sha256={0}'.format(
+        hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest())
+
+
+def event_id(execution_id, previous, event):
+    """Return the identifier of an event of an execution.
+
+    >>> event_id('1', 'running', 'exited') == event_id('1', None, 'exited')
+    False
+    """
+    return uuid.uuid5(EVENTS, '{0}/{1}/{2}'.format(
+        execution_id, previous, event)).hex
+
+
+class Delivery(object):
+    """Events sent to a URL in one request."""
+
+    def __init__(self, url, secret, events):
+        """Prepare the delivery of events."""
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.secret = secret
+        self.events = events
+        self.attempts = 0
+
+
+class WebhookDispatcher(object):
+    """Deliver execution events to the registered webhooks."""
+
+    def __init__(self, app=None):
+        """Extension initialization."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._watching = False
+        self._sequence = itertools.count()
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Flask application initialization."""
+        self.app = app
+        self.secret = app.config['DEPLOYER_WEBHOOK_SECRET']
+        self.batch_size = app.config['DEPLOYER_WEBHOOK_BATCH_SIZE']
+        self.batch_delay = app.config['DEPLOYER_WEBHOOK_BATCH_DELAY']
+        self.retries = app.config['DEPLOYER_WEBHOOK_RETRIES']
+        self.backoff = app.config['DEPLOYER_WEBHOOK_BACKOFF']
+        self.timeout = app.config['DEPLOYER_WEBHOOK_TIMEOUT']
+        self.queue = queue.Queue(app.config['DEPLOYER_WEBHOOK_QUEUE_SIZE'])
+        self.session = requests.Session()
+
+        execution_launched.connect(self.launched)
+        execution_stopped.connect(self.stopped)
+        execution_failed.connect(self.failed)
+        execution_state_changed.connect(self.state_changed)
+        app.before_first_request(self.resume)
+
+        app.extensions['renga-deployer-webhooks'] = self
+        logger.debug('Webhook extension started.')
+
+    def launched(self, execution):
+        """Notify a launched execution."""
+        self._notify('launched', execution)
+
+    def stopped(self, execution):
+        """Notify a stopped execution."""
+        self._notify('stopped', execution)
+
+    def failed(self, execution):
+        """Notify an execution that could not be launched."""
+        self._notify('failed', execution)
+
+    def state_changed(self, execution, state=None):
+        """Notify a new state."""
+        self._notify(state.value, execution, state=state.value)
+
+    def enqueue(self, hooks, event):
+        """Queue an event for delivery to webhooks."""
+        for url, secret in hooks:
+            try:
+                self.queue.put_nowait((url, secret, event))
+            except queue.Full:
+                logger.warning(
+                    'Dropping {0} event of execution {1}'.format(
+                        event['event'], event['execution_id']),
+                    extra={'url': url})
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='renga-deployer-webhooks')
+                self._thread.daemon = True
+                self._thread.start()
+
+        if event['state'] != ExecutionStates.EXITED.value:
+            self.watch()
+
+    def watch(self):
+        """Refresh the states of executions with webhooks."""
+        with self._lock:
+            if self._watching:
+                return
+            self._watching = True
+        self.app.extensions['renga-deployer-watcher'].add_listener(
+            self.refresh, self._live)
+
+    def resume(self):
+        """Watch the executions with webhooks after a restart."""
+        if self._live().first() is not None:
+            self.watch()
+
+    def refresh(self):
+        """Stop watching once no launched execution has webhooks.
+
+        The watcher has refreshed the states before; new states are notified
+        by the signals of the deployer.
+        """
+        if self._live().first() is None:
+            with self._lock:
+                self._watching = False
+            self.app.extensions['renga-deployer-watcher'].remove_listener(
+                self.refresh)
+
+    @timed(OUTBOUND_LATENCY, OUTBOUND_ERRORS, service='webhook',
+           operation='deliver')
+    def deliver(self, delivery):
+        """Post the events of a delivery, raising on failure."""
+        body = json.dumps(
+            {'events': delivery.events}, sort_keys=True).encode('utf-8')
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Renga-Deployer-Delivery': delivery.id,
+        }
+        secret = delivery.secret or self.secret
+        if secret:
+            headers['X-Renga-Deployer-Signature'] = sign(secret, body)
+
+        response = self.session.post(
+            delivery.url, data=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+    def _notify(self, kind, execution, state=None):
+        """Queue an event for the webhooks of an execution once committed."""
+        # the signals are shared by all applications of the process
+        if current_app.extensions.get('renga-deployer-webhooks') is not self:
+            return
+
+        context_id = execution.context_id or (
+            execution.context.id if execution.context else None)
+        # the state being replaced tells repeated transitions apart
+        previous = attributes.get_history(execution, 'state').deleted
+        payload = {
+            'id': event_id(execution.id, previous[0] if previous else None,
+                           kind),
+            'event': kind,
+            'execution_id': str(execution.id),
+            'context_id': str(context_id),
+            'state': state or execution.state,
+            'time': datetime.utcnow().isoformat() + 'Z',
+        }
+        # the webhooks of all events of a transaction are found at once
+        db.session().info.setdefault(PENDING, []).append(
+            (self, execution.id, context_id, payload))
+
+    @staticmethod
+    def _live():
+        """Return a query of the launched executions with webhooks."""
+        return Execution.query.filter(
+            Execution.engine_id.isnot(None),
+            or_(Execution.state.is_(None),
+                Execution.state != ExecutionStates.EXITED.value),
+            or_(Execution.id.in_(db.session.query(Webhook.execution_id)),
+                Execution.context_id.in_(
+                    db.session.query(Webhook.context_id))))
+
+    def _collect(self, timeout):
+        """Wait for events and group them into deliveries per URL."""
+        try:
+            events = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        deadline = time.time() + self.batch_delay
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                events.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        batches = OrderedDict()
+        for url, secret, event in events:
+            batches.setdefault((url, secret), []).append(event)
+        return [
+            Delivery(url, secret, batch[start:start + self.batch_size])
+            for (url, secret), batch in batches.items()
+            for start in range(0, len(batch), self.batch_size)
+        ]
+
+    def _run(self):
+        """Deliver the queued events and retry failed deliveries."""
+        retries = []
+        while True:
+            timeout = max(retries[0][0] - time.time(), 0) if retries else None
+            deliveries = self._collect(timeout)
+            while retries and retries[0][0] <= time.time():
+                deliveries.append(heapq.heappop(retries)[2])
+
+            for delivery in deliveries:
+                try:
+                    self.deliver(delivery)
+                except Exception:
+                    delivery.attempts += 1
+                    if delivery.attempts > self.retries:
+                        logger.exception(
+                            'Giving up delivery {0} to {1}'.format(
+                                delivery.id, delivery.url),
+                            extra={'events': delivery.events})
+                        continue
+                    logger.warning(
+                        'Delivery {0} to {1} failed'.format(
+                            delivery.id, delivery.url),
+                        exc_info=True)
+                    heapq.heappush(retries, (
+                        time.time() +
+                        self.backoff * 2**(delivery.attempts - 1),
+                        next(self._sequence), delivery))
+
+
+@event.listens_for(Session, 'before_commit')
+def find_webhooks(session):
+    """Queue the events of a transaction for their webhooks once committed."""
+    pending = session.info.pop(PENDING, None)
+    if not pending:
+        return
+
+    webhooks = Webhook.of({execution_id for _, execution_id, _, _ in pending},
+                          {context_id for _, _, context_id, _ in pending})
+    webhooks = webhooks.all()
+    for dispatcher, execution_id, context_id, payload in pending:
+        hooks = [(webhook.url, webhook.secret) for webhook in webhooks
+                 if webhook.execution_id == execution_id or
+                 webhook.context_id == context_id]
+        if hooks:
+            after_commit(dispatcher.enqueue, hooks, payload)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_events(session):
+    """Discard the events of a rolled back session."""
+    session.info.pop(PENDING, None)
@@ -15,9 +15,52 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Deployer WSGI application."""
+"""Deployer WSGI application.
+
+The application can be loaded once in a master process before forking the
+workers, e.g. by uWSGI without ``lazy-apps``. The workers drop the database
+connections inherited from the master, with ``os.register_at_fork`` or, on
+Python 3.6, with the ``postfork`` hook of uWSGI. Set
+``py-call-osafterfork`` so that the interpreter state is reset as well.
+"""
+
+import os
 
 from .app import create_app
+from .models import db
+
+
+def _patch_psycopg():
+    """Make psycopg2 cooperative when gevent patched the sockets."""
+    try:
+        from gevent import monkey
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return
+
+    if monkey.is_module_patched('socket'):
+        patch_psycopg()
+
+
+_patch_psycopg()
 
 application = create_app()
 """Default WSGI application."""
+
+
+def _dispose_connections():
+    """Drop database connections inherited from the master process."""
+    with application.app_context():
+        db.engine.dispose()
+
+
+try:
+    # Python 3.6 runs no fork hooks; uWSGI calls its own in the workers
+    from uwsgidecorators import postfork
+except ImportError:
+    postfork = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_connections)
+elif postfork is not None:
+    postfork(_dispose_connections)
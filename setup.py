@@ -48,10 +48,22 @@ extras_require = {
     'wsgi': [
         'uwsgi>=2.0.15',
     ],
+    'asgi': [
+        'aiohttp>=3.4',
+        'asgiref>=3.2',
+        'kubernetes_asyncio>=9.0',
+    ],
+    'gevent': [
+        'gevent>=1.2.2',
+        'psycogreen>=1.0',
+    ],
     'logging': [
         'python-logstash-async>=1.3.1',
         'raven[flask]>=6.3.0',
     ],
+    'metrics': [
+        'prometheus_client>=0.10.0',
+    ],
 }
 
 extras_require['all'] = []
@@ -69,9 +81,10 @@ install_requires = [
     'Flask-RESTful>=0.3.6',
     'Flask-SQLAlchemy>=2.2',
     'Jinja2>=2.9.6',
+    'alembic>=1.0.0',
     'SQLAlchemy>=1.1.12',
     'blinker>=1.4',
-    'connexion>=1.1.11',
+    'connexion>=1.5',
     'jsonschema>=2.6.0',
     'marshmallow>=2.13.5',
     'python-jose>=1.3.2',
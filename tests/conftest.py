@@ -20,6 +20,7 @@
 import os
 import shutil
 import tempfile
+from collections import defaultdict
 
 import pytest
 from jose import jwt
@@ -28,7 +29,60 @@ from sqlalchemy_utils.functions import create_database, database_exists, \
 
 from renga_deployer.app import create_app
 from renga_deployer.deployer import Deployer
-from renga_deployer.models import db
+from renga_deployer.engines import Engine
+from renga_deployer.models import ExecutionStates, db
+
+
+class FakeEngine(Engine):
+    """Engine keeping the states and ports of its executions in memory.
+
+    The calls are recorded in ``calls`` by method name.
+    """
+
+    def __init__(self):
+        """Report running executions without ports."""
+        self.state = ExecutionStates.RUNNING
+        self.states = {}
+        self.ports = None
+        self.resources = []
+        self.calls = defaultdict(list)
+
+    def launch(self, execution, **kwargs):
+        """Pretend to start an execution."""
+        self.calls['launch'].append(execution.id)
+        execution.engine_id = 'fake-{0}'.format(execution.id)
+        return execution
+
+    def stop(self, execution, remove=False):
+        """Pretend to stop an execution."""
+        self.calls['stop'].append(execution.id)
+
+    def get_state(self, execution):
+        """Return the state of an execution."""
+        return self.get_states([execution])[execution.id]
+
+    def get_states(self, executions):
+        """Return the configured states, or the default one."""
+        executions = list(executions)
+        self.calls['get_states'].append(
+            [execution.id for execution in executions])
+        return {
+            execution.id: self.states.get(execution.id, self.state)
+            for execution in executions
+        }
+
+    def get_host_ports(self, execution):
+        """Return the configured ports."""
+        self.calls['get_host_ports'].append(execution.id)
+        return self.ports
+
+    def list_resources(self):
+        """Return the configured resources."""
+        return self.resources
+
+    def remove_resource(self, resource):
+        """Pretend to remove a resource."""
+        self.calls['remove_resource'].append(resource['engine_id'])
 
 
 @pytest.fixture()
@@ -73,6 +127,14 @@ def deployer():
     return Deployer(engines={'docker': 'docker:///var/lib/docker.sock'})
 
 
+@pytest.fixture()
+def fake_engine(monkeypatch):
+    """Register an in-memory engine as ``fake``."""
+    engine = FakeEngine()
+    monkeypatch.setitem(Deployer.ENGINES, 'fake', lambda: engine)
+    return engine
+
+
 @pytest.fixture(autouse=True)
 def no_auth_connexion(monkeypatch):
     """Turn off authorization checking in connexion."""
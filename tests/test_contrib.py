@@ -281,8 +281,7 @@ def test_kg_handlers(kg_app, auth_header, kg_requests, engine):
             resp.data.decode())['identifier'])
 
         assert 'RENGA_VERTEX_ID' in current_app.extensions[
-            'renga-deployer'].deployer.ENGINES[
-                engine]().get_execution_environment(execution)
+            'renga-deployer'].deployer.get_execution_environment(execution)
 
         # 3. cleanup jobs
         time.sleep(5)
@@ -292,6 +291,46 @@ def test_kg_handlers(kg_app, auth_header, kg_requests, engine):
             headers=auth_header)
 
 
+def test_kg_import(kg_app, kg_requests):
+    """Test registering imported contexts and executions in the graph."""
+    from renga_deployer.contrib.knowledge_graph import GraphContext, \
+        GraphExecution
+    from renga_deployer.models import Context
+    from renga_deployer.transfer import import_lines
+
+    lines = [
+        json.dumps({
+            'table': 'contexts',
+            'row': {
+                'id': '8c3b0a6e-2f1d-4b7a-9f3e-5d6c7b8a9e01',
+                'spec': {
+                    'image': 'hello-world',
+                    'labels': ['renga.execution_context.vertex_id=1', 'a=b'],
+                },
+            },
+        }),
+        json.dumps({
+            'table': 'executions',
+            'row': {
+                'id': '2e7f9c1d-6a4b-4c8e-b3d5-0f1a2b3c4d5e',
+                'context_id': '8c3b0a6e-2f1d-4b7a-9f3e-5d6c7b8a9e01',
+                'engine': 'docker',
+                'state': 'exited',
+            },
+        }),
+    ]
+    importer = import_lines(lines)
+    assert importer.counts['contexts'] == 1
+    assert importer.counts['executions'] == 1
+
+    context = Context.query.one()
+    assert context.spec['labels'] == [
+        'renga.execution_context.vertex_id=1234', 'a=b'
+    ]
+    assert GraphContext.query.one().context_id == context.id
+    assert GraphExecution.query.one().execution.context == context
+
+
 def test_missing_kg_endpoint(kg_app, auth_header, kg_requests, monkeypatch):
     """Test that missing the mutation service is handled gracefully."""
     mutation_url = join_url(current_app.config['KNOWLEDGE_GRAPH_URL'],
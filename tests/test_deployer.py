@@ -25,8 +25,9 @@ import requests
 from flask import Flask
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
-from renga_deployer.deployer import Deployer
+from renga_deployer.deployer import Deployer, execution_state_changed
 from renga_deployer.models import Context, Execution, ExecutionStates
+from renga_deployer.serializers import ExecutionSchema
 
 
 def test_deployer_env_create(monkeypatch):
@@ -62,6 +63,11 @@ def test_execution_launch(app, engine, spec, deployer):
             break
     assert 'Hello from Docker!' in deployer.get_logs(execution)
 
+    if engine == 'docker':
+        containers = deployer.ENGINES[engine]().list_containers(
+            context_id=context.id)
+        assert [c['execution'] for c in containers] == [str(execution.id)]
+
     deployer.stop(execution, remove=True)
 
 
@@ -152,3 +158,468 @@ def test_open_ingress(app, engine, image, deployer):
     finally:
         deployer.stop(execution, remove=True)
         s.close()
+
+
+def test_fair_share_queue(app, deployer, monkeypatch):
+    """Test that queued launches are ordered by fair share."""
+    app.config['DEPLOYER_SCHEDULER_CAPACITY'] = 0
+
+    context = deployer.create({'image': 'hello-world'})
+    sweep = [
+        deployer.launch(context, engine='docker', creator='alice')
+        for _ in range(3)
+    ]
+    sessions = [
+        deployer.launch(context, engine='docker', creator='bob')
+        for _ in range(2)
+    ]
+
+    assert all(execution.engine_id is None for execution in sweep)
+    assert sessions[0].state == ExecutionStates.QUEUED.value
+    assert deployer.scheduler.queue() == [
+        sweep[0], sessions[0], sweep[1], sessions[1], sweep[2]
+    ]
+    assert deployer.scheduler.queue_position(sessions[1]) == 3
+
+    app.config['DEPLOYER_SCHEDULER_WEIGHTS'] = {'alice': 3}
+    assert deployer.scheduler.queue_position(sessions[1]) == 4
+
+    # a listing orders the queue once for all its executions
+    orders = []
+    queue = deployer.scheduler.queue
+
+    def counted_queue():
+        orders.append(1)
+        return queue()
+
+    monkeypatch.setattr(app.extensions['renga-deployer'], '_deployer',
+                        deployer)
+    monkeypatch.setattr(deployer.scheduler, 'queue', counted_queue)
+    data = ExecutionSchema(many=True).dump(sweep + sessions).data
+    assert [execution['queue_position']
+            for execution in data['executions']] == [0, 2, 3, 1, 4]
+    assert len(orders) == 1
+
+    # stopping a queued execution removes it from the queue
+    deployer.stop(sweep[0])
+    assert sweep[0].state == ExecutionStates.EXITED.value
+    assert sweep[0] not in deployer.scheduler.queue()
+
+    app.extensions['renga-deployer-watcher'].remove_listener(
+        deployer.scheduler.refresh)
+
+
+def test_schedule_on_exit(app, deployer, fake_engine, monkeypatch):
+    """Test that exits admit queued executions launched once."""
+    import threading
+    from datetime import datetime, timedelta
+
+    from renga_deployer.models import db
+
+    launches = fake_engine.calls['launch']
+    launch = fake_engine.launch
+
+    def launch_in_background(execution, **kwargs):
+        # the request admitting the execution does not launch it
+        assert threading.current_thread().name == 'renga-deployer-launcher'
+        return launch(execution, **kwargs)
+
+    def update(execution, **values):
+        db.session.execute(
+            Execution.__table__.update().where(
+                Execution.id == execution.id).values(**values))
+        db.session.commit()
+
+    monkeypatch.setattr(fake_engine, 'launch', launch_in_background)
+    app.config['DEPLOYER_SCHEDULER_CAPACITY'] = 1
+
+    context = deployer.create({'image': 'hello-world'})
+    first, second, third = [
+        deployer.launch(context, engine='fake') for _ in range(3)
+    ]
+    deployer.scheduler.join()
+    assert launches == [first.id]
+    assert second.state == third.state == ExecutionStates.QUEUED.value
+
+    # the stored states hold the slot without asking the engine
+    assert deployer.scheduler.schedule() == []
+
+    # another process claims the second execution
+    update(second, state=None)
+
+    fake_engine.states[first.id] = ExecutionStates.EXITED
+    assert deployer.get_states([first]) == {first.id: ExecutionStates.EXITED}
+    deployer.scheduler.join()
+    assert launches == [first.id]
+    assert third.state == ExecutionStates.QUEUED.value
+
+    # the claim of a process that died expires and is queued again
+    update(second, updated=datetime.utcnow() - timedelta(hours=1))
+    assert deployer.scheduler.schedule() == [second]
+    deployer.scheduler.join()
+    # the executions are launched with the session of the launcher
+    db.session.expire_all()
+    assert launches == [first.id, second.id]
+
+    # removed engine resources release their slot once unavailable long
+    fake_engine.states[second.id] = ExecutionStates.UNAVAILABLE
+    deployer.get_states([second])
+    assert deployer.scheduler.schedule() == []
+    update(second, updated=datetime.utcnow() - timedelta(hours=1))
+    deployer.scheduler.refresh()
+    deployer.scheduler.join()
+    assert launches == [first.id, second.id, third.id]
+
+    # the active executions are refreshed until the queue is empty
+    assert deployer.scheduler._watching
+    deployer.scheduler.refresh()
+    assert not deployer.scheduler._watching
+
+
+def test_shared_refresh(app, monkeypatch):
+    """Test that each refresh asks the engines once for all listeners."""
+    from renga_deployer.models import db
+
+    deployer = app.extensions['renga-deployer'].deployer
+    watcher = app.extensions['renga-deployer-watcher']
+    context = deployer.create({'image': 'hello-world'})
+    executions = [
+        Execution.from_context(context, engine='fake', engine_id=engine_id)
+        for engine_id in ('first', 'second', 'third')
+    ]
+    db.session.add_all(executions)
+    db.session.commit()
+
+    refreshed, called = [], []
+    monkeypatch.setattr(
+        deployer, 'get_states', lambda executions: refreshed.append(
+            sorted(execution.engine_id for execution in executions)))
+
+    def scope(*engine_ids):
+        return lambda: Execution.query.filter(
+            Execution.engine_id.in_(engine_ids))
+
+    def first():
+        called.append('first')
+
+    def second():
+        called.append('second')
+
+    watcher.add_listener(first, scope('first', 'second'))
+    watcher.add_listener(second, scope('second', 'third'))
+    try:
+        watcher.refresh()
+    finally:
+        watcher.remove_listener(first)
+        watcher.remove_listener(second)
+
+    assert refreshed == [['first', 'second', 'third']]
+    assert called == ['first', 'second']
+
+
+def test_quota_exceeded(app, deployer):
+    """Test that requests larger than the quota are refused."""
+    from werkzeug.exceptions import Forbidden
+
+    app.config['DEPLOYER_QUOTA_CPU'] = '2'
+
+    context = deployer.create({
+        'image': 'hello-world',
+        'resources': {
+            'requests': {
+                'cpu': '2500m'
+            }
+        },
+    })
+    with pytest.raises(Forbidden):
+        deployer.launch(context, engine='docker')
+
+
+def test_resource_options(app):
+    """Test translation of spec resources to engine options."""
+    from renga_deployer.engines import DockerEngine, K8SEngine
+    from renga_deployer.utils import resource_requests
+
+    spec = {
+        'image': 'hello-world',
+        'resources': {
+            'requests': {
+                'cpu': '500m',
+                'memory': '128Mi'
+            },
+            'limits': {
+                'cpu': '2',
+                'memory': '1Gi',
+                'shm': '64Mi'
+            },
+        },
+    }
+
+    assert DockerEngine._resource_options(spec) == {
+        'nano_cpus': 2 * 10**9,
+        'cpu_shares': 512,
+        'mem_limit': 2**30,
+        'memswap_limit': 2**30,
+        'mem_reservation': 128 * 2**20,
+        'shm_size': 64 * 2**20,
+    }
+    assert DockerEngine._resource_options({'image': 'hello-world'}) == {}
+    # other resources are passed through to the engines supporting them
+    gpu = {
+        'image': 'hello-world',
+        'resources': {'limits': {'nvidia.com/gpu': 1, 'cpu': '1'}},
+    }
+    assert DockerEngine._resource_options(gpu) == {'nano_cpus': 10**9}
+    assert resource_requests(gpu) == {'cpu': 1.0, 'memory': 0}
+    execution = Execution.from_context(Context.create(spec=gpu))
+    template = K8SEngine._k8s_job_template('default', execution)
+    container = template['spec']['template']['spec']['containers'][0]
+    assert container['resources']['limits']['nvidia.com/gpu'] == 1
+
+    # the shared memory may be requested only, as on Kubernetes
+    assert DockerEngine._resource_options({
+        'image': 'hello-world',
+        'resources': {'requests': {'shm': '32Mi'}},
+    }) == {'shm_size': 32 * 2**20}
+    for cpu in ('inf', 'nan', '-1', '0', 'infm'):
+        with pytest.raises(ValueError):
+            DockerEngine._resource_options({
+                'image': 'hello-world',
+                'resources': {'limits': {'cpu': cpu}},
+            })
+
+    execution = Execution.from_context(Context.create(spec=spec))
+    template = K8SEngine._k8s_job_template('default', execution)
+    container = template['spec']['template']['spec']['containers'][0]
+    assert 'shm' not in container['resources']['limits']
+    assert {'name': 'dshm', 'mountPath': '/dev/shm'} in \
+        container['volumeMounts']
+    assert 'shm' in spec['resources']['limits']
+
+
+def test_k8s_job_uid(app, monkeypatch):
+    """Test that jobs are identified by their uid, not by labels."""
+    from datetime import datetime
+
+    import kubernetes
+
+    from renga_deployer.engines import K8SEngine
+
+    def job(spec):
+        return kubernetes.client.V1Job(
+            metadata=kubernetes.client.V1ObjectMeta(
+                name='job-1', namespace='default', uid='1234',
+                labels=spec['metadata']['labels'],
+                creation_timestamp=datetime.utcnow()))
+
+    class FakeBatch(object):
+        def __init__(self, api_client=None):
+            pass
+
+        def create_namespaced_job(self, namespace, spec):
+            self.jobs.append(job(spec))
+            return self.jobs[-1]
+
+        def list_job_for_all_namespaces(self, label_selector=None):
+            return kubernetes.client.V1JobList(items=self.jobs)
+
+    FakeBatch.jobs = []
+    monkeypatch.setattr(kubernetes.client, 'BatchV1Api', FakeBatch)
+
+    engine = K8SEngine(config=object())
+    execution = Execution.from_context(
+        Context.create(spec={'image': 'hello-world'}))
+    engine.launch(execution)
+
+    assert 'controller-uid' not in FakeBatch.jobs[0].metadata.labels
+    assert execution.engine_id == '1234'
+    assert execution.job_name == 'job-1'
+    assert [resource['engine_id'] for resource in engine.list_resources()
+            ] == ['1234']
+
+
+def test_engine_client_spans(app, monkeypatch):
+    """Test that each call of the engine clients is traced."""
+    import kubernetes
+
+    from renga_deployer import tracing
+    from renga_deployer.engines import K8SEngine
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        return method
+
+    monkeypatch.setattr(kubernetes.client.ApiClient, 'call_api', call_api)
+    trace = tracing.Trace()
+    monkeypatch.setattr(tracing._local, 'trace', trace, raising=False)
+
+    engine = K8SEngine(config=object())
+    path = '/api/v1/namespaces/{namespace}/pods'
+    assert engine.api_client.call_api(path, 'GET') == 'GET'
+
+    client = tracing.TracedClient('docker', {'Id': '1234'})
+    assert client.get('Id') == '1234'
+    assert [span['name'] for span in trace.spans] == [
+        'k8s.GET ' + path, 'docker.get'
+    ]
+
+
+def test_stored_host_ports(app, deployer, fake_engine):
+    """Test that port bindings are served until the state changes."""
+    calls = fake_engine.calls['get_host_ports']
+    fake_engine.ports = {
+        'ports': [{'host': 'localhost', 'exposed': '32768'}]
+    }
+
+    context = deployer.create({'image': 'hello-world'})
+    execution = Execution.from_context(
+        context, engine='fake', engine_id='1234')
+
+    changes = []
+    with execution_state_changed.connected_to(
+            lambda execution, state: changes.append(state)):
+        assert deployer.get_host_ports(execution) == \
+            deployer.get_host_ports(execution)
+    assert len(calls) == 1
+    assert execution.ports
+    assert changes == [ExecutionStates.RUNNING]
+
+    fake_engine.state = ExecutionStates.EXITED
+    assert deployer.get_state(execution) == ExecutionStates.EXITED
+    assert execution.ports is None
+
+
+def test_garbage_collection(app, deployer, fake_engine, monkeypatch):
+    """Test that only old resources without execution are removed."""
+    from renga_deployer.garbage_collection import GarbageCollector
+    from renga_deployer.models import db
+
+    context = deployer.create({'image': 'hello-world'})
+    execution = Execution.from_context(
+        context, engine='fake', engine_id='known')
+    db.session.add(execution)
+    db.session.commit()
+
+    now = time.time()
+    fake_engine.resources = [
+        {'engine_id': 'known', 'created': now - 3600},
+        {'engine_id': 'leaked', 'created': now - 3600},
+        {'engine_id': 'launching', 'created': now},
+    ]
+    removed = fake_engine.calls['remove_resource']
+    monkeypatch.setattr(Deployer, 'ENGINES', {
+        'fake': Deployer.ENGINES['fake']
+    })
+
+    stats = GarbageCollector(
+        deployer, grace_period=60, batch_size=2, dry_run=True).collect()
+    assert stats['fake']['orphans'] == 1
+    assert stats['fake']['recent'] == 1
+    assert removed == []
+
+    stats = GarbageCollector(deployer, grace_period=60).collect()
+    assert stats['fake']['removed'] == 1
+    assert removed == ['leaked']
+
+
+def test_async_logging():
+    """Test that lazy extras are resolved only for emitted records."""
+    import logging
+    import os
+
+    from renga_deployer.logging import AsyncHandler, _stop_listener, lazy, \
+        setup_logging
+
+    config = {
+        'version': 1,
+        'handlers': {
+            'memory': {
+                'class': 'logging.handlers.BufferingHandler',
+                'capacity': 100,
+                'level': 'WARNING',
+            },
+        },
+        'loggers': {
+            'renga': {
+                'handlers': ['memory'],
+                'level': 'DEBUG',
+            },
+        },
+    }
+    setup_logging(config)
+    handler, = logging.getLogger('renga').handlers
+    assert isinstance(handler, AsyncHandler)
+    memory, = handler.handlers
+
+    calls = []
+
+    def dump(value):
+        calls.append(value)
+        return {'value': value}
+
+    logger = logging.getLogger('renga.deployer.test')
+    logger.info('Skipped %s', 'record', extra={'payload': lazy(dump, 1)})
+    logger.warning('Emitted %s', 'record', extra={'payload': lazy(dump, 2)})
+    _stop_listener()
+
+    assert calls == [2]
+    record, = memory.buffer
+    assert record.getMessage() == 'Emitted record'
+    assert record.payload == {'value': 2}
+
+    # forked processes start their own listener with their first record
+    setup_logging(config)
+    memory, = logging.getLogger('renga').handlers[0].handlers
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logger.warning('Forked')
+            _stop_listener()
+            status = 0 if [record.getMessage() for record in memory.buffer
+                           ] == ['Forked'] else 1
+        finally:
+            os._exit(locals().get('status', 2))
+    assert os.waitpid(pid, 0)[1] == 0
+    _stop_listener()
+
+    # records emitted without the queue are resolved as well
+    setup_logging(config, use_queue=False)
+    memory, = logging.getLogger('renga').handlers
+    logger.info('Skipped', extra={'payload': lazy(dump, 3)})
+    logger.warning('Emitted', extra={'payload': lazy(dump, 4)})
+    assert calls == [2, 4]
+    assert memory.buffer[0].payload == {'value': 4}
+
+    setup_logging(None)
+
+
+def test_log_dump_stored_state(app, deployer, fake_engine):
+    """Test that executions are logged without asking their engine."""
+    from renga_deployer.engines import _dump, execution_schema
+
+    context = deployer.create({'image': 'hello-world'})
+    execution = Execution.from_context(
+        context, engine='fake', engine_id='1234', state='running')
+    assert _dump(execution_schema, execution)['state'] == 'running'
+    assert not fake_engine.calls['get_states']
+
+
+def test_shared_engine_instances(deployer, monkeypatch):
+    """Test that threads share one instance of each engine."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from renga_deployer.engines import Engine
+
+    created = []
+
+    class FakeEngine(Engine):
+        def __init__(self):
+            created.append(self)
+            time.sleep(0.01)
+
+    monkeypatch.setitem(deployer.ENGINES, 'fake', FakeEngine)
+
+    with ThreadPoolExecutor(8) as pool:
+        engines = list(pool.map(lambda _: deployer.engine('fake'), range(16)))
+
+    assert len(created) == 1
+    assert all(engine is engines[0] for engine in engines)
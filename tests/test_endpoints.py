@@ -17,16 +17,22 @@
 # limitations under the License.
 """Module tests."""
 
+import gzip
 import json
+import os
 import time
+import uuid
+import zlib
+from datetime import datetime
 
 import pytest
 from flask import Flask
+from jose import jwt
 from werkzeug.exceptions import BadRequest
 
 from renga_deployer import RengaDeployer
 from renga_deployer.ext import current_deployer
-from renga_deployer.models import Context, Execution, db
+from renga_deployer.models import Context, ContextLabel, Execution, Webhook, db
 
 
 def test_version():
@@ -57,6 +63,312 @@ def test_view(app):
         assert 'Welcome to Renga-Deployer' in str(res.data)
 
 
+def test_production_startup(instance_path, auth_header, monkeypatch):
+    """Test the specification cache without creating the database."""
+    from click.testing import CliRunner
+    from flask.cli import ScriptInfo
+
+    from renga_deployer.app import PrevalidatedApi, create_app
+    from renga_deployer.cli import deployer
+
+    config = dict(
+        DEPLOYER_CREATE_DB=False,
+        DEPLOYER_SPEC_CACHE=os.path.join(instance_path, 'spec'),
+        SQLALCHEMY_DATABASE_URI='sqlite:///{0}/test.db'.format(
+            instance_path))
+
+    create_app(**config)
+    assert not os.path.exists(os.path.join(instance_path, 'test.db'))
+    cached, = os.listdir(config['DEPLOYER_SPEC_CACHE'])
+
+    # the cached specification is not validated again
+    calls = []
+    monkeypatch.setattr(PrevalidatedApi, '_validate_spec',
+                        lambda self, spec: calls.append(spec))
+    app = create_app(**config)
+    assert len(calls) == 1
+    assert os.listdir(config['DEPLOYER_SPEC_CACHE']) == [cached]
+
+    result = CliRunner().invoke(
+        deployer, ['initdb'], obj=ScriptInfo(create_app=lambda info: app))
+    assert result.exit_code == 0
+    assert os.path.exists(os.path.join(instance_path, 'test.db'))
+
+    with app.test_client() as client:
+        resp = client.get('/v1/contexts', headers=auth_header)
+        assert resp.status_code == 200
+
+
+def test_migrations(base_app, instance_path):
+    """Test upgrading and downgrading the schema."""
+    from sqlalchemy import inspect
+
+    from renga_deployer import migrations
+
+    base_app.config['SQLALCHEMY_DATABASE_URI'] = \
+        'sqlite:///{0}/migrations.db'.format(instance_path)
+
+    with base_app.app_context():
+        assert migrations.current_revision() is None
+        migrations.upgrade()
+        assert migrations.current_revision() == 'c3a8f5e1d2b4'
+
+        indexes = {
+            index['name']: index['column_names']
+            for table in ('contexts', 'executions')
+            for index in inspect(db.engine).get_indexes(table)
+        }
+        assert indexes['ix_executions_context_id_created'] == [
+            'context_id', 'created']
+        assert indexes['ix_contexts_creator_created'] == [
+            'creator', 'created']
+        assert indexes['ix_contexts_spec_hash'] == ['spec_hash']
+
+        migrations.downgrade('base')
+        assert inspect(db.engine).get_table_names() == ['alembic_version']
+
+        # tables created without migrations are adopted
+        migrations.upgrade(migrations.INITIAL_REVISION)
+        assert 'state' not in {
+            column['name']
+            for column in inspect(db.engine).get_columns('executions')
+        }
+        db.engine.execute('DROP TABLE alembic_version')
+        legacy = {'launched': uuid.uuid4(), None: uuid.uuid4()}
+        for engine_id, execution_id in legacy.items():
+            db.engine.execute(
+                'INSERT INTO executions (id, created, updated, engine, '
+                'engine_id) VALUES (?, ?, ?, ?, ?)', execution_id.hex,
+                datetime.utcnow(), datetime.utcnow(), 'docker', engine_id)
+        migrations.upgrade()
+        assert migrations.current_revision() == 'c3a8f5e1d2b4'
+
+        # existing executions are not taken for claims by the scheduler
+        assert {
+            execution_id: db.engine.execute(
+                'SELECT state FROM executions WHERE id = ?',
+                execution_id.hex).scalar()
+            for execution_id in legacy.values()
+        } == {
+            legacy['launched']: 'unavailable',
+            legacy[None]: 'exited',
+        }
+        db.engine.execute('DELETE FROM executions')
+
+        # existing labels are indexed
+        migrations.downgrade('8e3b7d1f6a92')
+        context_id = uuid.uuid4()
+        db.engine.execute(Context.__table__.insert().values(
+            id=context_id, spec={'labels': ['a=1', 'b']},
+            created=datetime.utcnow(), updated=datetime.utcnow()))
+        migrations.upgrade()
+        assert sorted((label.key, label.value)
+                      for label in ContextLabel.query.filter_by(
+                          context_id=context_id)) == [('a', '1'), ('b', '')]
+        db.session.remove()
+
+
+def test_metrics(app):
+    """Test the metrics endpoint."""
+    pytest.importorskip('prometheus_client')
+
+    with app.test_client() as client:
+        client.get('/')
+        res = client.get('/metrics')
+        assert res.status_code == 200
+        assert b'renga_deployer_request_seconds' in res.data
+        assert b'renga_deployer_executions' in res.data
+
+
+def test_tracing(app, auth_header, instance_path):
+    """Test that sampled requests export their spans."""
+    from renga_deployer.tracing import Tracing
+
+    output = os.path.join(instance_path, 'spans.json')
+    app.config.update(
+        DEPLOYER_TRACING_SAMPLE_RATE=0, DEPLOYER_TRACING_OUTPUT=output)
+    Tracing(app)
+
+    trace_id = '0af7651916cd43dd8448eb211c80319c'
+    parent_id = 'b7ad6b7169203331'
+
+    with app.test_client() as client:
+        resp = client.get('v1/contexts', headers=auth_header)
+        assert resp.status_code == 200
+        assert 'X-Trace-Id' not in resp.headers
+        assert not os.path.exists(output)
+
+        headers = dict(auth_header)
+        headers['traceparent'] = '00-{0}-{1}-01'.format(trace_id, parent_id)
+        resp = client.get('v1/contexts', headers=headers)
+        assert resp.status_code == 200
+        assert resp.headers['X-Trace-Id'] == trace_id
+
+    with open(output) as spans:
+        spans = {span['name']: span for span in map(json.loads, spans)}
+
+    root = spans['GET /v1/contexts']
+    assert root['traceId'] == trace_id
+    assert root['parentId'] == parent_id
+    assert root['tags']['http.status_code'] == '200'
+    handler, = (span for name, span in spans.items()
+                if name.startswith('handler '))
+    assert handler['parentId'] == root['id']
+    assert spans['check_token']['parentId'] == handler['id']
+    assert spans['db.query']['tags']['statement'] == 'SELECT'
+
+
+@pytest.mark.parametrize('mode', ['cprofile', 'sample'])
+def test_profiling(app, keypair, auth_data, instance_path, mode,
+                   monkeypatch):
+    """Test profiling of the next requests."""
+    from renga_deployer.profiling import Profiling, ProfilingSession
+
+    # requests must outlast a sampling interval to be sampled
+    stop_request = ProfilingSession.stop_request
+
+    def slow_stop_request(session, token):
+        time.sleep(5 * session.interval)
+        stop_request(session, token)
+
+    monkeypatch.setattr(ProfilingSession, 'stop_request', slow_stop_request)
+
+    private, public = keypair
+    app.config.update(
+        DEPLOYER_TOKEN_SCOPE_KEY='scope', DEPLOYER_PROFILING_DIR=instance_path)
+    Profiling(app)
+
+    def header(*scopes):
+        token = jwt.encode(
+            dict(auth_data, scope=list(scopes)), key=private,
+            algorithm='RS256')
+        return {'Authorization': 'Bearer {0}'.format(token)}
+
+    user = header('deployer:contexts_read')
+    admin = header('deployer:admin')
+
+    with app.test_client() as client:
+        # unverified tokens could claim any scope
+        resp = client.post(
+            '/admin/profiles', data=json.dumps({'requests': 1}),
+            content_type='application/json', headers=admin)
+        assert resp.status_code == 403
+
+        app.config['DEPLOYER_JWT_KEY'] = public
+        resp = client.post(
+            '/admin/profiles', data=json.dumps({'requests': 1}),
+            content_type='application/json', headers=user)
+        assert resp.status_code == 401
+
+        resp = client.post(
+            '/admin/profiles',
+            data=json.dumps({
+                'requests': 2,
+                'mode': mode,
+                'endpoints': ['/v1/contexts']
+            }),
+            content_type='application/json',
+            headers=admin)
+        assert resp.status_code == 201
+        session = json.loads(resp.data.decode())
+
+        url = '/admin/profiles/{0}'.format(session['identifier'])
+        assert client.get(url, headers=admin).status_code == 202
+
+        # only matching endpoints are profiled
+        client.get('/')
+        for _ in range(2):
+            assert client.get('v1/contexts', headers=user).status_code == 200
+
+        resp = client.get(url, headers=admin)
+        assert resp.status_code == 200
+        assert resp.data
+
+        ext = app.extensions['renga-deployer-profiling']
+        assert ext.session.finished
+        assert ext.session.profiled == 2
+
+        assert client.get(
+            '/admin/profiles/{0}'.format('0' * 32),
+            headers=admin).status_code == 404
+
+
+def test_asgi(app, auth_header, monkeypatch):
+    """Test the ASGI application with an asyncio engine."""
+    pytest.importorskip('asgiref')
+    pytest.importorskip('aiohttp')
+    import asyncio
+
+    from renga_deployer.asgi import ASGIApplication
+    from renga_deployer.async_engines import AsyncEngine
+
+    class FakeEngine(AsyncEngine):
+        async def get_logs(self, execution):
+            return 'Hello {0}\n'.format(execution.context.spec['image'])
+
+        async def follow_logs(self, execution):
+            for line in ('first\n', 'second\n'):
+                yield line
+
+    monkeypatch.setitem(ASGIApplication.ENGINES, 'fake', FakeEngine)
+    application = ASGIApplication(app)
+
+    context = Context.create(spec={'image': 'hello-world'})
+    execution = Execution.from_context(
+        context, engine='fake', engine_id='1234')
+    db.session.add(execution)
+    db.session.commit()
+
+    def request(path, query_string=b'', headers=()):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application({
+            'type': 'http',
+            'http_version': '1.1',
+            'method': 'GET',
+            'path': path,
+            'root_path': '',
+            'scheme': 'http',
+            'server': ('localhost', 80),
+            'query_string': query_string,
+            'headers': [(b'authorization',
+                         auth_header['Authorization'].encode())] +
+            list(headers),
+        }, receive, send))
+        return messages[0]['status'], b''.join(
+            message.get('body', b'') for message in messages[1:])
+
+    logs = '/v1/contexts/{0}/executions/{1}/logs'.format(
+        context.id, execution.id)
+
+    # requests outside the logs are handled by the WSGI application
+    status, body = request('/v1/contexts/{0}'.format(context.id))
+    assert status == 200
+    assert json.loads(body.decode())['identifier'] == str(context.id)
+
+    assert request(logs) == (200, b'Hello hello-world\n')
+    assert request(logs, b'follow=true') == (200, b'first\nsecond\n')
+
+    # followed logs are compressed chunk by chunk
+    status, body = request(logs, b'follow=true',
+                           [(b'accept-encoding', b'gzip')])
+    assert gzip.decompress(body) == b'first\nsecond\n'
+
+    status, body = request(logs.replace(str(execution.id), '0'))
+    assert status == 400
+    assert json.loads(body.decode())['status'] == 400
+
+    # the logs are authorized like the WSGI handler
+    app.config['DEPLOYER_TOKEN_SCOPE_KEY'] = 'scope'
+    assert request(logs) == (200, b'Hello hello-world\n')
+
+
 def test_token_check(app, auth_header):
     """Test that token exists in header."""
     with app.test_client() as client:
@@ -230,7 +542,36 @@ def test_context_get(app, auth_header):
         resp = client.get('v1/contexts/0', headers=auth_header)
         assert resp.status_code == 400
 
-        # 3. we fail if the decorator is incorrectly configured
+        # 3. we fail with bad request if resources are malformed
+        for limits in ({'memory': 'lots'}, {'cpu': 'inf'}):
+            resp = client.post(
+                'v1/contexts',
+                data=json.dumps({
+                    'image': 'hello-world',
+                    'resources': {
+                        'limits': limits
+                    }
+                }),
+                content_type='application/json',
+                headers=auth_header)
+            assert resp.status_code == 400
+
+        # resources unknown to the deployer are left to the engines
+        resp = client.post(
+            'v1/contexts',
+            data=json.dumps({
+                'image': 'hello-world',
+                'resources': {
+                    'limits': {
+                        'nvidia.com/gpu': 1
+                    }
+                }
+            }),
+            content_type='application/json',
+            headers=auth_header)
+        assert resp.status_code == 201
+
+        # 4. we fail if the decorator is incorrectly configured
         from renga_deployer.utils import validate_uuid_args
 
         with pytest.raises(TypeError):
@@ -242,6 +583,700 @@ def test_context_get(app, auth_header):
             testfunc('val')
 
 
+def test_label_filter(app, auth_header):
+    """Test listing contexts and executions by labels."""
+    labels = {
+        'web': ['app=web', 'tier=frontend', 'gpu'],
+        'api': ['app=api', 'tier=backend'],
+        'job': ['app=job', 'tier=backend', 'gpu'],
+    }
+
+    with app.test_client() as client:
+        contexts = {}
+        for name, context_labels in labels.items():
+            resp = client.post(
+                'v1/contexts',
+                data=json.dumps({
+                    'image': 'hello-world',
+                    'labels': context_labels
+                }),
+                content_type='application/json',
+                headers=auth_header)
+            contexts[name] = json.loads(resp.data.decode())['identifier']
+
+        def search(path, *selectors):
+            resp = client.get(
+                path,
+                query_string=[('label', selector) for selector in selectors],
+                headers=auth_header)
+            assert resp.status_code == 200
+            return json.loads(resp.data.decode())
+
+        def names(*selectors):
+            found = {
+                context['identifier']
+                for context in search('v1/contexts', *selectors)['contexts']
+            }
+            return {name for name, cid in contexts.items() if cid in found}
+
+        assert names() == set(labels)
+        assert names('app=web') == {'web'}
+        assert names('tier==backend', 'gpu') == {'job'}
+        assert names('tier!=backend') == {'web'}
+        assert names('app in (web, api)') == {'web', 'api'}
+        assert names('app notin (web,api)', '!missing') == {'job'}
+        assert names('!gpu') == {'api'}
+
+        # updating the specification updates the index
+        context = Context.query.get(contexts['api'])
+        context.spec = dict(context.spec, labels=['app=api', 'gpu'])
+        db.session.commit()
+        assert names('gpu') == {'web', 'api', 'job'}
+        assert names('tier') == {'web', 'job'}
+
+        for name in ('web', 'job'):
+            db.session.add(
+                Execution(
+                    id=uuid.uuid4(), context_id=contexts[name],
+                    engine='docker'))
+        db.session.commit()
+        executions = search('v1/executions', 'tier=backend')['executions']
+        assert [execution['context_id'] for execution in executions] == [
+            contexts['job']
+        ]
+        assert len(search('v1/executions')['executions']) == 2
+
+        resp = client.get(
+            'v1/contexts', query_string={'label': 'app in web'},
+            headers=auth_header)
+        assert resp.status_code == 400
+
+
+def test_conditional_get(app, auth_header, fake_engine):
+    """Test ETags and If-None-Match on contexts and executions."""
+    from renga_deployer.models import ExecutionStates
+
+    calls = fake_engine.calls['get_states']
+
+    with app.test_client() as client:
+
+        def get(url, etag=None):
+            headers = dict(auth_header)
+            if etag:
+                headers['If-None-Match'] = etag
+            return client.get(url, headers=headers)
+
+        context = json.loads(
+            client.post(
+                'v1/contexts',
+                data=json.dumps({'image': 'hello-world'}),
+                content_type='application/json',
+                headers=auth_header).data.decode())
+        context_url = 'v1/contexts/{0}'.format(context['identifier'])
+
+        for url in ('v1/contexts', context_url):
+            resp = get(url)
+            assert resp.status_code == 200
+            etag = resp.headers['ETag']
+
+            resp = get(url, etag)
+            assert resp.status_code == 304
+            assert resp.headers['ETag'] == etag
+            assert resp.data == b''
+
+        # changing the context changes its tag
+        stored = Context.query.get(context['identifier'])
+        stored.spec = dict(stored.spec, labels=['changed'])
+        db.session.commit()
+        assert get(context_url, etag).status_code == 200
+
+        execution = Execution.from_context(
+            stored, engine='fake', engine_id='1234')
+        db.session.add(execution)
+        db.session.commit()
+        execution_url = '{0}/executions/{1}'.format(context_url, execution.id)
+
+        for url in (context_url + '/executions', execution_url):
+            etag = get(url).headers['ETag']
+            assert get(url, etag).status_code == 304
+
+        # an exit reported by the engine changes the tag
+        fake_engine.state = ExecutionStates.EXITED
+        del calls[:]
+        resp = get(execution_url, etag)
+        assert resp.status_code == 200
+        assert calls == [[execution.id]]
+        assert json.loads(resp.data.decode())['state'] == 'exited'
+        assert resp.headers['ETag'] != etag
+
+        # exited executions are not asked again
+        del calls[:]
+        assert get(execution_url, resp.headers['ETag']).status_code == 304
+        assert calls == []
+
+        # cached representations are tagged by the stored state only
+        url = execution_url + '?state=cached'
+        assert get(url, get(url).headers['ETag']).status_code == 304
+
+
+def test_wait_for_state(app, auth_header, fake_engine):
+    """Test waiting for an execution to reach a state."""
+    import threading
+
+    from renga_deployer.models import ExecutionStates
+
+    fake_engine.state = ExecutionStates.UNAVAILABLE
+    app.extensions['renga-deployer-watcher'].interval = 0.05
+
+    context = current_deployer.deployer.create({'image': 'hello-world'})
+    execution = Execution.from_context(
+        context, engine='fake', engine_id='1234')
+    db.session.add(execution)
+    db.session.commit()
+    url = 'v1/contexts/{0}/executions/{1}'.format(context.id, execution.id)
+
+    with app.test_client() as client:
+        start = time.time()
+        resp = client.get(
+            url + '?wait_for=running&timeout=0.2', headers=auth_header)
+        assert resp.status_code == 200
+        assert json.loads(resp.data.decode())['state'] == 'unavailable'
+        assert time.time() - start >= 0.2
+
+        def start_execution():
+            time.sleep(0.2)
+            fake_engine.state = ExecutionStates.RUNNING
+
+        threading.Thread(target=start_execution).start()
+        start = time.time()
+        resp = client.get(
+            url + '?wait_for=running&timeout=10', headers=auth_header)
+        assert json.loads(resp.data.decode())['state'] == 'running'
+        assert time.time() - start < 5
+
+        resp = client.get(
+            url + '?wait_for=running&timeout=600', headers=auth_header)
+        assert resp.status_code == 400
+
+
+def test_event_stream(app, auth_header, fake_engine):
+    """Test streaming and resuming execution events."""
+    from renga_deployer.models import ExecutionStates
+
+    fake_engine.state = ExecutionStates.UNAVAILABLE
+    polled = fake_engine.calls['get_states']
+    app.extensions['renga-deployer-watcher'].interval = 0.05
+    app.extensions['renga-deployer-events'].keepalive = 0.05
+
+    def read(resp, count):
+        """Read a number of events from a stream."""
+        events, chunks = [], iter(resp.response)
+        deadline = time.time() + 5
+        while len(events) < count and time.time() < deadline:
+            chunk = next(chunks)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            # a chunk holds the events queued at once
+            for message in chunk.strip().split('\n\n'):
+                if not message.startswith(':'):
+                    fields = dict(
+                        line.split(': ', 1) for line in message.split('\n'))
+                    fields['data'] = json.loads(fields['data'])
+                    events.append(fields)
+        return events
+
+    with app.test_client() as client:
+        context = current_deployer.deployer.create({'image': 'hello-world'})
+        other = current_deployer.deployer.create({'image': 'hello-world'})
+        stream = client.get(
+            'v1/events?context_id={0}'.format(context.id),
+            headers=auth_header, buffered=False)
+        assert stream.status_code == 200
+        assert stream.mimetype == 'text/event-stream'
+
+        for launched in (other, context):
+            resp = client.post(
+                'v1/contexts/{0}/executions'.format(launched.id),
+                data=json.dumps({'engine': 'fake'}),
+                content_type='application/json',
+                headers=auth_header)
+            assert resp.status_code == 201
+            if launched is other:
+                other_id = json.loads(resp.data.decode())['identifier']
+        execution_id = json.loads(resp.data.decode())['identifier']
+
+        # the response of the launch reads the first state
+        events = read(stream, 3)
+        assert [event['event'] for event in events] == [
+            'created', 'launched', 'unavailable'
+        ]
+        assert events[0]['data']['execution_id'] == execution_id
+        assert events[0]['data']['context_id'] == str(context.id)
+
+        # the state watcher reports the engine state
+        fake_engine.state = ExecutionStates.RUNNING
+        assert read(stream, 1)[0]['event'] == 'running'
+        # only the executions of the subscribed context are polled
+        del polled[:]
+        time.sleep(0.3)
+        assert polled
+        assert uuid.UUID(other_id) not in set().union(*polled)
+
+        resp = client.delete(
+            'v1/contexts/{0}/executions/{1}'.format(context.id, execution_id),
+            headers=auth_header)
+        assert [event['event'] for event in read(stream, 2)] == [
+            'stopped', 'exited'
+        ]
+
+        # executions of other processes are read from the database
+        now = datetime.utcnow()
+        db.engine.execute(Execution.__table__.insert().values(
+            id=uuid.uuid4(), context_id=context.id, engine='fake',
+            engine_id='remote', state='exited', created=now, updated=now))
+        assert [event['event'] for event in read(stream, 3)] == [
+            'created', 'launched', 'exited'
+        ]
+        stream.close()
+
+        # resume after the launch
+        headers = dict(auth_header)
+        headers['Last-Event-ID'] = events[2]['id']
+        stream = client.get(
+            'v1/events?execution_id={0}'.format(execution_id),
+            headers=headers, buffered=False)
+        assert [event['event'] for event in read(stream, 3)] == [
+            'running', 'stopped', 'exited'
+        ]
+        stream.close()
+
+        assert client.get(
+            'v1/events?context_id=foo', headers=auth_header).status_code == 400
+
+
+def test_parked_limit(app, auth_header, fake_engine):
+    """Test that waiting requests and streams are limited per process."""
+    from renga_deployer.models import ExecutionStates
+
+    fake_engine.state = ExecutionStates.UNAVAILABLE
+    app.config['DEPLOYER_MAX_PARKED_REQUESTS'] = 1
+    app.extensions['renga-deployer-events'].keepalive = 0.05
+
+    with app.test_client() as client:
+        context = current_deployer.deployer.create({'image': 'hello-world'})
+        execution = Execution.from_context(
+            context, engine='fake', engine_id='fake')
+        db.session.add(execution)
+        db.session.commit()
+        url = 'v1/contexts/{0}/executions/{1}?wait_for=running'.format(
+            context.id, execution.id)
+
+        stream = client.get('v1/events', headers=auth_header, buffered=False)
+        assert stream.status_code == 200
+
+        refused = client.get('v1/events', headers=auth_header)
+        assert refused.status_code == 503
+        assert refused.headers['Retry-After'] == '5'
+        assert client.get(url, headers=auth_header).status_code == 503
+
+        # closed streams free their slot
+        stream.close()
+        stream = client.get('v1/events', headers=auth_header, buffered=False)
+        assert stream.status_code == 200
+        stream.close()
+        assert client.get(
+            url + '&timeout=0', headers=auth_header).status_code == 200
+
+
+def test_sparse_fields(app, auth_header, fake_engine):
+    """Test selecting fields and the source of execution states."""
+    calls = fake_engine.calls['get_states']
+
+    with app.test_client() as client:
+
+        def get(url):
+            resp = client.get(url, headers=auth_header)
+            return resp.status_code, json.loads(resp.data.decode())
+
+        context = current_deployer.deployer.create({'image': 'hello-world'})
+        execution = current_deployer.deployer.launch(context, engine='fake')
+        del calls[:]
+
+        url = 'v1/contexts/{0}/executions'.format(context.id)
+        status, data = get(url + '?fields=identifier')
+        assert data == {'executions': [{'identifier': str(execution.id)}]}
+        status, data = get(url + '?fields=identifier,state&state=none')
+        assert data == {'executions': [{'identifier': str(execution.id)}]}
+        status, data = get('v1/executions?fields=state&state=cached')
+        assert data == {'executions': [{'state': None}]}
+        assert calls == []
+
+        status, data = get('{0}/{1}?fields=state'.format(url, execution.id))
+        assert data == {'state': 'running'}
+        assert calls
+
+        status, data = get('v1/contexts?fields=identifier')
+        assert data == {'contexts': [{'identifier': str(context.id)}]}
+        status, data = get('v1/contexts/{0}?fields=spec'.format(context.id))
+        assert data == {'spec': {'image': 'hello-world'}}
+
+        assert get(url + '?fields=foo')[0] == 400
+        assert get(url + '?state=foo')[0] == 400
+
+        # sparse representations have their own entity tags
+        assert client.get(url, headers=auth_header).headers['ETag'] != \
+            client.get(url + '?fields=identifier',
+                       headers=auth_header).headers['ETag']
+
+
+def test_batch_get(app, auth_header, fake_engine):
+    """Test fetching many contexts and executions at once."""
+    batches = fake_engine.calls['get_states']
+
+    with app.test_client() as client:
+
+        def post(url, ids, query=''):
+            resp = client.post(
+                url + query,
+                data=json.dumps({'ids': ids}),
+                content_type='application/json',
+                headers=auth_header)
+            return resp.status_code, json.loads(resp.data.decode())
+
+        contexts = [
+            current_deployer.deployer.create({'image': 'hello-world'})
+            for _ in range(2)
+        ]
+        executions = [
+            current_deployer.deployer.launch(context, engine='fake')
+            for context in contexts
+        ]
+        missing = str(uuid.uuid4())
+
+        ids = [str(context.id) for context in reversed(contexts)]
+        status, data = post(
+            'v1/contexts/batch', ids + [missing, ids[0]], '?fields=identifier')
+        assert status == 200
+        assert data == {
+            'contexts': [{'identifier': id} for id in ids],
+            'not_found': [missing],
+        }
+
+        ids = [str(execution.id) for execution in executions]
+        status, data = post('v1/executions/batch', [missing] + ids)
+        assert [execution['identifier']
+                for execution in data['executions']] == ids
+        assert {execution['state'] for execution in data['executions']} == {
+            'running'
+        }
+        assert data['not_found'] == [missing]
+        assert [len(batch) for batch in batches] == [2]
+
+        status, data = post('v1/executions/batch', ids, '?state=cached')
+        assert len(batches) == 1
+
+        assert post('v1/executions/batch', ['foo'])[0] == 400
+        assert post('v1/executions/batch', [])[0] == 400
+        assert post('v1/contexts/batch', [missing] * 101)[0] == 400
+
+
+def test_ndjson_export_import(app, auth_header, instance_path):
+    """Test streaming listings and moving the history between databases."""
+    from click.testing import CliRunner
+    from flask.cli import ScriptInfo
+
+    from renga_deployer.cli import deployer
+
+    contexts = [
+        current_deployer.deployer.create({
+            'image': 'hello-world',
+            'labels': ['team=a']
+        }) for _ in range(3)
+    ]
+    for context in contexts:
+        execution = Execution.from_context(context, engine='docker')
+        execution.state = 'exited'
+        db.session.add(execution)
+    db.session.add(Webhook(url='http://ci.example.com/hook', secret='secret',
+                           context=contexts[0]))
+    db.session.commit()
+
+    # a preserved request context would outlive the streamed response
+    client = app.test_client()
+    headers = dict(auth_header, Accept='application/x-ndjson')
+    resp = client.get('v1/executions?fields=identifier,state', headers=headers)
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = resp.data.decode().splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[0])['state'] == 'exited'
+
+    resp = client.get('v1/contexts?label=team%3Da', headers=headers)
+    assert len(resp.data.decode().splitlines()) == 3
+
+    runner = CliRunner()
+    info = ScriptInfo(create_app=lambda info: app)
+    path = os.path.join(instance_path, 'history.ndjson')
+    result = runner.invoke(deployer, ['export', path], obj=info)
+    assert result.exit_code == 0
+
+    exported = {
+        (row['table'], row['row']['id']): row['row']
+        for row in map(json.loads, open(path))
+    }
+    assert len(exported) == 7
+
+    Webhook.query.delete()
+    Execution.query.delete()
+    ContextLabel.query.delete()
+    Context.query.delete()
+    db.session.commit()
+
+    result = runner.invoke(deployer, ['import', path], obj=info)
+    assert result.exit_code == 0
+    assert result.output == \
+        'contexts=3, executions=3, webhooks=1, skipped=0\n'
+
+    result = runner.invoke(deployer, ['export', '-'], obj=info)
+    assert {
+        (row['table'], row['row']['id']): row['row']
+        for row in map(json.loads, result.output.splitlines())
+    } == exported
+    assert Context.query.filter(
+        Context.label_filter(['team=a'])).count() == 3
+
+    # existing rows are skipped
+    result = runner.invoke(deployer, ['import', path], obj=info)
+    assert result.output == \
+        'contexts=0, executions=0, webhooks=0, skipped=7\n'
+
+
+def test_compression(app, auth_header):
+    """Test compressing large responses and streams."""
+    from renga_deployer.compression import ENCODINGS, compress_chunks
+
+    for _ in range(20):
+        current_deployer.deployer.create({'image': 'hello-world'})
+
+    client = app.test_client()
+    headers = dict(auth_header, **{'Accept-Encoding': 'gzip'})
+    resp = client.get('v1/contexts', headers=headers)
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert len(json.loads(gzip.decompress(resp.data).decode())[
+        'contexts']) == 20
+
+    # compressed representations have weak tags matching both encodings
+    etag = resp.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get('v1/contexts', headers=dict(
+        headers, **{'If-None-Match': etag})).status_code == 304
+
+    resp = client.get('v1/contexts', headers=dict(
+        auth_header, **{'Accept-Encoding': 'deflate;q=0.5, gzip;q=0'}))
+    assert json.loads(zlib.decompress(resp.data).decode())['contexts']
+
+    # small responses are sent unchanged
+    resp = client.get('v1/contexts?fields=identifier&label=foo',
+                      headers=headers)
+    assert 'Content-Encoding' not in resp.headers
+    assert json.loads(resp.data.decode()) == {'contexts': []}
+
+    resp = client.get('v1/contexts', headers=auth_header)
+    assert 'Content-Encoding' not in resp.headers
+
+    resp = client.get('v1/contexts', headers=dict(
+        headers, Accept='application/x-ndjson'))
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(resp.data).decode().splitlines()) == 20
+
+    # streams are flushed past a size, and event streams after events
+    def received(chunks, **kwargs):
+        """Return what can be decompressed after each compressed chunk."""
+        stream = zlib.decompressobj(ENCODINGS['gzip'])
+        return [
+            stream.decompress(data) for data in compress_chunks(
+                chunks, 'gzip', 6, **kwargs)
+        ]
+
+    assert list(filter(None, received(['{}\n'] * 5, flush_size=6))) == [
+        b'{}\n{}\n', b'{}\n{}\n', b'{}\n'
+    ]
+    assert list(filter(None, received(
+        ['id: 1\n', 'data: {}\n\n', 'id: 2\n'], boundary=b'\n\n'))) == [
+            b'id: 1\ndata: {}\n\n', b'id: 2\n'
+        ]
+
+
+def test_context_deduplication(app, auth_header, keypair, auth_data):
+    """Test returning the existing context of the same specification."""
+    from sqlalchemy import event
+
+    app.config['DEPLOYER_DEDUPLICATE_CONTEXTS'] = True
+
+    with app.test_client() as client:
+
+        def post(spec, headers=auth_header):
+            resp = client.post(
+                'v1/contexts',
+                data=json.dumps(spec),
+                content_type='application/json',
+                headers=headers)
+            return resp.status_code, json.loads(resp.data.decode())
+
+        status, first = post({'image': 'hello-world', 'ports': ['80', '']})
+        assert status == 201
+        status, second = post({'ports': ['80'], 'image': 'hello-world'})
+        assert status == 200
+        assert second['identifier'] == first['identifier']
+
+        status, other = post({'image': 'hello-world'})
+        assert status == 201
+        assert other['identifier'] != first['identifier']
+
+        # the same specification of another creator is a new context
+        private_key, _ = keypair
+        token = jwt.encode(
+            dict(auth_data, sub='someone-else'), private_key,
+            algorithm='RS256')
+        status, foreign = post({'image': 'hello-world', 'ports': ['80']},
+                               headers={'Authorization': 'Bearer ' + token})
+        assert status == 201
+        assert foreign['identifier'] != first['identifier']
+
+        # a context created concurrently is returned
+        spec = {'image': 'alpine'}
+        concurrent = []
+
+        def race(session, flush_context, instances):
+            if concurrent:
+                return
+            context = Context.create(spec=dict(spec), deduplicate=True)
+            db.engine.execute(Context.__table__.insert().values(
+                id=context.id, spec=context.spec, creator=context.creator,
+                spec_hash=context.spec_hash, created=datetime.utcnow(),
+                updated=datetime.utcnow()))
+            concurrent.append(str(context.id))
+
+        event.listen(db.session, 'before_flush', race)
+        try:
+            status, raced = post(spec)
+        finally:
+            event.remove(db.session, 'before_flush', race)
+        assert status == 200
+        assert [raced['identifier']] == concurrent
+        assert Context.query.filter(
+            Context.spec_hash.isnot(None)).count() == 4
+
+    app.config['DEPLOYER_DEDUPLICATE_CONTEXTS'] = False
+    assert current_deployer.deployer.create(
+        {'image': 'alpine'}).spec_hash is None
+
+
+def test_webhooks(app, auth_header, fake_engine, monkeypatch):
+    """Test signed, batched and retried webhook deliveries."""
+    import requests
+
+    from renga_deployer.models import ExecutionStates
+    from renga_deployer.webhooks import event_id, sign
+
+    deliveries = []
+
+    def post(url, data=None, headers=None, timeout=None):
+        deliveries.append((url, data, headers))
+        if len(deliveries) == 1:
+            raise requests.ConnectionError('receiver is down')
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    dispatcher = app.extensions['renga-deployer-webhooks']
+    monkeypatch.setattr(dispatcher.session, 'post', post)
+    monkeypatch.setattr(dispatcher, 'backoff', 0.05)
+    monkeypatch.setattr(dispatcher, 'batch_delay', 0.2)
+    app.extensions['renga-deployer-watcher'].interval = 0.05
+
+    def events(count):
+        """Return the events of successful deliveries."""
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            received = [
+                event for _, data, _ in deliveries[1:]
+                for event in json.loads(data.decode())['events']
+            ]
+            if len(received) >= count:
+                return received
+            time.sleep(0.05)
+        return received
+
+    with app.test_client() as client:
+        context = current_deployer.deployer.create({'image': 'hello-world'})
+        url = 'v1/contexts/{0}/webhooks'.format(context.id)
+        resp = client.post(
+            url, data=json.dumps({'url': 'not a url'}),
+            content_type='application/json', headers=auth_header)
+        assert resp.status_code == 400
+
+        resp = client.post(
+            url,
+            data=json.dumps({
+                'url': 'http://ci.example.com/hook',
+                'secret': 'secret'
+            }),
+            content_type='application/json',
+            headers=auth_header)
+        assert resp.status_code == 201
+        webhook = json.loads(resp.data.decode())
+        assert webhook['context_id'] == str(context.id)
+        assert 'secret' not in webhook
+
+        resp = client.post(
+            'v1/contexts/{0}/executions'.format(context.id),
+            data=json.dumps({'engine': 'fake'}),
+            content_type='application/json',
+            headers=auth_header)
+        execution_id = json.loads(resp.data.decode())['identifier']
+
+        # the launch and its first state are batched and retried
+        received = events(2)
+        assert [event['event'] for event in received] == [
+            'launched', 'running'
+        ]
+        assert deliveries[0][1] == deliveries[1][1]
+        assert received[0]['execution_id'] == execution_id
+        url, data, headers = deliveries[1]
+        assert url == 'http://ci.example.com/hook'
+        assert headers['X-Renga-Deployer-Signature'] == sign('secret', data)
+
+        # the state watcher notices the exit
+        fake_engine.state = ExecutionStates.EXITED
+        exited, = events(3)[2:]
+        assert exited['event'] == 'exited'
+
+        # every process noticing the exit sends the same identifier
+        assert exited['id'] == event_id(
+            uuid.UUID(execution_id), 'running', 'exited')
+
+        resp = client.get(
+            'v1/contexts/{0}/webhooks'.format(context.id),
+            headers=auth_header)
+        assert [hook['identifier'] for hook in json.loads(
+            resp.data.decode())['webhooks']] == [webhook['identifier']]
+
+        # webhooks are only found through their context
+        other = current_deployer.deployer.create({'image': 'hello-world'})
+        url = 'v1/contexts/{0}/webhooks/{1}'.format(
+            context.id, webhook['identifier'])
+        other_url = 'v1/contexts/{0}/webhooks/{1}'.format(
+            other.id, webhook['identifier'])
+        assert client.get(url, headers=auth_header).status_code == 200
+        assert client.get(other_url, headers=auth_header).status_code == 404
+        assert client.delete(
+            other_url, headers=auth_header).status_code == 404
+
+        resp = client.delete(url, headers=auth_header)
+        assert resp.status_code == 200
+        assert client.get(url, headers=auth_header).status_code == 404
+
+
 @pytest.mark.parametrize('engine', ['docker', 'k8s'])
 def test_extended_spec(app, engine, no_auth_connexion, auth_data, auth_header):
     """Test extra spec options."""
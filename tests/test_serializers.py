@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2017 - Swiss Data Science Center (SDSC)
+# A partnership between École Polytechnique Fédérale de Lausanne (EPFL) and
+# Eidgenössische Technische Hochschule Zürich (ETHZ).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Serializer tests."""
+
+from datetime import datetime, timedelta, timezone
+from itertools import product
+
+import pytest
+from marshmallow import Schema, fields
+
+from renga_deployer.dumper import Dumper, dumper
+from renga_deployer.models import Context, Execution, ExecutionStates, db
+from renga_deployer.serializers import ContextSchema, ExecutionSchema, \
+    WebhookSchema, sparse_schema
+
+SPECS = [
+    {'image': 'hello-world'},
+    {
+        'image': 'alpine',
+        'ports': ['9999', None],
+        'labels': ['a=b', 'c'],
+        'env': [{'name': 'A', 'value': '1'}],
+        'resources': {'limits': {'cpu': '1'}},
+        'unknown': 'dropped',
+    },
+    {'image': None, 'labels': None},
+    {},
+    None,
+]
+
+
+@pytest.fixture()
+def objects(app):
+    """Contexts and executions in all states."""
+    contexts = [Context.create(spec=spec or {}) for spec in SPECS]
+    contexts[-1].spec = None
+    db.session.add_all(contexts)
+
+    executions = [
+        Execution.from_context(contexts[0], engine='docker'),
+        Execution.from_context(
+            contexts[1], engine='docker', state=ExecutionStates.EXITED.value,
+            namespace=None),
+        Execution.from_context(
+            contexts[1], engine='k8s', state=ExecutionStates.QUEUED.value),
+    ]
+    executions[1].environment = None
+    db.session.add_all(executions)
+    db.session.commit()
+    return contexts, executions
+
+
+FIELDS = [
+    None, ['identifier'], ['identifier', 'created'], ['state', 'spec'],
+    ['queue_position', 'expected_wait', 'environment'],
+]
+
+
+@pytest.mark.parametrize('schema_class', [ContextSchema, ExecutionSchema])
+@pytest.mark.parametrize('many', [True, False])
+def test_dumper_parity(objects, schema_class, many):
+    """Test that dumpers return the same data as marshmallow."""
+    contexts, executions = objects
+    items = contexts if schema_class is ContextSchema else executions
+
+    for names, state in product(FIELDS, ['live', 'cached', 'none']):
+        schema = sparse_schema(
+            schema_class, many=many, state=state, fields=[
+                name for name in names or ()
+                if name in schema_class._declared_fields
+            ])
+        for obj in [items] if many else items:
+            assert dumper(schema).dump(obj) == schema.dump(obj).data
+
+
+def test_dumper_values():
+    """Test the conversion of field values."""
+
+    class ValueSchema(Schema):
+        text = fields.String()
+        number = fields.Integer(attribute='count')
+        ratio = fields.Float(dump_to='fraction')
+        when = fields.DateTime()
+        tags = fields.List(fields.String)
+        default = fields.String(default='value')
+        secret = fields.String(load_only=True)
+        webhook = fields.Nested(WebhookSchema)
+
+    naive = datetime(2017, 10, 20, 12, 30)
+    values = [
+        {'text': 3, 'count': '4', 'ratio': 1, 'when': naive,
+         'tags': ['a', 1, None], 'secret': 'x'},
+        {'text': None, 'count': None, 'when': naive.replace(
+            tzinfo=timezone(timedelta(hours=2))), 'tags': 'single',
+         'default': None, 'webhook': {'url': 'http://example.com'}},
+        {},
+    ]
+    schema = ValueSchema(many=True)
+    assert Dumper(schema).dump(values) == schema.dump(values).data
+
+
+def test_dumper_unsupported_fields():
+    """Test that fields without a converter are refused."""
+
+    class MethodSchema(Schema):
+        value = fields.Method('get_value')
+
+    with pytest.raises(TypeError):
+        Dumper(MethodSchema())